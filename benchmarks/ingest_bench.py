@@ -0,0 +1,110 @@
+"""
+Measures the ingest rate of a server and the latency of RFWs while rows are appended continuously.
+
+A server accepting ingest requests is started in a temporary directory holding a synthetic database. RFW
+latency is measured first without writers, then while writers append rows to the source being read.
+
+Run from the repository root: python -m benchmarks.ingest_bench [--seconds N] [--writers N]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.transport_bench import create_database, drain, ROOT, SOURCE
+from workload_client.rfw_tcp_client import RfwTcpClient
+from workload_client.ingest_client import ingest_rows
+
+PORT = 9986
+
+
+def generate_rows(deadline: float):
+    while time.perf_counter() < deadline:
+        yield random.randrange(100), random.randrange(1 << 20), random.randrange(1 << 20), random.random()
+
+
+async def read(queue: asyncio.Queue, protocol: str, batch_unit: int, rows: int, deadline: float) -> list:
+    """Runs single batch RFWs at random offsets, at least one, until the deadline, returning their latencies"""
+    latencies = []
+    while not latencies or time.perf_counter() < deadline:
+        client = RfwTcpClient(queue=queue, rfw_id=random.getrandbits(32), protocol=protocol, bench_type=SOURCE,
+                              metrics=15, batch_unit=batch_unit, batch_id=random.randrange(rows // batch_unit),
+                              batch_size=1, host="127.0.0.1", port=PORT)
+        start = time.perf_counter()
+        if not await client.run():
+            raise RuntimeError("RFW failed")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run(args, writers: int) -> tuple:
+    queue = asyncio.Queue()
+    consumer = asyncio.create_task(drain(queue))
+    deadline = time.perf_counter() + args.seconds
+    ingests = [asyncio.create_task(ingest_rows("127.0.0.1", PORT, args.protocol, SOURCE, generate_rows(deadline),
+                                               batch_rows=args.batch_rows))
+               for _ in range(writers)]
+    readers = [asyncio.create_task(read(queue, args.protocol, args.batch_unit, args.rows, deadline))
+               for _ in range(args.readers)]
+    latencies = [latency for result in await asyncio.gather(*readers) for latency in result]
+    appended = sum(result[0] for result in await asyncio.gather(*ingests) if result is not None)
+    await queue.join()
+    consumer.cancel()
+    return latencies, appended
+
+
+def wait_listening(port: int) -> None:
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+
+
+def report(label: str, latencies: list, appended: int, seconds: float) -> None:
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{label:>12}: {appended / seconds:>10.0f} rows/s ingested, {len(latencies):>6} RFWs, "
+          f"p50 {statistics.median(latencies) * 1000:7.2f} ms, p99 {p99 * 1000:7.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch-unit", type=int, default=1_000)
+    parser.add_argument("--batch-rows", type=int, default=5_000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--protocol", choices=["JSON", "BUFF"], default="BUFF")
+    args = parser.parse_args()
+    # Configured before the clients do, so their per batch messages are not printed
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as folder:
+        create_database(folder, args.rows)
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, "wl_server.py"), "--skipdb", "-l",
+                                   "-p", str(PORT), "--ingest"],
+                                  cwd=folder, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_listening(PORT)
+            # The first RFW waits for the server to finish loading the statistics of the dataset
+            asyncio.run(run(argparse.Namespace(**{**vars(args), "seconds": 0.0, "readers": 1}), 0))
+            (latencies, appended) = asyncio.run(run(args, 0))
+            report("idle", latencies, appended, args.seconds)
+            (latencies, appended) = asyncio.run(run(args, args.writers))
+            report(f"{args.writers} writers", latencies, appended, args.seconds)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
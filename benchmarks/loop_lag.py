@@ -0,0 +1,86 @@
+"""
+Measures the event loop lag caused by serializing and decoding RFDs inline, compared to offloading the
+large ones to a process pool, under a mix of small and large synthetic batches.
+
+Run from the repository root: python -m benchmarks.loop_lag [--workers N] [--batches N] [--offload-rows N]
+"""
+import argparse
+import asyncio
+import random
+import time
+from workload_server import codec as server_codec
+from workload_client import codec as client_codec
+
+KEYS = ["cpu", "net_in", "net_out", "memory"]
+BATCH_ROWS = [100, 1_000, 10_000, 100_000]
+TICK = 0.001
+
+
+def synthetic_rows(count: int):
+    return [(random.randrange(100), random.randrange(1 << 20), random.randrange(1 << 20), random.random())
+            for _ in range(count)]
+
+
+async def sample_lag(lags: list, stop: asyncio.Event) -> None:
+    """Sleeps TICK seconds in a loop and records how late each wake up is"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + TICK
+        await asyncio.sleep(TICK)
+        lags.append(loop.time() - expected)
+
+
+async def round_trip(protocol: str, rows: list) -> int:
+    payload = await server_codec.serialize(protocol, KEYS, rows)
+    (_, data) = await client_codec.decode_rfd(protocol, payload, "list")
+    return len(data)
+
+
+async def run(fixtures: list, concurrency: int) -> tuple:
+    lags = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_lag(lags, stop))
+    start = time.perf_counter()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(protocol, rows):
+        async with slots:
+            return await round_trip(protocol, rows)
+
+    rows = sum(await asyncio.gather(*(one(protocol, rows) for (protocol, rows) in fixtures)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await sampler
+    return rows, elapsed, sorted(lags)
+
+
+def report(label: str, rows: int, elapsed: float, lags: list) -> None:
+    print(f"{label:>9}: {rows / elapsed:>10.0f} rows/s, loop lag "
+          f"p50 {lags[len(lags) // 2] * 1000:7.2f} ms, "
+          f"p99 {lags[int(len(lags) * 0.99)] * 1000:7.2f} ms, "
+          f"max {lags[-1] * 1000:7.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batches", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--offload-rows", type=int, default=server_codec.OFFLOAD_ROWS)
+    parser.add_argument("--offload-bytes", type=int, default=client_codec.OFFLOAD_BYTES)
+    args = parser.parse_args()
+
+    random.seed(0)
+    fixtures = [(random.choice(["JSON", "BUFF"]), synthetic_rows(random.choice(BATCH_ROWS)))
+                for _ in range(args.batches)]
+
+    for (label, workers) in (("inline", 0), ("offloaded", args.workers)):
+        server_codec.configure(workers, args.offload_rows)
+        client_codec.configure(workers, args.offload_bytes)
+        report(label, *asyncio.run(run(fixtures, args.concurrency)))
+    server_codec.configure(0)
+    client_codec.configure(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Micro-benchmarks of each encoding path on synthetic batches, compared to the baselines stored in the repository.
+
+Measures the JSON and protobuf RFD encoders of the server, the RFD decoders of the client, the CSV formatting of
+AsyncFilewriter and the packing and unpacking of headers, without a server or a database. Each case reports the
+time and the payload size per row, or per header, and the run fails when a case is slower than its baseline by
+more than the threshold or its payload grows.
+
+Baselines are only comparable on the machine they were recorded on: after changing machines, or after an
+intended change of cost, record them again with --update.
+
+Run from the repository root: python -m benchmarks.serialization [--threshold 0.25] [--update] [--case PATTERN]
+"""
+from typing import Callable, Dict, List, Tuple
+import argparse
+import fnmatch
+import json
+import os
+import random
+import struct
+import sys
+import time
+from workload_server import codec as server_codec
+from workload_client.rfw_tcp_client import RFD_HEADER_FORMAT, RFW_HEADER_FORMAT
+from workload_client import codec as client_codec
+from workload_client.async_filewriter import AsyncFilewriter
+from workload_client.column_batch import numpy_available
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+THRESHOLD = 0.25
+
+ROW_COUNTS = (100, 10_000)
+SELECTIONS = {"cpu": ["cpu"], "all": ["cpu", "net_in", "net_out", "memory"]}
+# Time spent measuring a case for each sample, the fastest sample being kept
+SAMPLE_SECONDS = 0.05
+SAMPLES = 5
+# Cases slower than their baseline are measured again this many times, a regression having to show on each
+CONFIRMATIONS = 2
+
+# A case returns the number of bytes it produced or consumed
+case = Callable[[], int]
+
+
+def fixture_rows(count: int, keys: List[str]) -> List[Tuple]:
+    """Rows shaped like the rows read from the database, the same on every run"""
+    generator = random.Random(count)
+    values = {"cpu": lambda: generator.randrange(100),
+              "net_in": lambda: generator.randrange(1 << 20),
+              "net_out": lambda: generator.randrange(1 << 20),
+              "memory": generator.random}
+    return [tuple(values[key]() for key in keys) for _ in range(count)]
+
+
+def batch_cases() -> Dict[str, Tuple[int, case]]:
+    """Returns the cases run on a batch, by name, with the number of rows each processes"""
+    cases = {}
+    for count in ROW_COUNTS:
+        for (selection, keys) in SELECTIONS.items():
+            rows = fixture_rows(count, keys)
+            suffix = f"{count}x{selection}"
+            for protocol in ("JSON", "BUFF"):
+                payload = server_codec.encode_rows(protocol, keys, rows)
+                decoded = client_codec.decode_payload(protocol, payload, "list")[1]
+                cases[f"encode.{protocol.lower()}/{suffix}"] = \
+                    (count, lambda p=protocol, r=rows, k=keys: len(server_codec.encode_rows(p, k, r)))
+                cases[f"decode.{protocol.lower()}.list/{suffix}"] = \
+                    (count, lambda p=protocol, b=payload: len(b) if client_codec.decode_payload(p, b, "list") else 0)
+                if numpy_available():
+                    cases[f"decode.{protocol.lower()}.numpy/{suffix}"] = \
+                        (count, lambda p=protocol, b=payload:
+                            len(b) if client_codec.decode_payload(p, b, "numpy") else 0)
+            writer = AsyncFilewriter(rfw_id=0, source="DVD-training", batch_id=0, columns=keys, data=decoded)
+            cases[f"format.csv/{suffix}"] = (count, lambda w=writer: sum(len(line) for line in w.format_lines()))
+    return cases
+
+
+def header_cases() -> Dict[str, Tuple[int, case]]:
+    """Returns the cases packing or unpacking a single header"""
+    rfw_header = struct.pack(RFW_HEADER_FORMAT, b"RFW", 1234, b"BUFF", 4096)
+    rfd_header = struct.pack(RFD_HEADER_FORMAT, b"RFD", 1234, 7, b"BUFF", 4096)
+    return {"header.pack/rfw": (1, lambda: len(struct.pack(RFW_HEADER_FORMAT, b"RFW", 1234, b"BUFF", 4096))),
+            "header.unpack/rfw": (1, lambda: len(rfw_header) if struct.unpack(RFW_HEADER_FORMAT, rfw_header) else 0),
+            "header.pack/rfd": (1, lambda: len(struct.pack(RFD_HEADER_FORMAT, b"RFD", 1234, 7, b"BUFF", 4096))),
+            "header.unpack/rfd": (1, lambda: len(rfd_header) if struct.unpack(RFD_HEADER_FORMAT, rfd_header) else 0)}
+
+
+def measure(run: case) -> Tuple[float, int]:
+    """
+    :param run: case to time
+    :return: fastest time of a call in nanoseconds and number of bytes of a call
+    """
+    size = run()
+    # Calls are grouped so the timer overhead stays negligible for the shortest cases
+    calls = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(calls):
+            run()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= SAMPLE_SECONDS * 1e9 / 10:
+            break
+        calls *= 10
+    calls = max(1, int(calls * SAMPLE_SECONDS * 1e9 / elapsed))
+
+    best = float("inf")
+    for _ in range(SAMPLES):
+        start = time.perf_counter_ns()
+        for _ in range(calls):
+            run()
+        best = min(best, (time.perf_counter_ns() - start) / calls)
+    return best, size
+
+
+def compare(name: str, result: Dict[str, float], baseline: Dict[str, float], threshold: float) -> List[str]:
+    """Returns the regressions of a case against its baseline"""
+    regressions = []
+    if result["ns_per_row"] > baseline["ns_per_row"] * (1 + threshold):
+        regressions.append(f"{name}: {result['ns_per_row']:.1f} ns/row, baseline {baseline['ns_per_row']:.1f}")
+    # Payloads are deterministic, so any growth is a change of format rather than noise
+    if result["bytes_per_row"] > baseline["bytes_per_row"] + 1e-9:
+        regressions.append(f"{name}: {result['bytes_per_row']:.2f} bytes/row, "
+                           f"baseline {baseline['bytes_per_row']:.2f}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threshold", type=float,
+                        help=f"relative slowdown tolerated, defaults to the value stored with the baselines "
+                             f"or {THRESHOLD}")
+    parser.add_argument("--update", action="store_true",
+                        help="record the results as the new baselines instead of comparing them")
+    parser.add_argument("--case", default="*",
+                        help="only run the cases whose name matches this pattern, e.g. 'decode.*/10000x*'")
+    parser.add_argument("--baselines", default=BASELINES,
+                        help="file holding the baselines, defaults to benchmarks/baselines.json")
+    args = parser.parse_args()
+
+    stored = {"threshold": THRESHOLD, "results": {}}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as file:
+            stored = json.load(file)
+    threshold = args.threshold if args.threshold is not None else stored.get("threshold", THRESHOLD)
+
+    results = {}
+    regressions = []
+    print(f"{'case':<32}{'ns/row':>12}{'bytes/row':>12}{'baseline':>12}{'change':>9}")
+    for (name, (rows, run)) in {**batch_cases(), **header_cases()}.items():
+        if not fnmatch.fnmatchcase(name, args.case):
+            continue
+        (elapsed, size) = measure(run)
+        baseline = stored["results"].get(name)
+        for _ in range(CONFIRMATIONS):
+            # Baselines keep the best of every measurement, checks stop measuring once within the threshold
+            if not args.update and (baseline is None or elapsed / rows <= baseline["ns_per_row"] * (1 + threshold)):
+                break
+            elapsed = min(elapsed, measure(run)[0])
+        result = results[name] = {"ns_per_row": round(elapsed / rows, 2), "bytes_per_row": round(size / rows, 3)}
+        if baseline is None:
+            print(f"{name:<32}{result['ns_per_row']:>12.1f}{result['bytes_per_row']:>12.2f}{'-':>12}{'-':>9}")
+            continue
+        change = result["ns_per_row"] / baseline["ns_per_row"] - 1
+        print(f"{name:<32}{result['ns_per_row']:>12.1f}{result['bytes_per_row']:>12.2f}"
+              f"{baseline['ns_per_row']:>12.1f}{change:>+9.1%}")
+        regressions.extend(compare(name, result, baseline, threshold))
+
+    if args.update:
+        stored["threshold"] = threshold
+        stored["results"].update(results)
+        with open(args.baselines, "w") as file:
+            json.dump(stored, file, indent=2, sort_keys=True)
+            file.write("\n")
+        print(f"Recorded {len(results)} baselines in {args.baselines}")
+        return 0
+
+    if regressions:
+        print(f"\n{len(regressions)} regressions past {threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Compares the throughput of TCP loopback, Unix domain socket and shared memory transports on large batches.
+
+A server is started in a temporary directory holding a synthetic database, then the same RFWs are run
+over each transport, and finally read in-process through the embedded API as a reference.
+
+Run from the repository root: python -m benchmarks.transport_bench [--rows N] [--batch-unit N]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import closing
+from workload_server import wl_db, embedded
+from workload_client.rfw_tcp_client import RfwTcpClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = "DVD-training"
+PORT = 9987
+
+
+def create_database(folder: str, rows: int) -> None:
+    random.seed(0)
+    with closing(sqlite3.connect(os.path.join(folder, wl_db.DB))) as con, con:
+        con.execute(f"CREATE TABLE {wl_db.TABLE} (id INTEGER PRIMARY KEY, cpu INTEGER, net_in INTEGER, "
+                    f"net_out INTEGER, memory REAL, source TEXT)")
+        con.executemany(f"INSERT INTO {wl_db.TABLE} ({', '.join(wl_db.COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+                        ((random.randrange(100), random.randrange(1 << 20), random.randrange(1 << 20),
+                          random.random(), SOURCE) for _ in range(rows)))
+
+
+async def drain(queue: asyncio.Queue) -> None:
+    while True:
+        await queue.get()
+        queue.task_done()
+
+
+async def run(address: str, protocol: str, batch_unit: int, batches: int, repeat: int) -> tuple:
+    queue = asyncio.Queue()
+    consumer = asyncio.create_task(drain(queue))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        client = RfwTcpClient(queue=queue, rfw_id=random.getrandbits(32), protocol=protocol, bench_type=SOURCE,
+                              metrics=15, batch_unit=batch_unit, batch_id=0, batch_size=batches,
+                              host=address, port=PORT)
+        if not await client.run():
+            raise RuntimeError(f"RFW over {address} failed")
+    elapsed = time.perf_counter() - start
+    await queue.join()
+    consumer.cancel()
+    return elapsed, client.rows_rcv * repeat
+
+
+def run_embedded(batch_unit: int, batches: int, repeat: int) -> tuple:
+    start = time.perf_counter()
+    rows = 0
+    for _ in range(repeat):
+        rows += sum(len(new_batch.data) for new_batch in
+                    embedded.iter_batches(SOURCE, 15, batch_unit, 0, batches))
+    return time.perf_counter() - start, rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=400_000)
+    parser.add_argument("--batch-unit", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--protocol", choices=["JSON", "BUFF"], default="BUFF")
+    args = parser.parse_args()
+    # Configured before the clients do, so their per batch messages are not printed
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as folder:
+        create_database(folder, args.rows)
+        socket = os.path.join(folder, "wl.sock")
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, "wl_server.py"), "--skipdb", "-l",
+                                   "-p", str(PORT), "--unix", socket],
+                                  cwd=folder, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while not os.path.exists(socket):
+                time.sleep(0.05)
+            batches = -(-args.rows // args.batch_unit)
+            for (label, address) in (("tcp", "127.0.0.1"), ("unix", f"unix://{socket}"),
+                                     ("shm", f"shm+unix://{socket}")):
+                (elapsed, rows) = asyncio.run(run(address, args.protocol, args.batch_unit, batches, args.repeat))
+                print(f"{label:>5}: {rows / elapsed:>10.0f} rows/s, {elapsed / args.repeat * 1000:8.1f} ms per RFW")
+            wl_db.DB = os.path.join(folder, wl_db.DB)
+            (elapsed, rows) = run_embedded(args.batch_unit, batches, args.repeat)
+            print(f"{'embed':>5}: {rows / elapsed:>10.0f} rows/s, {elapsed / args.repeat * 1000:8.1f} ms per RFW")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+from contextlib import asynccontextmanager
+import pytest
+
+# Modules import workload_protocol_pb2 from the root of the repository, as the scripts run from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from workload_server import wl_db, rfw_tcp_server  # noqa: E402
+from workload_client.rfw_tcp_client import RfwTcpClient  # noqa: E402
+
+# Rows of each source in the test database, not multiples of the batch units the tests use
+SOURCES = (("DVD-testing", 57), ("DVD-training", 230), ("NDBench-testing", 41), ("NDBench-training", 120))
+
+
+def make_rows(source: str, count: int, seed: int = 1):
+    generator = random.Random(f"{seed}-{source}")
+    return [(generator.randint(0, 100), generator.randint(0, 10 ** 6), generator.randint(0, 10 ** 6),
+             round(generator.random(), 6), source) for _ in range(count)]
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Small workload database in a temporary directory, which is also the working directory of the test"""
+    path = str(tmp_path / "workload.db")
+    con = sqlite3.connect(path)
+    con.execute(f"CREATE TABLE {wl_db.TABLE} (id INTEGER PRIMARY KEY, cpu INTEGER, net_in INTEGER, "
+                f"net_out INTEGER, memory REAL, source TEXT)")
+    for (source, count) in SOURCES:
+        con.executemany(f"INSERT INTO {wl_db.TABLE} (cpu, net_in, net_out, memory, source) VALUES (?, ?, ?, ?, ?)",
+                        make_rows(source, count))
+    con.commit()
+    con.close()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(wl_db, "DB", path)
+    monkeypatch.setattr(wl_db, "_dataset_version", None)
+    monkeypatch.setattr(wl_db, "_row_count", 0)
+    monkeypatch.setattr(wl_db, "_max_id", 0)
+    monkeypatch.setattr(wl_db, "_match_positions", type(wl_db._match_positions)())
+    return path
+
+
+def query(sql: str, *params):
+    """Runs a query on the test database"""
+    con = sqlite3.connect(wl_db.DB)
+    try:
+        return con.execute(sql, params).fetchall()
+    finally:
+        con.close()
+
+
+@asynccontextmanager
+async def rfw_server():
+    """Serves the test database on a free local port for the duration of the block, yielding the port"""
+    server = await rfw_tcp_server.start_rfw_server("127.0.0.1", 0)
+    try:
+        yield server.sockets[0].getsockname()[1]
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+async def fetch(port: int, bench_type: str, batch_unit: int, batch_id: int, batch_size: int, **options):
+    """Runs an RFW, for every metric unless given, returning whether it succeeded and the batches it queued"""
+    queue = asyncio.Queue()
+    client = RfwTcpClient(queue, 1, options.pop("protocol", "JSON"), bench_type, options.pop("metrics", 15),
+                          batch_unit, batch_id, batch_size, host="127.0.0.1", port=port, **options)
+    success = await client.run()
+    return success, [queue.get_nowait() for _ in range(queue.qsize())]
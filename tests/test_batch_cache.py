@@ -0,0 +1,49 @@
+import asyncio
+import os
+import subprocess
+import sys
+from conftest import rfw_server, fetch
+from workload_client.batch_cache import BatchCache, TMP_PREFIX
+
+
+def test_batches_are_served_from_the_cache_and_counted_per_batch(database, tmp_path):
+    cache = BatchCache(str(tmp_path / "cache"))
+
+    async def scenario():
+        async with rfw_server() as port:
+            cold = await fetch(port, "DVD-training", 10, 2, 18, cache=cache)
+            counts = (cache.hits, cache.misses)
+            warm = await fetch(port, "DVD-training", 10, 0, 23, cache=cache)
+            return cold, counts, warm
+
+    ((cold_success, cold), cold_counts, (warm_success, warm)) = asyncio.run(scenario())
+    assert cold_success and warm_success
+    assert cold_counts == (0, 18)
+    # Batches 0, 1 and 20 to 22 were not cached by the first run, and are fetched as two ranges
+    assert (cache.hits, cache.misses) == (18, 23)
+    assert [new_batch.data for new_batch in cold] == [new_batch.data for new_batch in warm[2:20]]
+    assert [new_batch.batch_id for new_batch in warm] == list(range(23))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = BatchCache(str(tmp_path), max_bytes=30)
+
+    async def scenario():
+        for key in ("a", "b", "c"):
+            await cache.put(key, bytes(10))
+        await cache.get("a")
+        await cache.put("d", bytes(10))
+
+    asyncio.run(scenario())
+    assert list(cache.entries) == ["c", "a", "d"]
+    assert sorted(os.listdir(tmp_path)) == ["a", "c", "d"]
+
+
+def test_only_temporary_files_of_processes_which_are_gone_are_removed(tmp_path):
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    for pid in (finished.pid, os.getppid()):
+        (tmp_path / f"{TMP_PREFIX}{pid}-0-key").write_bytes(b"partial")
+    (tmp_path / f"{TMP_PREFIX}unnamed").write_bytes(b"partial")
+    BatchCache(str(tmp_path))
+    assert os.listdir(tmp_path) == [f"{TMP_PREFIX}{os.getppid()}-0-key"]
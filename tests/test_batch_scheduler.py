@@ -0,0 +1,90 @@
+import asyncio
+import random
+from collections import deque
+import pytest
+from workload_server.batch_scheduler import BatchScheduler, Flow, PRIORITIES
+
+QUANTUM = 1000
+
+
+class RoundByRound(BatchScheduler):
+    """Reference deficit round-robin, adding the quantum one round at a time"""
+    def next_waiter(self):
+        for (priority, flows) in enumerate(self.flows):
+            while flows:
+                (peer, flow) = next(iter(flows.items()))
+                (_, cost, _) = flow.head()
+                if flow.deficit < cost:
+                    flow.deficit += self.quantum
+                    flows.move_to_end(peer)
+                    continue
+                flow.deficit -= cost
+                selected = flow.pop()
+                if not flow.queues:
+                    del flows[peer]
+                return priority, selected
+        return None
+
+
+def enqueue(scheduler, priority, peer, connection, tag, cost):
+    flow = scheduler.flows[priority].get(peer)
+    if flow is None:
+        flow = scheduler.flows[priority][peer] = Flow()
+    flow.queues.setdefault(connection, deque()).append((tag, cost, 0.0))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_rounds_added_at_once_select_like_rounds_added_one_by_one(seed):
+    generator = random.Random(seed)
+    schedulers = (BatchScheduler(quantum=QUANTUM), RoundByRound(quantum=QUANTUM))
+    selections = ([], [])
+    for step in range(300):
+        if generator.random() < 0.6:
+            waiter = (generator.randrange(len(PRIORITIES)), generator.randrange(5), generator.randrange(3), step,
+                      generator.choice([1, 10, 500, 1000, 1001, 7_500, 60_000]))
+            for scheduler in schedulers:
+                enqueue(scheduler, *waiter)
+        else:
+            for (scheduler, selected) in zip(schedulers, selections):
+                selected.append(scheduler.next_waiter())
+                selected.append([[(peer, flow.deficit) for (peer, flow) in flows.items()]
+                                 for flows in scheduler.flows])
+    assert selections[0] == selections[1]
+
+
+def grant_rows(scheduler, waiters, grants):
+    """Runs every waiter on one slot, returning the rows granted to each peer after grants grants"""
+    granted = {}
+    order = []
+
+    async def work(priority, peer, cost):
+        async with scheduler.slot(peer, peer, priority, cost):
+            if len(order) < grants:
+                order.append(peer)
+                granted[peer] = granted.get(peer, 0) + cost
+            await asyncio.sleep(0)
+
+    async def scenario():
+        # The slot is held while the waiters queue, so the first grant already sees all of them
+        await scheduler.acquire("holder", "holder", 0, 1)
+        tasks = [asyncio.ensure_future(work(*waiter)) for waiter in waiters]
+        await asyncio.sleep(0)
+        scheduler.release(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    return granted, order
+
+
+def test_peers_share_the_rows_whatever_their_batch_size():
+    scheduler = BatchScheduler(slots=1, quantum=QUANTUM)
+    waiters = [(1, "large", 20_000)] * 20 + [(1, "small", 100)] * 2000
+    (granted, _) = grant_rows(scheduler, waiters, 400)
+    assert abs(granted["large"] - granted["small"]) <= 20_000 + QUANTUM
+
+
+def test_classes_are_served_in_priority_order():
+    scheduler = BatchScheduler(slots=1, quantum=QUANTUM)
+    waiters = [(2, "bulk", 100)] * 5 + [(1, "normal", 100)] * 5 + [(0, "interactive", 100)] * 5
+    (_, order) = grant_rows(scheduler, waiters, 15)
+    assert order == ["interactive"] * 5 + ["normal"] * 5 + ["bulk"] * 5
@@ -0,0 +1,26 @@
+import json
+import pytest
+from benchmarks import serialization
+from benchmarks.serialization import compare
+
+with open(serialization.BASELINES) as baselines_file:
+    BASELINES = json.load(baselines_file)
+CASES = {**serialization.batch_cases(), **serialization.header_cases()}
+
+
+def test_every_case_has_a_baseline():
+    assert set(CASES) == set(BASELINES["results"])
+
+
+@pytest.mark.parametrize("name, rows, run", [(name, rows, run) for (name, (rows, run)) in CASES.items()])
+def test_payload_sizes_match_their_baseline(name, rows, run):
+    # Sizes do not depend on the machine, unlike times
+    assert round(run() / rows, 3) == BASELINES["results"][name]["bytes_per_row"]
+
+
+def test_only_slowdowns_past_the_threshold_and_larger_payloads_are_regressions():
+    baseline = {"ns_per_row": 100.0, "bytes_per_row": 20.0}
+    assert compare("case", {"ns_per_row": 124.0, "bytes_per_row": 20.0}, baseline, 0.25) == []
+    assert compare("case", {"ns_per_row": 10.0, "bytes_per_row": 19.0}, baseline, 0.25) == []
+    assert len(compare("case", {"ns_per_row": 126.0, "bytes_per_row": 20.0}, baseline, 0.25)) == 1
+    assert len(compare("case", {"ns_per_row": 126.0, "bytes_per_row": 20.5}, baseline, 0.25)) == 2
@@ -0,0 +1,83 @@
+import asyncio
+import os
+from collections import namedtuple
+import pytest
+from conftest import rfw_server
+from workload_client import sinks
+from workload_client.checkpoint import Checkpoint, CHECKPOINT_FOLDER, DONE_MARKER
+from workload_client.scheduler import RfwScheduler
+from workload_client.sinks import CsvSink, NpySink
+
+request = namedtuple("REQUEST", ["protocol", "bench_type", "metrics", "batch_unit", "batch_id", "batch_size",
+                                 "filter"])
+
+RFW = request("JSON", "DVD-training", 15, 10, 0, 30, "")
+
+
+def run(sink_type, folder):
+    """Runs RFW with --resume into a new sink, returning the scheduler once the sink is closed"""
+    sink = sink_type(folder)
+
+    async def scenario():
+        async with rfw_server() as port:
+            scheduler = RfwScheduler(asyncio.Queue(), "127.0.0.1", port, sink=sink, resume=True)
+            # Batches are handed to the sink from the queue as the CLI does
+            listener = asyncio.ensure_future(forward(scheduler.queue, sink))
+            await scheduler.run([RFW])
+            listener.cancel()
+            await scheduler.pool.close()
+            return scheduler
+
+    scheduler = asyncio.run(scenario())
+    sink.close()
+    return scheduler
+
+
+async def forward(queue, sink):
+    while True:
+        sink.submit(await queue.get())
+
+
+def outputs(folder):
+    """Contents of every file written by the sink, by path relative to folder"""
+    contents = {}
+    for (directory, _, files) in os.walk(folder):
+        for name in files:
+            path = os.path.join(directory, name)
+            with open(path, "rb") as file:
+                contents[os.path.relpath(path, folder)] = file.read()
+    return contents
+
+
+@pytest.mark.parametrize("sink_type", [CsvSink, NpySink])
+def test_an_interrupted_rfw_resumes_from_its_last_checkpoint(database, monkeypatch, sink_type):
+    monkeypatch.setattr(sinks, "CHECKPOINT_EVERY", 4)
+    folder = "out"
+    first = run(sink_type, folder)
+    assert [result.success for result in first.results] == [True]
+    complete = outputs(folder)
+
+    # Run again, a complete request is skipped
+    assert run(sink_type, folder).skipped == 1
+    assert outputs(folder) == complete
+
+    # Interrupted after the checkpoint of batch 7, with rows of later batches written but not recorded
+    filename = Checkpoint.request_filename(RFW, os.path.join(CHECKPOINT_FOLDER, sink_type.name))
+    with open(filename) as file:
+        lines = file.read().splitlines()
+    assert lines[-1] == DONE_MARKER
+    recorded = [line.split(" ")[0] for line in lines[1:-1]]
+    assert recorded[:3] == ["3", "7", "11"]
+    # The record of batch 11 was cut while written
+    with open(filename, "w") as file:
+        file.write("\n".join(lines[:3]) + "\n" + lines[3][:4])
+    for path in complete:
+        with open(os.path.join(folder, path), "ab") as file:
+            file.write(b"rows written after the last checkpoint")
+
+    resumed = run(sink_type, folder)
+    # Only the batches after the checkpoint are fetched again
+    assert [result.batches for result in resumed.results] == [16]
+    assert outputs(folder) == complete
+    with open(filename) as file:
+        assert file.read().splitlines()[-1] == DONE_MARKER
@@ -0,0 +1,28 @@
+import asyncio
+from itertools import groupby
+import pytest
+from conftest import rfw_server, fetch
+
+
+@pytest.mark.parametrize("protocol", ["JSON", "BUFF"])
+@pytest.mark.parametrize("decode", ["list", "numpy"])
+def test_chunks_make_up_the_whole_batches(database, protocol, decode):
+    async def scenario():
+        async with rfw_server() as port:
+            return (await fetch(port, "DVD-testing", 10, 0, 10, protocol=protocol, decode=decode),
+                    await fetch(port, "DVD-testing", 10, 0, 10, protocol=protocol, decode=decode, chunk_rows=4))
+
+    ((whole_success, whole), (chunked_success, chunks)) = asyncio.run(scenario())
+    assert whole_success and chunked_success
+
+    reassembled = []
+    for (batch_id, frames) in groupby(chunks, key=lambda chunk: chunk.batch_id):
+        (*parts, end) = frames
+        # The chunks of a batch are followed by an empty final batch
+        assert [chunk.final for chunk in parts] == [False] * len(parts)
+        assert all(0 < len(chunk.data) <= 4 for chunk in parts)
+        assert end.final and len(end.data) == 0
+        reassembled.append((batch_id, [row for chunk in parts for row in chunk.data]))
+    # 57 rows, the short batch 5 ending the source
+    assert [batch_id for (batch_id, _) in reassembled] == list(range(6))
+    assert reassembled == [(new_batch.batch_id, list(new_batch.data)) for new_batch in whole]
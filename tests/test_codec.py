@@ -0,0 +1,80 @@
+import asyncio
+import os
+from contextlib import contextmanager
+import pytest
+from conftest import rfw_server, fetch
+from workload_client import codec as client_codec
+from workload_server import codec as server_codec
+
+
+@contextmanager
+def offloaded():
+    """Serializes and decodes every batch in worker processes for the duration of the block"""
+    server_codec.configure(1, offload_rows=1)
+    client_codec.configure(1, offload_bytes=1)
+    try:
+        yield
+    finally:
+        server_codec.configure(0)
+        client_codec.configure(0)
+
+
+def fetch_all(protocol, decode):
+    async def scenario():
+        async with rfw_server() as port:
+            return await fetch(port, "DVD-training", 50, 0, 10, protocol=protocol, decode=decode)
+
+    (success, batches) = asyncio.run(scenario())
+    assert success
+    return [(new_batch.batch_id, new_batch.keys, list(new_batch.data)) for new_batch in batches]
+
+
+@pytest.mark.parametrize("protocol", ["JSON", "BUFF"])
+@pytest.mark.parametrize("decode", ["list", "numpy"])
+def test_offloaded_batches_are_the_batches_encoded_inline(database, protocol, decode):
+    inline = fetch_all(protocol, decode)
+    with offloaded():
+        assert fetch_all(protocol, decode) == inline
+    assert len(inline) == 5
+
+
+@pytest.mark.parametrize("protocol", ["JSON", "BUFF"])
+def test_invalid_payloads_fail_to_decode_in_the_pool_too(protocol):
+    with offloaded(), pytest.raises(ValueError):
+        asyncio.run(client_codec.decode_rfd(protocol, b"\xff not an RFD", "list"))
+
+
+@pytest.mark.parametrize("protocol", ["JSON", "BUFF"])
+def test_rows_are_handed_to_the_workers_without_losing_values(protocol):
+    keys = ["cpu", "net_in", "net_out", "memory"]
+    batches = [[(i, 2 ** 32 - 1 - i, 2 ** 31 + i, i / 3) for i in range(100)]]
+    if protocol == "JSON":
+        # A value that does not fit its column makes the rows go through the pool pipe instead
+        batches.append(batches[0][:-1] + [(None, 1, 2, 0.5)])
+
+    async def scenario():
+        return [await server_codec.serialize(protocol, keys, rows) for rows in batches]
+
+    with offloaded():
+        assert asyncio.run(scenario()) == [server_codec.encode_rows(protocol, keys, rows) for rows in batches]
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="shared memory blocks are not listed in /dev/shm")
+def test_no_block_is_left_behind_by_a_cancelled_serialization():
+    keys = ["cpu", "net_in", "net_out", "memory"]
+    rows = [(i, i, i, 0.5) for i in range(200_000)]
+    before = set(os.listdir("/dev/shm"))
+
+    async def scenario():
+        task = asyncio.ensure_future(server_codec.serialize("JSON", keys, rows))
+        # Cancelled once the worker received the rows, before it returns the payload
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # Waits for the worker to be done with the cancelled serialization
+        await asyncio.get_running_loop().run_in_executor(server_codec._executor, sum, [])
+        await asyncio.sleep(0.05)
+
+    with offloaded():
+        asyncio.run(scenario())
+    assert set(os.listdir("/dev/shm")) - before == set()
@@ -0,0 +1,32 @@
+import asyncio
+import pytest
+from conftest import rfw_server, fetch
+from workload_client.column_batch import DTYPES, json_columns
+
+
+@pytest.mark.parametrize("protocol", ["JSON", "BUFF"])
+@pytest.mark.parametrize("metrics", [15, 9])
+def test_numpy_columns_hold_the_rows_decoded_as_lists(database, protocol, metrics):
+    async def scenario():
+        async with rfw_server() as port:
+            return (await fetch(port, "DVD-testing", 10, 0, 10, protocol=protocol, metrics=metrics),
+                    await fetch(port, "DVD-testing", 10, 0, 10, protocol=protocol, metrics=metrics, decode="numpy"))
+
+    ((listed_success, listed), (columnar_success, columnar)) = asyncio.run(scenario())
+    assert listed_success and columnar_success
+    assert [new_batch.batch_id for new_batch in columnar] == [new_batch.batch_id for new_batch in listed]
+    for (rows, columns) in zip(listed, columnar):
+        assert columns.keys == list(rows.keys)
+        assert [column.dtype.str for column in columns.columns] == [DTYPES[key] for key in columns.keys]
+        assert len(columns.data) == len(rows.data)
+        assert list(columns.data) == [tuple(row) for row in rows.data]
+
+
+def test_integer_columns_keep_values_a_double_cannot_hold():
+    pytest.importorskip("numpy")
+    keys = ["cpu", "net_in", "net_out", "memory"]
+    data = [[1, 2 ** 53 + 1, 2 ** 62 + 3, 0.25], [2, 3, 4, 0.5]]
+    columns = json_columns(keys, data)
+    assert [column.dtype.str for column in columns] == ["<i8", "<i8", "<i8", "<f8"]
+    assert list(zip(*(column.tolist() for column in columns))) == [tuple(row) for row in data]
+    assert [len(column) for column in json_columns(keys, [])] == [0, 0, 0, 0]
@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from conftest import rfw_server, fetch
+from workload_server import wl_db
+from workload_server.embedded import aiter_batches, iter_batches
+
+
+def served(bench_type, batch_unit, start, count, **options):
+    async def scenario():
+        async with rfw_server() as port:
+            return await fetch(port, bench_type, batch_unit, start, count, **options)
+
+    (success, batches) = asyncio.run(scenario())
+    assert success
+    return [(new_batch.batch_id, [tuple(row) for row in new_batch.data]) for new_batch in batches]
+
+
+@pytest.mark.parametrize("bench_type, batch_unit, start, count, filter_expr",
+                         [("DVD-training", 10, 2, 30, ""),  # ends on a batch boundary, with an empty batch
+                          ("DVD-testing", 10, 0, 30, ""),  # ends on a short batch
+                          ("NDBench-training", 7, 3, 4, ""),  # stops before the end of the source
+                          ("NDBench", 16, 0, 30, "cpu > 40 AND memory < 0.7")])
+def test_batches_are_the_batches_the_server_sends(database, bench_type, batch_unit, start, count, filter_expr):
+    expected = served(bench_type, batch_unit, start, count, filter_expr=filter_expr)
+    batches = list(iter_batches(bench_type, 15, batch_unit, start, count, filter_expr))
+    assert sum(len(new_batch.data) for new_batch in batches) > 0
+    assert [(new_batch.batch_id, new_batch.data) for new_batch in batches] == expected
+
+
+def test_the_columns_layout_holds_the_rows_of_the_rows_layout(database):
+    rows = list(iter_batches("NDBench-testing", 9, 10, 0, 10))
+    columns = list(iter_batches("NDBench-testing", 9, 10, 0, 10, layout="columns"))
+    assert [new_batch.keys for new_batch in columns] == [["cpu", "memory"]] * 5
+    for (row_batch, column_batch) in zip(rows, columns):
+        assert [column.dtype.str for column in column_batch.data] == ["<i8", "<f8"]
+        assert list(zip(*(column.tolist() for column in column_batch.data))) == row_batch.data
+
+
+def test_stopping_early_closes_the_cursor(database, monkeypatch):
+    closed = []
+    iter_rows = wl_db.iter_rows
+
+    async def recording_iter_rows(*args):
+        try:
+            async for rows in iter_rows(*args):
+                yield rows
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(wl_db, "iter_rows", recording_iter_rows)
+    batches = iter_batches("DVD-training", 15, 10, 0, 30)
+    assert [next(batches).batch_id for _ in range(3)] == [0, 1, 2]
+    assert not closed
+    batches.close()
+    assert closed == [True]
+
+
+@pytest.mark.parametrize("metrics, filter_expr, layout", [(0, "", "rows"), (15, "cpu >", "rows"), (15, "", "table")])
+def test_invalid_rfws_are_rejected_before_reading(database, metrics, filter_expr, layout):
+    with pytest.raises(ValueError):
+        next(iter_batches("DVD-training", metrics, 10, 0, 1, filter_expr, layout))
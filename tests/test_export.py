@@ -0,0 +1,38 @@
+import asyncio
+import gzip
+import os
+import pytest
+from conftest import rfw_server, query
+from workload_client.export_client import export_sources
+from workload_server import rfw_tcp_server, wl_db
+
+
+def export(protocol, sources, wl_metrics, filename, compress=False):
+    async def scenario():
+        async with rfw_server() as port:
+            return await export_sources("127.0.0.1", port, protocol, sources, wl_metrics, filename, compress)
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("protocol", ["JSON", "BUFF"])
+@pytest.mark.parametrize("compress", [False, True])
+def test_the_export_holds_every_row_of_the_sources_in_table_order(database, monkeypatch, protocol, compress):
+    # Several frames, and a last one shorter than the others
+    monkeypatch.setattr(rfw_tcp_server, "EXPORT_CHUNK_ROWS", 50)
+    assert export(protocol, ["DVD-testing", "NDBench"], 9, "export.csv", compress) == 218
+    assert not os.path.exists("export.csv.part")
+
+    with open("export.csv", "rb") as file:
+        content = file.read()
+    lines = (gzip.decompress(content) if compress else content).decode("utf-8").splitlines()
+    assert lines[0] == "cpu,memory,source"
+    rows = query(f"SELECT cpu, memory, source FROM {wl_db.TABLE} "
+                 f"WHERE source LIKE 'DVD-testing%' OR source LIKE 'NDBench%' ORDER BY id")
+    assert lines[1:] == [f"{cpu},{memory},{source}" for (cpu, memory, source) in rows]
+
+
+@pytest.mark.parametrize("sources, wl_metrics", [([], 15), (["DVD-testing"], 0), (["DVD"] * 17, 15)])
+def test_rejected_exports_leave_no_file(database, sources, wl_metrics):
+    assert export("JSON", sources, wl_metrics, "export.csv") is None
+    assert not os.path.exists("export.csv") and not os.path.exists("export.csv.part")
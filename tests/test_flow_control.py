@@ -0,0 +1,96 @@
+import asyncio
+import json
+import struct
+import pytest
+from conftest import rfw_server
+from workload_client import flow_control
+from workload_client.rfw_tcp_client import RfwTcpClient, RFW_HEADER_FORMAT, RFD_HEADER_FORMAT, RFD_HEADER_SIZE
+from workload_server.rfw_tcp_server import Credit
+
+
+def test_credits_are_granted_back_in_groups_of_half_the_window():
+    async def scenario():
+        grants = []
+        window = flow_control.CreditWindow(8, grants.append)
+        for _ in range(8):
+            window.receive()
+        for _ in range(7):
+            window.consume()
+        return grants
+
+    assert asyncio.run(scenario()) == [4]
+
+
+def test_batches_not_sent_by_the_server_grant_no_credit():
+    async def scenario():
+        grants = []
+        window = flow_control.CreditWindow(4, grants.append)
+        # Cached batches are consumed before the server sends anything
+        for _ in range(10):
+            window.consume()
+        window.receive()
+        window.receive()
+        window.consume()
+        return grants
+
+    assert asyncio.run(scenario()) == [2]
+
+
+def test_the_server_waits_for_credit_and_gives_up_once_the_peer_left():
+    async def scenario():
+        credit = Credit(1)
+        await credit.spend()
+        waiting = asyncio.ensure_future(credit.spend())
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        credit.grant(1)
+        await waiting
+        credit.close()
+        with pytest.raises(ConnectionResetError):
+            await credit.spend()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("chunk_rows", [0, 4])
+def test_the_server_sends_no_more_frames_than_the_sink_allows(database, chunk_rows):
+    async def scenario():
+        async with rfw_server() as port:
+            queue = asyncio.Queue()
+            client = RfwTcpClient(queue, 1, "JSON", "DVD-training", 15, 10, 0, 23, host="127.0.0.1", port=port,
+                                  credit=4, chunk_rows=chunk_rows)
+            task = asyncio.ensure_future(client.run())
+            backlogs = []
+            received = []
+            while not task.done() or not queue.empty():
+                await asyncio.sleep(0.005)
+                backlogs.append(queue.qsize())
+                # A slow sink, writing one frame per poll
+                if not queue.empty():
+                    received.append(queue.get_nowait())
+                    flow_control.consumed(client.rfw_id)
+            return await task, backlogs, received
+
+    (success, backlogs, received) = asyncio.run(scenario())
+    assert success
+    assert max(backlogs) == 4
+    assert received[-1].batch_id == 22
+
+
+def test_another_request_while_sending_batches_closes_the_connection(database):
+    request = json.dumps({"bench_type": "DVD-training", "wl_metrics": 15, "batch_unit": 10, "batch_id": 0,
+                          "batch_size": 23, "credit": 1}).encode("utf-8")
+
+    async def scenario():
+        async with rfw_server() as port:
+            (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(struct.pack(RFW_HEADER_FORMAT, b"RFW", 1, b"JSON", len(request)) + request)
+            header = await reader.readexactly(RFD_HEADER_SIZE)
+            await reader.readexactly(struct.unpack(RFD_HEADER_FORMAT, header)[-1])
+            # A version request, shorter than a credit frame, instead of the credit the server waits for
+            writer.write(struct.pack(RFW_HEADER_FORMAT, b"VER", 1, b"JSON", 0))
+            remaining = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return remaining
+
+    assert asyncio.run(scenario()) == b""
@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+from conftest import rfw_server, fetch, make_rows, query
+from workload_client.ingest_client import ingest_rows
+from workload_client.stats_client import fetch_stats
+from workload_server import ingest, wl_db, wl_stats
+from workload_server.wl_stats import METRICS, summarize
+
+
+@pytest.fixture
+def ingestion(database, monkeypatch):
+    """Statistics loaded and ingestion enabled, as the server does with --ingest"""
+    monkeypatch.setattr(wl_stats, "_sources", None)
+    monkeypatch.setattr(ingest, "_ingestor", None)
+    wl_stats.load()
+
+
+def source_columns(source):
+    rows = query(f"SELECT {', '.join(METRICS)} FROM {wl_db.TABLE} WHERE source = ? ORDER BY id", source)
+    return {metric: [row[i] for row in rows] for (i, metric) in enumerate(METRICS)}
+
+
+def run_with_ingestion(scenario):
+    async def with_ingestor():
+        ingestor = await ingest.enable()
+        try:
+            async with rfw_server() as port:
+                return await scenario(port)
+        finally:
+            await ingestor.close()
+
+    return asyncio.run(with_ingestor())
+
+
+@pytest.mark.parametrize("protocol", ["JSON", "BUFF"])
+def test_ingested_rows_are_served_and_summarized_at_once(ingestion, protocol):
+    existing = [row[:-1] for row in make_rows("NDBench-testing", 1_234, seed=7)]
+    new = [row[:-1] for row in make_rows("NDBench-live", 25, seed=8)]
+
+    async def scenario(port):
+        results = [await ingest_rows("127.0.0.1", port, protocol, "NDBench-testing", existing, batch_rows=100),
+                   await ingest_rows("127.0.0.1", port, protocol, "NDBench-live", new, batch_rows=10)]
+        stats = await fetch_stats("127.0.0.1", port, protocol, "NDBench-", batch_unit=100)
+        (success, batches) = await fetch(port, "NDBench-testing", 100, 0, 20, protocol=protocol)
+        assert success
+        return results, stats, batches
+
+    (results, stats, batches) = run_with_ingestion(scenario)
+    # Each acknowledgement carries the version including the rows
+    assert [count for (count, _) in results] == [1_234, 25]
+    assert results[0][1] != results[1][1] == wl_db.get_dataset_version()
+
+    # 41 rows were there before
+    rows = query(f"SELECT cpu, net_in, net_out, memory FROM {wl_db.TABLE} WHERE source = ? ORDER BY id",
+                 "NDBench-testing")
+    assert len(rows) == 1_275
+    assert [tuple(row) for new_batch in batches for row in new_batch.data] == rows
+    assert [tuple(row) for row in rows[41:]] == [tuple(row) for row in existing]
+
+    by_source = {source["source"]: source for source in stats}
+    assert set(by_source) == {"NDBench-testing", "NDBench-training", "NDBench-live"}
+    for (source, count) in (("NDBench-testing", 1_275), ("NDBench-live", 25)):
+        assert by_source[source]["rows"] == count
+        assert by_source[source]["batches"] == -(-count // 100)
+        columns = source_columns(source)
+        for metric in METRICS:
+            assert by_source[source]["columns"][metric] == pytest.approx(summarize(columns[metric]))
+
+
+def test_statistics_stored_with_the_appended_rows_are_loaded_again(ingestion, monkeypatch, caplog):
+    async def scenario(port):
+        return await ingest_rows("127.0.0.1", port, "JSON", "DVD-testing",
+                                 [row[:-1] for row in make_rows("DVD-testing", 50, seed=3)])
+
+    run_with_ingestion(scenario)
+    expected = wl_stats.get_stats("DVD-testing")
+    # A restarted server finds the statistics stored for the current version instead of computing them again
+    monkeypatch.setattr(wl_stats, "_sources", None)
+    with caplog.at_level("INFO"):
+        sources = wl_stats.load()
+    assert "Computing the statistics of the dataset" not in caplog.messages
+    assert sources["DVD-testing"].rows == 107
+    assert wl_stats.get_stats("DVD-testing") == expected
+
+
+@pytest.mark.parametrize("rows", [[(1, 2, 3)], [("cpu", 2, 3, 0.5)], []])
+def test_invalid_rows_are_refused_and_nothing_is_appended(ingestion, rows):
+    before = query(f"SELECT COUNT(*) FROM {wl_db.TABLE}")
+
+    async def scenario(port):
+        return await ingest_rows("127.0.0.1", port, "JSON", "DVD-testing", rows)
+
+    # Nothing is sent for no rows at all
+    assert run_with_ingestion(scenario) == (None if rows else (0, ""))
+    assert query(f"SELECT COUNT(*) FROM {wl_db.TABLE}") == before
@@ -0,0 +1,87 @@
+import asyncio
+import sqlite3
+from contextlib import closing
+import pytest
+from conftest import make_rows, query
+from workload_server import wl_db
+from workload_server.predicate import parse, PredicateError, MAX_LENGTH, MAX_DEPTH
+from workload_server.rfw_tcp_server import AsyncConnection
+
+RFW = {"bench_type": "DVD-testing", "wl_metrics": 15, "batch_unit": 10, "batch_id": 0, "batch_size": 1}
+
+
+@pytest.mark.parametrize("text", ["", "cpu", "cpu >", "cpu > 1 AND", "(cpu > 1", "cpu > 1)", "id > 1",
+                                  "source = 1", "cpu > 1; DROP TABLE workload", "cpu > '1'", "cpu > 1 OR OR cpu < 2"])
+def test_invalid_expressions_are_rejected(text):
+    with pytest.raises(PredicateError):
+        parse(text)
+
+
+def test_expressions_are_bounded_in_length_and_depth():
+    parse("cpu > 1" + " OR cpu > 1" * ((MAX_LENGTH - 7) // 11))
+    with pytest.raises(PredicateError):
+        parse("cpu > 1" + " OR cpu > 1" * ((MAX_LENGTH - 7) // 11 + 1))
+    parse("(" * MAX_DEPTH + "cpu > 1" + ")" * MAX_DEPTH)
+    with pytest.raises(PredicateError):
+        parse("(" * (MAX_DEPTH + 1) + "cpu > 1" + ")" * (MAX_DEPTH + 1))
+    with pytest.raises(PredicateError):
+        parse("NOT " * (MAX_DEPTH + 1) + "cpu > 1")
+
+
+def test_equivalent_spellings_share_a_canonical_form():
+    assert parse("cpu>80 and memory>0.5").canonical == parse("(CPU > 80) AND memory > 0.5").canonical
+
+
+def test_sql_and_python_evaluations_agree(database):
+    predicate = parse("cpu > 50 AND (memory < 0.3 OR NOT net_in >= 500000)")
+    matched = [row_id for (row_id,) in query(f"SELECT id FROM {wl_db.TABLE} WHERE {predicate.sql} ORDER BY id",
+                                             *predicate.params)]
+    rows = query(f"SELECT id, cpu, net_in, net_out, memory FROM {wl_db.TABLE} ORDER BY id")
+    assert matched == [row[0] for row in rows if predicate(dict(zip(wl_db.COLUMNS, row[1:])))]
+    assert matched
+
+
+class Writer:
+    def get_extra_info(self, name):
+        return ("test", 0) if name == "peername" else None
+
+
+@pytest.mark.parametrize("filter_expr", [5, ["cpu > 1"], {"cpu": 1}, True])
+def test_filters_which_are_not_strings_make_the_rfw_invalid(filter_expr):
+    connection = AsyncConnection(None, Writer())
+    assert asyncio.run(connection.check_rfw({**RFW, "filter": filter_expr})) is None
+    assert connection.failed_attempts == 1
+
+
+@pytest.mark.parametrize("filter_expr", [None, ""])
+def test_a_missing_filter_selects_every_row(filter_expr):
+    connection = AsyncConnection(None, Writer())
+    assert asyncio.run(connection.check_rfw({**RFW, "filter": filter_expr})).predicate is None
+
+
+def test_matches_are_cached_per_dataset_version(database, monkeypatch):
+    predicate = parse("cpu > 50")
+    before = list(asyncio.run(wl_db.get_match_positions("DVD-testing", predicate)))
+    with closing(sqlite3.connect(wl_db.DB)) as con, con:
+        con.executemany(f"INSERT INTO {wl_db.TABLE} (cpu, net_in, net_out, memory, source) VALUES (?, ?, ?, ?, ?)",
+                        [(90, 0, 0, 0.0, "DVD-testing")] * 3)
+    # Same version, the cached matches are reused
+    assert list(asyncio.run(wl_db.get_match_positions("DVD-testing", predicate))) == before
+    # Another version of the dataset, like a database replaced under the same path, is matched again
+    monkeypatch.setattr(wl_db, "_dataset_version", "other")
+    after = list(asyncio.run(wl_db.get_match_positions("DVD-testing", predicate)))
+    assert after[:len(before)] == before and len(after) == len(before) + 3
+
+
+def test_appended_rows_move_the_matches_to_the_new_version(database):
+    predicate = parse("cpu > 50")
+    before = list(asyncio.run(wl_db.get_match_positions("DVD-testing", predicate)))
+    first_id = query(f"SELECT MAX(id) FROM {wl_db.TABLE}")[0][0] + 1
+    appended = make_rows("DVD-testing", 20, seed=5)
+    with closing(sqlite3.connect(wl_db.DB)) as con, con:
+        con.executemany(f"INSERT INTO {wl_db.TABLE} (cpu, net_in, net_out, memory, source) VALUES (?, ?, ?, ?, ?)",
+                        appended)
+    wl_db.record_append("DVD-testing", first_id, [row[:-1] for row in appended])
+    assert set(key[2] for key in wl_db._match_positions) == {wl_db.get_dataset_version()}
+    expected = before + [first_id + i for (i, row) in enumerate(appended) if row[0] > 50]
+    assert list(asyncio.run(wl_db.get_match_positions("DVD-testing", predicate))) == expected
@@ -0,0 +1,100 @@
+import asyncio
+import sqlite3
+from contextlib import closing
+import pytest
+from conftest import rfw_server, fetch, make_rows
+from workload_server import prerender, wl_db
+from workload_server.prerender import Combination
+
+COMBINATION = Combination("DVD-testing", 15, 10, "JSON")
+
+
+@pytest.fixture
+def rendered(monkeypatch):
+    """Restores the packed files served, closing those the test loaded"""
+    monkeypatch.setattr(prerender, "_rendered", {})
+    yield
+    for batches in prerender._rendered.values():
+        batches.close()
+
+
+def append(source, count, seed):
+    with closing(sqlite3.connect(wl_db.DB)) as con, con:
+        con.executemany(f"INSERT INTO {wl_db.TABLE} (cpu, net_in, net_out, memory, source) VALUES (?, ?, ?, ?, ?)",
+                        make_rows(source, count, seed))
+
+
+def test_rendering_again_only_renders_the_batches_completed_since(database):
+    # 57 rows, the short batch ending the source is not rendered
+    assert prerender.render(COMBINATION) == 5
+    (packed_path, index_path) = prerender.file_paths(COMBINATION, prerender.PRERENDER_FOLDER)
+    with open(packed_path, "rb") as file:
+        packed = file.read()
+    assert prerender.render(COMBINATION) == 0
+
+    append("DVD-testing", 15, seed=2)
+    assert prerender.render(COMBINATION) == 2
+    with open(packed_path, "rb") as file:
+        assert file.read().startswith(packed)
+    offsets = prerender.read_index(index_path)
+    with open(packed_path, "rb") as file, closing(sqlite3.connect(wl_db.DB)) as con:
+        keys = wl_db.selected_columns(COMBINATION.wl_metrics)
+        for batch_id in range(len(offsets) - 1):
+            file.seek(offsets[batch_id])
+            assert file.read(offsets[batch_id + 1] - offsets[batch_id]) == \
+                prerender.render_batch(con, COMBINATION, keys, batch_id)
+
+
+def test_batches_of_a_replaced_database_are_rendered_again_and_not_served(database, rendered):
+    prerender.render(COMBINATION)
+    with closing(sqlite3.connect(wl_db.DB)) as con, con:
+        con.execute(f"UPDATE {wl_db.TABLE} SET cpu = cpu + 1 WHERE source = ?", ("DVD-testing",))
+    assert prerender.load() == {}
+    assert prerender.render(COMBINATION) == 5
+    assert list(prerender.load()) == [COMBINATION]
+
+
+@pytest.mark.parametrize("protocol", prerender.PROTOCOLS)
+def test_prerendered_batches_are_the_batches_the_server_renders(database, rendered, monkeypatch, protocol):
+    async def scenario():
+        async with rfw_server() as port:
+            return await fetch(port, "DVD-training", 10, 2, 30, protocol=protocol)
+
+    expected = asyncio.run(scenario())
+    prerender.render(Combination("DVD-training", 15, 10, protocol))
+    assert len(prerender.load()) == 1
+    located = []
+    locate = prerender.locate
+
+    def recording_locate(*args):
+        located.append(locate(*args))
+        return located[-1]
+
+    monkeypatch.setattr(prerender, "locate", recording_locate)
+    served = asyncio.run(scenario())
+    assert served[0] and expected[0]
+    # 230 rows, the empty batch 23 ending the source is not rendered and comes from the database
+    assert [location is not None for location in located] == [True] * 21 + [False]
+    assert [new_batch.batch_id for new_batch in served[1]] == list(range(2, 24))
+    assert [new_batch.data for new_batch in served[1]] == [new_batch.data for new_batch in expected[1]]
+
+
+def test_batches_are_read_from_the_packed_file_without_sendfile(database, rendered, monkeypatch):
+    attempts = []
+
+    async def unavailable(*args, **kwargs):
+        attempts.append(args)
+        raise asyncio.SendfileNotAvailableError()
+
+    async def scenario():
+        async with rfw_server() as port:
+            return await fetch(port, "DVD-testing", 10, 0, 10)
+
+    expected = asyncio.run(scenario())
+    prerender.render(COMBINATION)
+    prerender.load()
+    monkeypatch.setattr(asyncio.BaseEventLoop, "sendfile", unavailable)
+    served = asyncio.run(scenario())
+    # 57 rows, the 5 full batches are pre-rendered
+    assert len(attempts) == 5
+    assert served[0] and [new_batch.data for new_batch in served[1]] == [new_batch.data for new_batch in expected[1]]
@@ -0,0 +1,46 @@
+import asyncio
+import os
+import pstats
+from workload_server.profiler import Profiler
+
+
+def test_admin_commands_write_each_profile(tmp_path):
+    profiler = Profiler(str(tmp_path))
+
+    async def scenario():
+        server = await profiler.start_admin_server("127.0.0.1", 0)
+        (reader, writer) = await asyncio.open_connection("127.0.0.1", server.sockets[0].getsockname()[1])
+        replies = []
+        for command in ("cpu 10", "loop 10", "mem", "status", "mem", "cpu stop", "loop stop", "mem stop",
+                        "sched", "bogus", "cpu soon"):
+            writer.write(f"{command}\n".encode())
+            replies.append((await reader.readline()).decode().strip())
+            await asyncio.sleep(0.05)
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return replies
+
+    replies = asyncio.run(scenario())
+    assert replies[0] == "CPU profile started for 10.0s"
+    assert replies[3] == "cpu: on, memory: on, loop: on"
+    assert replies[5].startswith("CPU profile written to ")
+    assert replies[6] == "Event loop profile stopped"
+    assert replies[7] == "Memory tracing stopped"
+    assert replies[8].startswith("interactive: ")
+    assert replies[9:] == ["Unknown command bogus", "Invalid duration soon"]
+
+    files = sorted(os.listdir(tmp_path))
+    # The first snapshot only starts tracing, the second one is the baseline of the next diffs
+    assert [name.split("-")[0] for name in files] == ["cpu", "loop", "mem"]
+    pstats.Stats(str(tmp_path / files[0]))
+    report = (tmp_path / files[1]).read_text()
+    assert report.startswith("lag samples: ") and "slow callbacks" in report
+    assert files[2].endswith(".snap")
+
+
+def test_nothing_is_profiled_until_asked():
+    profiler = Profiler()
+    assert profiler.command("") == "cpu: off, memory: off, loop: off"
+    assert profiler.command("cpu stop") == "No CPU profile running"
+    assert profiler.command("loop stop") == "No event loop profile running"
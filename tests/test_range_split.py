@@ -0,0 +1,96 @@
+import asyncio
+import csv
+import random
+import pytest
+from conftest import make_rows
+from workload_client.range_split import SplitRfw
+from workload_client.rfw_tcp_client import batch
+from workload_client.sinks import CsvSink
+
+UNIT = 5
+KEYS = ["cpu", "net_in", "net_out", "memory"]
+
+
+class Client:
+    """Stands in for an RfwTcpClient sending a range of the batches of rows, after random delays"""
+    def __init__(self, piece, rfw_id, batch_id, batch_size, rows, fail_after=None) -> None:
+        self.queue = piece
+        self.rfw_id = rfw_id
+        self.batch_id = batch_id
+        self.batch_size = batch_size
+        self.rows = rows
+        self.fail_after = fail_after
+        self.window = None
+        self.batch_count = self.bytes_rcv = self.rows_rcv = self.batch_memory = 0
+        self.decode_time = 0.0
+
+    async def run(self) -> bool:
+        for batch_id in range(self.batch_id, self.batch_id + self.batch_size):
+            await asyncio.sleep(random.random() / 1000)
+            data = self.rows[batch_id * UNIT:(batch_id + 1) * UNIT]
+            await self.queue.put(batch(self.rfw_id, "DVD-testing", batch_id, KEYS, data))
+            self.batch_count += 1
+            if self.batch_count == self.fail_after:
+                raise ValueError("undecodable frame")
+        return True
+
+
+def run_split(rows, batch_size, streams, failing=()):
+    """Fetches batch_size batches of rows, the first attempt of the pieces in failing failing after a batch"""
+    queue = asyncio.Queue()
+
+    def create_client(piece, rfw_id, batch_id, batch_size):
+        fail_after = 1 if piece.index in failing and piece.attempts == 0 else None
+        return Client(piece, rfw_id, batch_id, batch_size, rows, fail_after)
+
+    async def scenario():
+        split = SplitRfw(queue, 7, 0, batch_size, UNIT, streams, create_client)
+        success = await split.run()
+        return success, [queue.get_nowait() for _ in range(queue.qsize())]
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("streams", [1, 3, 8])
+def test_every_batch_is_queued_once_under_the_rfw_id(streams):
+    rows = make_rows("DVD-testing", 57)
+    (success, batches) = run_split(rows, 20, streams)
+    assert success
+    assert all(new_batch.rfw_id == 7 for new_batch in batches)
+    # The sink writes them in batch order, which gives back the rows of the source
+    ordered = sorted(batches, key=lambda new_batch: new_batch.batch_id)
+    assert [new_batch.batch_id for new_batch in ordered] == list(range(12))
+    assert [row for new_batch in ordered for row in new_batch.data] == rows
+
+
+def test_a_source_ending_on_a_batch_boundary_ends_with_one_empty_batch():
+    rows = make_rows("DVD-testing", 55)
+    (success, batches) = run_split(rows, 20, 3)
+    assert success
+    assert sorted(new_batch.batch_id for new_batch in batches) == list(range(12))
+    assert [new_batch.data for new_batch in batches if new_batch.batch_id == 11] == [[]]
+
+
+def test_failed_pieces_are_fetched_again_from_their_first_missing_batch():
+    rows = make_rows("DVD-training", 230)
+    (success, batches) = run_split(rows, 46, 3, failing=(0, 2))
+    assert success
+    ordered = sorted(batches, key=lambda new_batch: new_batch.batch_id)
+    assert [new_batch.batch_id for new_batch in ordered] == list(range(46))
+    assert [row for new_batch in ordered for row in new_batch.data] == rows
+
+
+def test_the_sink_writes_the_pieces_back_in_source_order(tmp_path):
+    rows = make_rows("DVD-testing", 57)
+    (success, batches) = run_split(rows, 20, 4, failing=(1,))
+    assert success
+    # Batches of the pieces arrive interleaved, those of the failed piece last
+    sink = CsvSink(str(tmp_path))
+    sink.register(7, "DVD-testing", 0)
+    for new_batch in batches:
+        sink.submit(new_batch)
+    sink.finish(7, len(batches), True)
+    sink.close()
+    with open(tmp_path / "7-DVD-testing.csv", newline="") as file:
+        written = list(csv.reader(file))
+    assert written == [KEYS] + [[str(value) for value in row] for row in rows]
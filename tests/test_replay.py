@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+from conftest import query
+from workload_server import replay, wl_db
+from workload_server.replay import ReplaySubscription, subscription
+
+ALL_METRICS = 15
+
+
+class Transport:
+    def get_write_buffer_size(self) -> int:
+        return 0
+
+
+class Writer:
+    transport = Transport()
+
+    def is_closing(self) -> bool:
+        return False
+
+
+class Connection:
+    """Stands in for the AsyncConnection of a subscriber, recording the frames written with their time"""
+    writer = Writer()
+
+    def __init__(self) -> None:
+        self.frames = []
+
+    def write_rfd(self, batch_id, protocol, keys, rows) -> int:
+        self.frames.append((asyncio.get_running_loop().time(), batch_id, list(rows)))
+        return 0
+
+
+@pytest.fixture(autouse=True)
+def wheel(monkeypatch):
+    # Every test runs its own event loop, which needs a wheel of its own
+    monkeypatch.setattr(replay, "_wheel", None)
+
+
+def run_subscription(bench_type, row_offset=0, interval=0.01, speed=1.0, frame_rows=1):
+    connection = Connection()
+    request = subscription(bench_type, ALL_METRICS, row_offset, interval, speed, frame_rows, "drop")
+
+    async def scenario():
+        started = asyncio.get_running_loop().time()
+        await ReplaySubscription(connection, "JSON", request).run()
+        return started
+
+    started = asyncio.run(scenario())
+    return started, connection.frames
+
+
+def source_rows(bench_type):
+    return query(f"SELECT cpu, net_in, net_out, memory FROM {wl_db.TABLE} WHERE source = ? ORDER BY id",
+                 bench_type)
+
+
+def test_frames_are_spaced_by_frame_rows_intervals_without_drift(database):
+    # 57 rows in frames of 5 every 15 ms, a period the 10 ms ticks of the wheel can only approach
+    (started, frames) = run_subscription("DVD-testing", interval=0.003, frame_rows=5)
+    data = frames[:-1]
+    assert [len(rows) for (_, _, rows) in data] == [5] * 11 + [2]
+    # Frames may be late by a tick of the wheel and some scheduling jitter, but never by more as they go
+    for (index, (sent, _, _)) in enumerate(data):
+        assert abs(sent - started - (index + 1) * 0.015) < 0.03
+    assert frames[-1][2] == []
+
+
+def test_frames_due_faster_than_the_wheel_ticks_keep_the_row_rate(database):
+    # A frame every 2.5 ms, several of them being sent on each tick
+    (started, frames) = run_subscription("DVD-testing", interval=0.0005, frame_rows=5)
+    data = frames[:-1]
+    assert [len(rows) for (_, _, rows) in data] == [5] * 11 + [2]
+    assert abs(data[-1][0] - started - 12 * 0.0025) < 0.03
+
+
+def test_every_row_is_streamed_in_order_across_refills(database, monkeypatch):
+    monkeypatch.setattr(replay, "PREFETCH_ROWS", 16)
+    (_, frames) = run_subscription("DVD-training", row_offset=7, interval=0.0001, frame_rows=3)
+    streamed = [tuple(row) for (_, _, rows) in frames for row in rows]
+    assert streamed == source_rows("DVD-training")[7:]
+    # Each frame carries the offset of its first row
+    position = 7
+    for (_, batch_id, rows) in frames:
+        assert batch_id == position
+        position += len(rows)
+    assert frames[-1][1:] == (230, [])
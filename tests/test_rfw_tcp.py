@@ -0,0 +1,51 @@
+import asyncio
+import json
+import struct
+import pytest
+from conftest import rfw_server, fetch, query
+from workload_client import rfw_tcp_client
+from workload_client.rfw_tcp_client import RFW_HEADER_FORMAT, RFD_HEADER_FORMAT, RFD_HEADER_SIZE
+from workload_server import batch_scheduler, wl_db
+
+
+def test_client_and_server_share_the_priority_classes():
+    assert rfw_tcp_client.PRIORITIES == batch_scheduler.PRIORITIES == ("interactive", "normal", "bulk")
+    assert rfw_tcp_client.DEFAULT_PRIORITY == batch_scheduler.DEFAULT_PRIORITY
+
+
+@pytest.mark.parametrize("protocol", ["JSON", "BUFF"])
+@pytest.mark.parametrize("priority", range(len(rfw_tcp_client.PRIORITIES)))
+def test_both_protocols_deliver_the_rows_of_the_source(database, protocol, priority):
+    async def scenario():
+        async with rfw_server() as port:
+            return await fetch(port, "NDBench-testing", 10, 1, 10, protocol=protocol, priority=priority)
+
+    (success, batches) = asyncio.run(scenario())
+    assert success
+    # 41 rows, the short batch 4 ending the source
+    assert [new_batch.batch_id for new_batch in batches] == [1, 2, 3, 4]
+    rows = query(f"SELECT cpu, net_in, net_out, memory FROM {wl_db.TABLE} WHERE source = ? ORDER BY id",
+                 "NDBench-testing")
+    assert [tuple(row) for new_batch in batches for row in new_batch.data] == rows[10:]
+
+
+@pytest.mark.parametrize("field, value", [("chunk_rows", "4"), ("chunk_rows", -1), ("chunk_rows", 2.5),
+                                          ("chunk_rows", True), ("credit", "8"), ("credit", -2),
+                                          ("credit", None), ("priority", 1.0), ("priority", 3),
+                                          ("priority", "0"), ("priority", False)])
+def test_rfws_with_invalid_options_are_answered_with_nop(database, field, value):
+    request = json.dumps({"bench_type": "DVD-testing", "wl_metrics": 15, "batch_unit": 10, "batch_id": 0,
+                          "batch_size": 1, field: value}).encode("utf-8")
+
+    async def scenario():
+        async with rfw_server() as port:
+            (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(struct.pack(RFW_HEADER_FORMAT, b"RFW", 1, b"JSON", len(request)) + request)
+            (marker, *_) = struct.unpack(RFD_HEADER_FORMAT, await reader.readexactly(RFD_HEADER_SIZE))
+            # The connection goes on serving the next request
+            writer.write(struct.pack(RFW_HEADER_FORMAT, b"VER", 1, b"JSON", 0))
+            (next_marker, *_) = struct.unpack(RFD_HEADER_FORMAT, await reader.readexactly(RFD_HEADER_SIZE))
+            writer.close()
+            return marker, next_marker
+
+    assert asyncio.run(scenario()) == (b"NOP", b"VER")
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import struct
+from collections import namedtuple
+import pytest
+from workload_client.checkpoint import CHECKPOINT_FOLDER
+from workload_client.scheduler import RfwScheduler
+
+request = namedtuple("REQUEST", ["protocol", "bench_type", "metrics", "batch_unit", "batch_id", "batch_size",
+                                 "filter"])
+
+
+class Client:
+    """Stands in for an RfwTcpClient, failing with error if one is given"""
+    def __init__(self, rfw_id: int, error: Exception = None) -> None:
+        self.rfw_id = rfw_id
+        self.error = error
+        self.batch_count = 0 if error else 1
+        self.bytes_rcv = self.rows_rcv = self.batch_memory = 0
+        self.decode_time = 0.0
+
+    async def run(self) -> bool:
+        if self.error is not None:
+            raise self.error
+        return True
+
+
+class Sink:
+    name = "test"
+
+    def __init__(self) -> None:
+        self.finished = {}
+
+    def register(self, rfw_id, source, first_batch, checkpoint=None) -> None:
+        pass
+
+    def finish(self, rfw_id, batches, complete=False) -> None:
+        self.finished[rfw_id] = complete
+
+
+def test_any_error_fails_only_its_rfw(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sink = Sink()
+    scheduler = RfwScheduler(asyncio.Queue(), "localhost", 0, sink=sink)
+    errors = {"DVD-testing": struct.error("unpack requires a buffer of 24 bytes"),
+              "NDBench-testing": asyncio.IncompleteReadError(b"", 24),
+              "DVD-training": None}
+    scheduler.create_client = lambda r, rfw_id: Client(rfw_id, errors[r.bench_type])
+    requests = [request("JSON", bench_type, 15, 10, 0, 2, "") for bench_type in errors]
+
+    async def scenario():
+        await scheduler.run(requests)
+
+    asyncio.run(scenario())
+    outcomes = {result.rfw_id: result.success for result in scheduler.results}
+    assert sorted(outcomes.values()) == [False, False, True]
+    assert sink.finished == outcomes
+
+
+@pytest.mark.parametrize("resume", [False, True])
+def test_checkpoints_are_only_written_by_resumable_runs(tmp_path, monkeypatch, resume):
+    monkeypatch.chdir(tmp_path)
+    scheduler = RfwScheduler(asyncio.Queue(), "localhost", 0, sink=Sink(), resume=resume)
+    scheduler.create_client = lambda r, rfw_id: Client(rfw_id)
+    asyncio.run(scheduler.run([request("JSON", "DVD-testing", 15, 10, 0, 2, "")]))
+    assert os.path.isdir(tmp_path / CHECKPOINT_FOLDER) == resume
@@ -0,0 +1,55 @@
+import asyncio
+import struct
+import pytest
+from workload_server import shm_ring
+from workload_server.shm_ring import ShmRing, MIN_RING_SIZE, RING_HEADER_FORMAT, RING_HEADER_SIZE
+
+pytestmark = pytest.mark.skipif(not shm_ring.available(), reason="shared memory is not available")
+
+
+@pytest.fixture
+def ring():
+    ring = ShmRing(MIN_RING_SIZE)
+    yield ring
+    ring.close()
+
+
+def release(ring: ShmRing, position: int) -> None:
+    struct.pack_into(RING_HEADER_FORMAT, ring.block.buf, 0, position)
+
+
+def test_payloads_are_copied_at_their_offset(ring):
+    (offset, length, end) = asyncio.run(ring.put(b"abc", lambda: True))
+    assert (offset, length, end) == (0, 3, 3)
+    assert bytes(ring.block.buf[RING_HEADER_SIZE:RING_HEADER_SIZE + 3]) == b"abc"
+
+
+def test_put_fails_once_the_connection_closes_while_the_ring_is_full(ring):
+    payload = bytes(ring.capacity // 2 + 1)
+    alive = [True]
+
+    async def scenario():
+        await ring.put(payload, lambda: alive[0])
+        waiting = asyncio.ensure_future(ring.put(payload, lambda: alive[0]))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        alive[0] = False
+        await asyncio.wait_for(waiting, 1)
+
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(scenario())
+
+
+def test_put_resumes_once_the_client_releases_space(ring):
+    payload = bytes(ring.capacity // 2 + 1)
+
+    async def scenario():
+        (_, _, end) = await ring.put(payload, lambda: True)
+        waiting = asyncio.ensure_future(ring.put(payload, lambda: True))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        release(ring, end)
+        return await asyncio.wait_for(waiting, 1)
+
+    (offset, length, _) = asyncio.run(scenario())
+    assert (offset, length) == (0, len(payload))
@@ -0,0 +1,65 @@
+import csv
+import os
+import pytest
+from workload_client.rfw_tcp_client import batch
+from workload_client.sinks import CsvSink, NpySink
+
+KEYS = ["cpu", "net_in", "net_out", "memory"]
+
+
+def read_csv(path):
+    with open(path, newline="") as file:
+        return list(csv.reader(file))
+
+
+def test_batches_of_a_registered_rfw_are_written_in_batch_order(tmp_path):
+    sink = CsvSink(str(tmp_path))
+    sink.register(1, "DVD-testing", 3)
+    for batch_id in (5, 3, 6, 4):
+        sink.submit(batch(1, "DVD-testing", batch_id, KEYS, [(batch_id, 0, 0, 0.5)]))
+    sink.finish(1, 4, True)
+    sink.close()
+    rows = read_csv(tmp_path / "1-DVD-testing.csv")
+    assert rows == [KEYS] + [[str(batch_id), "0", "0", "0.5"] for batch_id in (3, 4, 5, 6)]
+
+
+def test_npy_columns_are_typed_from_the_metric_definitions(tmp_path):
+    numpy = pytest.importorskip("numpy")
+    sink = NpySink(str(tmp_path))
+    sink.register(1, "DVD-testing", 0)
+    # An empty first batch gives nothing to guess the types from, and the second one holds an integral memory
+    sink.submit(batch(1, "DVD-testing", 0, KEYS, []))
+    sink.submit(batch(1, "DVD-testing", 1, KEYS, [(1, 2, 3, 1.0), (4, 5, 6, 0.25)]))
+    sink.finish(1, 2, True)
+    sink.close()
+    assert not sink.failed
+    memory = numpy.load(tmp_path / "1-DVD-testing" / "memory.npy")
+    cpu = numpy.load(tmp_path / "1-DVD-testing" / "cpu.npy")
+    assert (memory.dtype.kind, memory.tolist()) == ("f", [1.0, 0.25])
+    assert (cpu.dtype.kind, cpu.tolist()) == ("i", [1, 4])
+
+
+class FailingSink(CsvSink):
+    """Fails to write the batches of RFW 2"""
+    def write_batch(self, stream, new_batch) -> int:
+        if stream.rfw_id == 2:
+            raise ValueError("cannot write")
+        return super().write_batch(stream, new_batch)
+
+
+def test_an_rfw_failing_to_be_written_does_not_stop_the_others(tmp_path, capsys):
+    sink = FailingSink(str(tmp_path))
+    for rfw_id in (1, 2, 3):
+        sink.register(rfw_id, "DVD-testing", 0)
+    for batch_id in range(2):
+        for rfw_id in (1, 2, 3):
+            sink.submit(batch(rfw_id, "DVD-testing", batch_id, KEYS, [(rfw_id, batch_id, 0, 0.0)]))
+    for rfw_id in (1, 2, 3):
+        sink.finish(rfw_id, 2, True)
+    sink.close()
+    assert sink.failed == {2}
+    assert "1 RFWs failed to be written: 2" in capsys.readouterr().out
+    for rfw_id in (1, 3):
+        assert len(read_csv(tmp_path / f"{rfw_id}-DVD-testing.csv")) == 3
+    assert sink.thread.is_alive() is False and not sink.streams
+    assert os.path.exists(tmp_path / "2-DVD-testing.csv")
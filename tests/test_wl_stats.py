@@ -0,0 +1,69 @@
+import random
+import sqlite3
+from array import array
+from contextlib import closing
+import pytest
+from conftest import make_rows
+from workload_server import wl_db, wl_stats
+from workload_server.wl_stats import ColumnIndex, METRICS, read_columns, summarize
+
+
+@pytest.fixture
+def stats(database, monkeypatch):
+    monkeypatch.setattr(wl_stats, "_sources", None)
+    return wl_stats.load()
+
+
+def column(source):
+    with closing(sqlite3.connect(wl_db.DB)) as con:
+        return read_columns(con, source)
+
+
+def test_range_summaries_match_a_scan_of_the_range(database):
+    values = column("DVD-training")["memory"]
+    index = ColumnIndex(array("d", values))
+    generator = random.Random(3)
+    for (start, end) in [(0, 230), (0, 64), (63, 129), (1, 2)] + \
+            [sorted(generator.sample(range(231), 2)) for _ in range(50)]:
+        summary = index.summary(start, end)
+        expected = summarize(values[start:end])
+        for field in ("min", "max", "mean", "stddev"):
+            assert summary[field] == pytest.approx(expected[field], abs=1e-9)
+
+
+def test_statistics_stay_consistent_with_the_rows_appended(stats):
+    source = "NDBench-testing"
+    appended = make_rows(source, 100, seed=2)
+    with closing(sqlite3.connect(wl_db.DB)) as con, con:
+        con.executemany(f"INSERT INTO {wl_db.TABLE} (cpu, net_in, net_out, memory, source) VALUES (?, ?, ?, ?, ?)",
+                        appended)
+    wl_stats.record_append(source, [row[:-1] for row in appended])
+
+    columns = column(source)
+    (whole,) = wl_stats.get_stats(source)
+    assert whole["rows"] == 141
+    for metric in METRICS:
+        expected = summarize(columns[metric])
+        assert whole["columns"][metric] == pytest.approx(expected)
+
+    (tail,) = wl_stats.get_stats(source, row_offset=30, row_count=80)
+    for metric in METRICS:
+        expected = summarize(columns[metric][30:110])
+        for field in ("min", "max", "mean", "stddev"):
+            assert tail["columns"][metric][field] == pytest.approx(expected[field])
+
+
+@pytest.mark.parametrize("stored", [False, True])
+def test_statistics_are_answered_without_reading_rows_once_loaded(stats, monkeypatch, stored):
+    if stored:
+        # Loaded again from the statistics stored by the first load
+        monkeypatch.setattr(wl_stats, "_sources", None)
+        wl_stats.load()
+    appended = [row[:-1] for row in make_rows("NDBench-live", 100, seed=4)]
+    wl_stats.record_append("NDBench-live", appended)
+    wl_stats.record_append("NDBench-testing", appended)
+    monkeypatch.setattr(wl_stats, "read_columns", None)
+    for source in ("DVD-training", "NDBench-testing", "NDBench-live"):
+        # Whole sources with percentiles to recompute after the append, and ranges
+        assert wl_stats.get_stats(source)[0]["columns"]["cpu"]["p50"] is not None
+        assert wl_stats.get_stats(source, row_offset=10, row_count=70)[0]["row_count"] == 70
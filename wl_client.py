@@ -1,13 +1,24 @@
 import argparse
 import random
 from collections import namedtuple
-from typing import List
+from typing import Iterator
 from ipaddress import ip_address
 import asyncio
 import io
+import os
+import time
 import csv
-from workload_client.rfw_tcp_client import RfwTcpClient
+from workload_client.rfw_stream_client import RfwStreamClient
+from workload_client.rfw_tcp_client import PRIORITIES, DEFAULT_PRIORITY
+from workload_client.scheduler import RfwScheduler, MAX_IN_FLIGHT
 from workload_client.async_filewriter import AsyncFilewriter
+from workload_client.sinks import SINKS
+from workload_client.column_batch import numpy_available
+from workload_client.batch_cache import BatchCache, CACHE_FOLDER, MAX_CACHE_BYTES
+from workload_client import codec, flow_control
+from workload_client.stats_client import fetch_stats, format_stats
+from workload_client.ingest_client import ingest_rows, iter_csv_rows, BATCH_ROWS
+from workload_client.export_client import export_sources
 
 file_writers = []
 connections = []
@@ -18,112 +29,232 @@ METRICS = "cpu+netin+memory"
 BATCH_UNIT = 100
 BATCH_ID = 0
 BATCH_SIZE = 5
+ROW_OFFSET = 0
+INTERVAL = 1.0
+SPEED = 1.0
+FRAME_ROWS = 1
+POLICY = "drop"
+SINK = "files"
+DECODE = "list"
 
 REQUEST_FILE = "requests.csv"
 
 REMOTE_IP = "54.81.139.246"
 REMOTE_PORT = 8888
 
-request = namedtuple("REQUEST", ["protocol", "bench_type", "metrics", "batch_unit", "batch_id", "batch_size"])
+request = namedtuple("REQUEST", ["protocol", "bench_type", "metrics", "batch_unit", "batch_id", "batch_size",
+                                 "filter"],
+                     defaults=("",))
 
 
 async def main():
+    if args.src == "stats":
+        await print_stats()
+        return
+    if args.src == "ingest":
+        await send_rows()
+        return
+    if args.src == "export":
+        await export_file()
+        return
+
+    codec.configure(args.workers, args.offload_bytes)
     queue = asyncio.Queue()
-    listener = asyncio.create_task(queue_listener(queue))
+    sink = SINKS[args.sink]() if args.sink in SINKS else None
+    listener = asyncio.create_task(queue_listener(queue, sink))
     try:
-        await dispatcher(queue)
+        await dispatcher(queue, sink)
     finally:
         await asyncio.gather(*connections)
         await queue.join()
         listener.cancel()
         await asyncio.gather(*file_writers)
+        if sink is not None:
+            await asyncio.get_running_loop().run_in_executor(None, sink.close)
+    if args.src in ("batch", "single"):
+        print("All batches received successfully")
 
 
-async def queue_listener(queue: asyncio.Queue):
+async def queue_listener(queue: asyncio.Queue, sink=None):
     while True:
         new_batch = await queue.get()
-        new_writer = AsyncFilewriter(rfw_id=new_batch.rfw_id,
-                                     source=new_batch.bench_type,
-                                     batch_id=new_batch.batch_id,
-                                     columns=new_batch.keys,
-                                     data=new_batch.data)
-        file_writers.append(asyncio.create_task(new_writer.run()))
+        if sink is not None:
+            sink.submit(new_batch)
+        else:
+            new_writer = AsyncFilewriter(rfw_id=new_batch.rfw_id,
+                                         source=new_batch.bench_type,
+                                         batch_id=new_batch.batch_id,
+                                         columns=new_batch.keys,
+                                         data=new_batch.data)
+            file_writer = asyncio.create_task(new_writer.run())
+            file_writer.add_done_callback(lambda _, rfw_id=new_batch.rfw_id: flow_control.consumed(rfw_id))
+            file_writers.append(file_writer)
         queue.task_done()
 
 
-async def dispatcher(queue: asyncio.Queue):
+async def dispatcher(queue: asyncio.Queue, sink=None):
     """
 
     :param queue:
+    :param sink: sink writing the batches, None to write one file per batch
     :return:
     """
     random.seed()
 
     requests = []
-    if args.src is not None:
-        if "batch" in args.src:
-            requests = parse_request_file(args.filename)
-        else:
-            metrics = parse_metrics(args.metrics)
-            if metrics > 0:
-                requests.append(request(protocol=args.protocol,
-                                        bench_type=args.bench_type,
-                                        metrics=metrics,
-                                        batch_unit=args.batch_unit,
-                                        batch_id=args.batch_id,
-                                        batch_size=args.batch_size))
-    else:
+    if args.src is None:
         print("No command specified. Please select 'batch' or 'single'. Use -h for more information")
+        return
+    if "stream" in args.src:
+        # Subscriptions run on their own connection, without a scheduler
+        await start_stream(queue)
+        return
+    if "batch" in args.src:
+        requests = iter_request_file(args.filename)
+    else:
+        metrics = parse_metrics(args.metrics)
+        if metrics > 0:
+            requests.append(request(protocol=args.protocol,
+                                    bench_type=args.bench_type,
+                                    metrics=metrics,
+                                    batch_unit=args.batch_unit,
+                                    batch_id=args.batch_id,
+                                    batch_size=args.batch_size,
+                                    filter=args.filter))
+
+    cache = None
+    if args.cache:
+        # Scanning the cache folder blocks, so it is done in the executor like the other cache accesses
+        cache = await asyncio.get_running_loop().run_in_executor(None, BatchCache, args.cache_dir,
+                                                                 args.cache_size * 1_000_000)
+    scheduler = RfwScheduler(queue=queue,
+                             host=server_host(),
+                             port=args.port,
+                             max_in_flight=args.max_in_flight,
+                             sink=sink,
+                             resume=args.resume,
+                             decode=args.decode,
+                             cache=cache,
+                             chunk_rows=args.chunk_rows,
+                             credit=args.credit,
+                             priority=PRIORITIES.index(args.priority),
+                             split=max(1, args.split))
+    try:
+        await scheduler.run(requests)
+    finally:
+        await scheduler.pool.close()
 
-    if args.local:
-        host = "127.0.0.1"
+
+async def start_stream(queue: asyncio.Queue):
+    """
+
+    :param queue:
+    :return:
+    """
+    metrics = parse_metrics(args.metrics)
+    if metrics == 0:
+        print(f"No known metric in {args.metrics}")
+        return
+
+    new_connection = RfwStreamClient(queue=queue,
+                                     rfw_id=random.getrandbits(32),
+                                     protocol=args.protocol,
+                                     bench_type=args.bench_type,
+                                     metrics=metrics,
+                                     row_offset=args.offset,
+                                     interval=args.interval,
+                                     speed=args.speed,
+                                     frame_rows=args.frame_rows,
+                                     policy=args.policy,
+                                     host=server_host(),
+                                     port=args.port)
+    connections.append(asyncio.create_task(new_connection.run()))
+
+
+async def print_stats():
+    sources = await fetch_stats(server_host(), args.port, args.protocol, args.bench_type,
+                                batch_unit=args.batch_unit, row_offset=args.offset, row_count=args.count)
+    if sources is None:
+        print("Server rejected the stats request")
+    elif not sources:
+        print(f"No source starting with {args.bench_type}")
     else:
-        host = str(args.hostip)
-
-    port = args.port
-
-    for r in requests:
-        rfw_id = random.getrandbits(32)
-        new_connection = RfwTcpClient(queue=queue,
-                                      rfw_id=rfw_id,
-                                      protocol=r.protocol,
-                                      bench_type=r.bench_type,
-                                      metrics=r.metrics,
-                                      batch_unit=r.batch_unit,
-                                      batch_id=r.batch_id,
-                                      batch_size=r.batch_size,
-                                      host=host,
-                                      port=port)
-        connections.append(asyncio.create_task(new_connection.run()))
-
-
-def parse_request_file(filename) -> List[request]:
+        print(format_stats(sources))
+
+
+async def send_rows():
+    try:
+        result = await ingest_rows(server_host(), args.port, args.protocol, args.source,
+                                   iter_csv_rows(args.filename), batch_rows=args.batch_rows)
+    except (OSError, ValueError, IndexError) as err:
+        print(f"Unable to read {args.filename}: {err}")
+        return
+    if result is None:
+        print("Server refused the rows, is it running with --ingest?")
+    else:
+        print(f"{result[0]} rows appended to {args.source}, dataset version is now {result[1]}")
+
+
+async def export_file():
+    metrics = parse_metrics(args.metrics)
+    if metrics == 0:
+        print(f"No known metric in {args.metrics}")
+        return
+    start = time.perf_counter()
+    rows = await export_sources(server_host(), args.port, args.protocol, args.sources, metrics, args.filename,
+                                gzip=args.gzip)
+    elapsed = time.perf_counter() - start
+    if rows is None:
+        print("Server rejected the export request or the stream was cut")
+    else:
+        size = os.path.getsize(args.filename)
+        print(f"{rows} rows exported to {args.filename}, {size / 1e6:.2f} MB in {elapsed:.2f}s "
+              f"({size / elapsed / 1e6:.2f} MB/s)")
+
+
+def server_host() -> str:
+    """Returns the address of the server, which may be a unix:// or shm+unix:// socket address"""
+    if args.address:
+        return args.address
+    if args.local:
+        return "127.0.0.1"
+    return str(args.hostip)
+
+
+def iter_request_file(filename) -> Iterator[request]:
+    """
+    Lazily reads the requests of a CSV file, one row at a time
+
+    :param filename: CSV file containing RFWs
+    :return: iterator of valid requests
+    """
     with io.open(filename) as file:
         csv_reader = csv.DictReader(file)
-        requests = []
+        read = 0
         wrong_formats = 0
         for row in csv_reader:
             try:
                 metrics = parse_metrics(row["metrics"])
                 if metrics > 0:
-                    requests.append(request(protocol=row["protocol"],
-                                            bench_type=row["bench_type"],
-                                            metrics=metrics,
-                                            batch_unit=int(row["batch_unit"]),
-                                            batch_id=int(row["batch_id"]),
-                                            batch_size=int(row["batch_size"])))
+                    read += 1
+                    yield request(protocol=row["protocol"],
+                                  bench_type=row["bench_type"],
+                                  metrics=metrics,
+                                  batch_unit=int(row["batch_unit"]),
+                                  batch_id=int(row["batch_id"]),
+                                  batch_size=int(row["batch_size"]),
+                                  filter=row.get("filter") or "")
                 else:
                     wrong_formats += 1
 
-            except KeyError:
+            except (KeyError, ValueError, AttributeError):
                 wrong_formats += 1
 
         if wrong_formats > 0:
             print(f"Unable to add {wrong_formats} requests")
 
-        if not requests:
+        if read == 0:
             print(f'No readable value in {filename}')
-        return requests
 
 
 def parse_metrics(input_metrics: str) -> int:
@@ -146,6 +277,10 @@ def setup_arg_parser() -> argparse.ArgumentParser:
     locrem.add_argument("--local", action="store_true",
                         help="connect to a locally running server, "
                              "equivalent to --hostip 127.0.0.1")
+    locrem.add_argument("--address",
+                        help="connect through the Unix domain socket of a server on this host, "
+                             "unix:///path/of/socket, or shm+unix:///path/of/socket to also receive "
+                             "batches through shared memory")
 
     class PortAction(argparse.Action):
         def __call__(self, parser, namespace, port, option_string=None):
@@ -155,6 +290,47 @@ def setup_arg_parser() -> argparse.ArgumentParser:
             setattr(namespace, self.dest, port)
     parser.add_argument("-p", "--port", action=PortAction, type=int, default=REMOTE_PORT,
                         help=f"specify port\ndefaults to {REMOTE_PORT}")
+    parser.add_argument("-j", "--max-in-flight", type=int, default=MAX_IN_FLIGHT,
+                        help=f"maximum number of RFWs running at once, defaults to {MAX_IN_FLIGHT}")
+
+    class DecodeAction(argparse.Action):
+        def __call__(self, parser, namespace, decode, option_string=None):
+            if decode == "numpy" and not numpy_available():
+                parser.error(f"{option_string} numpy requires NumPy to be installed")
+
+            setattr(namespace, self.dest, decode)
+    parser.add_argument("--decode", action=DecodeAction, choices=["list", "numpy"], default=DECODE,
+                        help=f"decode batches as lists of rows or as one NumPy array per column, "
+                             f"defaults to {DECODE}")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="decode large payloads in this many worker processes, defaults to 0 (inline)")
+    parser.add_argument("--offload-bytes", type=int, default=codec.OFFLOAD_BYTES,
+                        help=f"payload size from which an RFD is decoded by the workers, "
+                             f"defaults to {codec.OFFLOAD_BYTES}")
+    parser.add_argument("--cache", action="store_true",
+                        help="serve batches from the local cache and only request the missing ones")
+    parser.add_argument("--cache-dir", default=CACHE_FOLDER,
+                        help=f"directory of the local cache, defaults to {CACHE_FOLDER}")
+    parser.add_argument("--cache-size", type=int, default=MAX_CACHE_BYTES // 1_000_000,
+                        help=f"size of the local cache in MB, defaults to {MAX_CACHE_BYTES // 1_000_000}")
+    parser.add_argument("--chunk-rows", type=int, default=0,
+                        help="have each batch streamed in chunks of at most this many rows, "
+                             "so memory use does not grow with batch_unit, defaults to 0 (whole batches)")
+    parser.add_argument("--credit", type=int, default=flow_control.CREDIT,
+                        help="batches, or chunks, the server may send to an RFW ahead of the writer, "
+                             f"0 to let it send as fast as it can, defaults to {flow_control.CREDIT}")
+    parser.add_argument("--priority", choices=PRIORITIES, default=PRIORITIES[DEFAULT_PRIORITY],
+                        help="class the server schedules the batch work in, interactive RFWs going before bulk ones, "
+                             f"defaults to {PRIORITIES[DEFAULT_PRIORITY]}")
+    parser.add_argument("--split", type=int, default=1,
+                        help="fetch each RFW over this many connections at once, the sink writing its batches "
+                             "in order, defaults to 1")
+    parser.add_argument("--resume", action="store_true",
+                        help="checkpoint the batches written, skipping the requests and batches already written "
+                             "by a previous run with --resume and the same sink")
+    parser.add_argument("--sink", choices=[*SINKS, "files"], default=SINK,
+                        help=f"output of the batches: one CSV file per RFW, one .npy file per column "
+                             f"or one CSV file per batch, defaults to {SINK}")
 
     # Arguments for csv formatted batch file
     batch_parser = src_parsers.add_parser("batch")
@@ -182,15 +358,98 @@ def setup_arg_parser() -> argparse.ArgumentParser:
 
     single_parser.add_argument("batch_size", type=int, nargs="?", default=BATCH_SIZE,
                                help=f"number of batches of the RFW, defaults to {BATCH_SIZE}")
+    single_parser.add_argument("--filter", default="",
+                               help="only return the rows matching this filter, e.g. \"cpu > 80 AND memory > 0.7\"; "
+                                    "batches are taken from the matching rows")
+
+    # Arguments for timed replay streams
+    stream_parser = src_parsers.add_parser("stream")
+    stream_parser.add_argument("protocol", choices=["JSON", "BUFF"], nargs="?", default=PROTOCOL,
+                               help=f"protocol of the stream, defaults to {PROTOCOL}")
+
+    stream_parser.add_argument("bench_type", choices=["DVD-testing", "DVD-training",
+                                                      "NDBench-testing", "NDBench-training"],
+                               nargs="?", default=BENCH_TYPE, help=f"bench type to replay, defaults to {BENCH_TYPE}")
+
+    stream_parser.add_argument("metrics", nargs="?", default=METRICS,
+                               help=f"metrics of the stream, defaults to {METRICS}")
+
+    stream_parser.add_argument("--offset", type=int, default=ROW_OFFSET,
+                               help=f"first row to replay, defaults to {ROW_OFFSET}")
+
+    stream_parser.add_argument("--interval", type=float, default=INTERVAL,
+                               help=f"seconds between two samples of the trace, defaults to {INTERVAL}")
+
+    stream_parser.add_argument("--speed", type=float, default=SPEED,
+                               help=f"replay speed factor, defaults to {SPEED}")
+
+    stream_parser.add_argument("--frame-rows", type=int, default=FRAME_ROWS,
+                               help=f"number of rows per frame, defaults to {FRAME_ROWS}")
+
+    stream_parser.add_argument("--policy", choices=["drop", "coalesce"], default=POLICY,
+                               help=f"what the server does with late frames, defaults to {POLICY}")
+
+    # Arguments for source statistics
+    stats_parser = src_parsers.add_parser("stats")
+    stats_parser.add_argument("protocol", choices=["JSON", "BUFF"], nargs="?", default=PROTOCOL,
+                              help=f"protocol of the request, defaults to {PROTOCOL}")
+
+    stats_parser.add_argument("bench_type", nargs="?", default=BENCH_TYPE,
+                              help=f"prefix of the sources to describe, defaults to {BENCH_TYPE}")
+
+    stats_parser.add_argument("--batch-unit", type=int, default=0,
+                              help="also give the number of batches of this size in each source")
+
+    stats_parser.add_argument("--offset", type=int, default=ROW_OFFSET,
+                              help=f"first row to summarize, defaults to {ROW_OFFSET}")
+
+    stats_parser.add_argument("--count", type=int, default=0,
+                              help="number of rows to summarize, defaults to 0 (every row from --offset); "
+                                   "percentiles are only given for whole sources")
+
+    # Arguments for appending rows to a source
+    ingest_parser = src_parsers.add_parser("ingest")
+    ingest_parser.add_argument("protocol", choices=["JSON", "BUFF"], nargs="?", default=PROTOCOL,
+                               help=f"protocol of the requests, defaults to {PROTOCOL}")
+
+    ingest_parser.add_argument("source",
+                               help="source the rows are appended to")
+
+    ingest_parser.add_argument("filename",
+                               help="CSV file laid out like the files of the dataset: a header, then CPU, "
+                                    "Net_in, Net_out and Memory columns")
+
+    ingest_parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS,
+                               help=f"number of rows per request, defaults to {BATCH_ROWS}")
+
+    # Arguments for exporting whole sources
+    export_parser = src_parsers.add_parser("export")
+    export_parser.add_argument("protocol", choices=["JSON", "BUFF"], nargs="?", default=PROTOCOL,
+                               help=f"protocol of the request, defaults to {PROTOCOL}")
+
+    export_parser.add_argument("filename",
+                               help="CSV file every row is written to, followed by its source")
+
+    export_parser.add_argument("sources", nargs="+",
+                               help="prefixes of the sources to export, e.g. DVD for both DVD sources")
+
+    export_parser.add_argument("--metrics", default=METRICS,
+                               help=f"metrics to export, defaults to {METRICS}")
+
+    export_parser.add_argument("--gzip", action="store_true",
+                               help="have the server compress the stream, the file then being gzipped")
     return parser
 
 
 if __name__ == "__main__":
     parser = setup_arg_parser()
     args = parser.parse_args()
+    if args.chunk_rows > 0 and args.sink not in SINKS:
+        parser.error("--chunk-rows requires a sink writing one output per RFW")
+    if args.resume and args.sink not in SINKS:
+        parser.error("--resume requires a sink writing one output per RFW")
     try:
         asyncio.run(main())
-        print("All batches received successfully")
     except KeyboardInterrupt:
         print("Quitting RFW client")
     except ConnectionRefusedError:
@@ -1,6 +1,7 @@
 import asyncio
 import argparse
-from workload_server import wl_db, rfw_tcp_server
+from workload_server import wl_db, wl_stats, rfw_tcp_server, codec, ingest, prerender, batch_scheduler
+from workload_server.profiler import Profiler, PROFILE_FOLDER
 
 LOCAL_IP = "127.0.0.1"
 
@@ -12,9 +13,35 @@ parser.add_argument("--skipdb", help="skip database initialization",
                     action="store_true")
 parser.add_argument("-p", "--port", type=int,
                     help="specify a port to listen on")
+parser.add_argument("--unix", metavar="PATH",
+                    help="also listen on this Unix domain socket, which co-located clients can use with shared memory")
+parser.add_argument("--admin-port", type=int,
+                    help="accept profiling commands on this local port")
+parser.add_argument("--profile-dir", default=PROFILE_FOLDER,
+                    help=f"directory where profiles are written, defaults to {PROFILE_FOLDER}")
+parser.add_argument("--ingest", action="store_true",
+                    help="accept requests appending rows to the sources")
+parser.add_argument("--transaction-rows", type=int, default=ingest.MAX_TRANSACTION_ROWS,
+                    help=f"number of queued rows from which an ingest transaction stops taking more requests, "
+                         f"defaults to {ingest.MAX_TRANSACTION_ROWS}")
+parser.add_argument("--workers", type=int, default=0,
+                    help="serialize large batches in this many worker processes, defaults to 0 (inline)")
+parser.add_argument("--offload-rows", type=int, default=codec.OFFLOAD_ROWS,
+                    help=f"number of rows from which a batch is serialized by the workers, "
+                         f"defaults to {codec.OFFLOAD_ROWS}")
+parser.add_argument("--prerender", nargs="+", type=prerender.parse_combination, default=[], metavar="COMBINATION",
+                    help="render the batches of these bench_type:wl_metrics:batch_unit:protocol combinations, "
+                         "e.g. DVD-training:15:1000:BUFF, before serving them from the rendered files")
+parser.add_argument("--prerender-dir", default=prerender.PRERENDER_FOLDER,
+                    help=f"directory of the pre-rendered batches, all of which are served, "
+                         f"defaults to {prerender.PRERENDER_FOLDER}")
+parser.add_argument("--batch-slots", type=int, default=batch_scheduler.SLOTS,
+                    help=f"number of batches fetched and serialized at once, shared fairly between connections, "
+                         f"defaults to {batch_scheduler.SLOTS}")
 
 
 async def main(args):
+    rfw_tcp_server.configure_logging()
     if not args.skipdb:
         wl_db.initialize_database()
 
@@ -29,8 +56,31 @@ async def main(args):
     if args.port:
         port = args.port
 
+    profiler = Profiler(args.profile_dir)
+    profiler.install_signal_handlers()
+
+    if args.admin_port:
+        await profiler.start_admin_server(LOCAL_IP, args.admin_port)
+
+    # Everything RFWs rely on is set up before the server accepts any
+    codec.configure(args.workers, args.offload_rows)
+    batch_scheduler.configure(max(1, args.batch_slots))
+    # Computed on the first start over a dataset and stored with it, read back on the next ones
+    wl_stats.load()
+    # Only renders the batches completed since the last run
+    await asyncio.get_running_loop().run_in_executor(None, prerender.render_all, args.prerender,
+                                                     args.prerender_dir, len(args.prerender))
+    prerender.load(args.prerender_dir)
+    if args.ingest:
+        await ingest.enable(args.transaction_rows)
+
     async with await rfw_tcp_server.start_rfw_server(host=ip, port=port) as server:
-        await server.serve_forever()
+        if args.unix:
+            async with await rfw_tcp_server.start_unix_server(args.unix) as unix_server:
+                await asyncio.gather(server.serve_forever(), unix_server.serve_forever())
+        else:
+            await server.serve_forever()
+
 
 if __name__ == "__main__":
     parsed = parser.parse_args()
@@ -6,11 +6,6 @@ import os
 
 BATCHES_FOLDER = "batches"
 
-try:
-    os.mkdir(BATCHES_FOLDER)
-except FileExistsError:
-    pass
-
 
 class AsyncFilewriter:
     def __init__(self, rfw_id: int, source: str, batch_id: int, columns: List[str], data: List[List]):
@@ -27,7 +22,13 @@ class AsyncFilewriter:
         self.columns = columns
         self.data = data
 
+    def format_lines(self) -> List[str]:
+        """Returns the CSV lines of the batch, header first"""
+        return [f"{','.join(self.columns)}\n",
+                *(f"{','.join([str(item) for item in line])}\n" for line in self.data)]
+
     async def run(self) -> None:
+        # Created on first write rather than on import, so importing the module leaves the directory untouched
+        os.makedirs(BATCHES_FOLDER, exist_ok=True)
         async with aiofiles.open(BATCHES_FOLDER + '/' + self.filename, 'w') as file:
-            await file.write(f"{','.join(self.columns)}\n")
-            await file.writelines([f"{','.join([str(item) for item in line])}\n" for line in self.data])
+            await file.writelines(self.format_lines())
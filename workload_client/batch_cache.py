@@ -0,0 +1,173 @@
+from typing import List, Optional
+from collections import OrderedDict
+import itertools
+import logging
+import asyncio
+import hashlib
+import io
+import os
+
+CACHE_FOLDER = "cache"
+MAX_CACHE_BYTES = 1 << 30
+
+TMP_PREFIX = ".tmp-"
+
+
+class BatchCache:
+    """
+    On-disk cache of raw RFD payloads with least recently used eviction
+
+    Entries are stored in files named after a hash of their key, which includes the dataset version of the
+    server, so batches from another version of the dataset are never returned. Files are written to a
+    temporary name holding the pid of the writer then renamed, so readers never see a partial entry and the
+    temporary files of a process which died can be told from those being written by another one.
+
+    Files are read and written in the default executor, the entries only being updated on the event loop.
+    The constructor scans the folder, so it is run in the executor as well.
+    """
+    def __init__(self, folder: str = CACHE_FOLDER, max_bytes: int = MAX_CACHE_BYTES) -> None:
+        """
+
+        :param folder: directory of the cache files
+        :param max_bytes: total size above which the least recently used entries are evicted
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.writing = set()
+        self.tmp_ids = itertools.count()
+        os.makedirs(folder, exist_ok=True)
+
+        # Rebuild the LRU order from the access times left by previous runs
+        files = []
+        for entry in os.scandir(folder):
+            if entry.name.startswith(TMP_PREFIX):
+                if self.stale(entry.name):
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+            elif entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for (_, name, size) in sorted(files):
+            self.entries[name] = size
+            self.size += size
+        self.evict()
+
+    @staticmethod
+    def key(version: str, bench_type: str, wl_metrics: int, batch_unit: int, batch_id: int, protocol: str,
+            filter_expr: str = "") -> str:
+        """Returns the name of the cache entry of a batch"""
+        key = f"{version}|{bench_type}|{wl_metrics}|{batch_unit}|{batch_id}|{protocol}"
+        if filter_expr:
+            key += f"|{filter_expr}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def stale(name: str) -> bool:
+        """Returns True if the temporary file was left by a process which is no longer running"""
+        try:
+            pid = int(name[len(TMP_PREFIX):].split("-", 1)[0])
+        except ValueError:
+            return True
+        if pid == os.getpid():
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            # Running under another user
+            return False
+        return False
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """
+        Misses are counted by the caller, which knows how many batches it fetches instead
+
+        :param key: name of the entry
+        :return: cached payload or None
+        """
+        if key not in self.entries:
+            return None
+        try:
+            payload = await asyncio.get_running_loop().run_in_executor(None, self.read,
+                                                                       os.path.join(self.folder, key))
+        except FileNotFoundError:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)
+            return None
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        self.hits += 1
+        return payload
+
+    @staticmethod
+    def read(path: str) -> bytes:
+        with io.open(path, "rb") as file:
+            payload = file.read()
+        os.utime(path)
+        return payload
+
+    async def put(self, key: str, payload: bytes) -> None:
+        """
+        Atomically stores a payload, then evicts entries until the cache fits in max_bytes
+
+        :param key: name of the entry
+        :param payload: raw RFD payload
+        """
+        if key in self.entries or key in self.writing or len(payload) > self.max_bytes:
+            return
+        path = os.path.join(self.folder, key)
+        tmp_path = os.path.join(self.folder, f"{TMP_PREFIX}{os.getpid()}-{next(self.tmp_ids)}-{key}")
+        self.writing.add(key)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.write, tmp_path, path, payload)
+        except OSError as err:
+            logging.warning(f"Unable to cache batch: {err}")
+            return
+        finally:
+            self.writing.discard(key)
+        self.entries[key] = len(payload)
+        self.size += len(payload)
+        await asyncio.get_running_loop().run_in_executor(None, self.remove, self.evicted())
+
+    @staticmethod
+    def write(tmp_path: str, path: str, payload: bytes) -> None:
+        try:
+            with io.open(tmp_path, "wb") as file:
+                file.write(payload)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def evict(self) -> None:
+        self.remove(self.evicted())
+
+    def evicted(self) -> List[str]:
+        """Drops least recently used entries until the cache fits in max_bytes, returning their files"""
+        paths = []
+        while self.size > self.max_bytes and self.entries:
+            (key, size) = self.entries.popitem(last=False)
+            self.size -= size
+            paths.append(os.path.join(self.folder, key))
+        return paths
+
+    @staticmethod
+    def remove(paths: List[str]) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,123 @@
+from typing import Optional, TextIO
+import hashlib
+import io
+import os
+
+CHECKPOINT_FOLDER = "checkpoints"
+
+DONE_MARKER = "done"
+
+
+class Checkpoint:
+    """
+    Append-only record of the batches of an RFW which were written and flushed by a sink
+
+    The file is named after the request, not the random RFW ID, so a later run can find it. Its first line
+    is the RFW ID, then each line holds a batch_id and the sink position after that batch, and a final
+    "done" line marks the request as complete.
+    """
+    def __init__(self, filename: str, rfw_id: int, last_batch: Optional[int] = None,
+                 position: Optional[str] = None, done: bool = False) -> None:
+        """
+
+        :param filename: path of the checkpoint file
+        :param rfw_id: RFW ID the outputs are named after
+        :param last_batch: id of the last batch written, None if none was
+        :param position: sink specific position of the output after last_batch
+        :param done: True if every batch of the request was written
+        """
+        self.filename = filename
+        self.rfw_id = rfw_id
+        self.last_batch = last_batch
+        self.position = position
+        self.done = done
+        self.file: Optional[TextIO] = None
+
+    @staticmethod
+    def request_filename(r, folder: str = CHECKPOINT_FOLDER) -> str:
+        """
+        :param r: request with the fields of an RFW
+        :param folder: directory of the checkpoint files
+        :return: path of the checkpoint file of the request
+        """
+        name = f"{r.bench_type}-{r.protocol}-{r.metrics}-{r.batch_unit}-{r.batch_id}-{r.batch_size}"
+        filter_expr = getattr(r, "filter", "")
+        if filter_expr:
+            name += "-" + hashlib.sha1(filter_expr.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(folder, f"{name}.ckpt")
+
+    @classmethod
+    def create(cls, r, rfw_id: int, folder: str = CHECKPOINT_FOLDER) -> "Checkpoint":
+        """Starts a new checkpoint for the request, replacing any previous one"""
+        os.makedirs(folder, exist_ok=True)
+        checkpoint = cls(cls.request_filename(r, folder), rfw_id)
+        checkpoint.file = io.open(checkpoint.filename, "w")
+        checkpoint.file.write(f"{rfw_id}\n")
+        checkpoint.file.flush()
+        return checkpoint
+
+    @classmethod
+    def load(cls, r, folder: str = CHECKPOINT_FOLDER) -> Optional["Checkpoint"]:
+        """
+        Reads the checkpoint of the request, if any, and reopens it for appending
+
+        :param r: request with the fields of an RFW
+        :param folder: directory of the checkpoint files
+        :return: checkpoint or None if the request was never started
+        """
+        filename = cls.request_filename(r, folder)
+        try:
+            with io.open(filename) as file:
+                content = file.read()
+        except FileNotFoundError:
+            return None
+        # A last line without its newline was interrupted while written, it is dropped so the next record
+        # does not get appended to it
+        complete_length = content.rfind("\n") + 1
+        if complete_length < len(content):
+            content = content[:complete_length]
+            with io.open(filename, "r+") as file:
+                file.truncate(len(content.encode("utf-8")))
+        lines = content.splitlines()
+
+        try:
+            checkpoint = cls(filename, int(lines[0]))
+        except (IndexError, ValueError):
+            return None
+        for line in lines[1:]:
+            if line == DONE_MARKER:
+                checkpoint.done = True
+                continue
+            fields = line.split(" ")
+            if len(fields) == 2 and fields[0].isdigit():
+                checkpoint.last_batch, checkpoint.position = int(fields[0]), fields[1]
+
+        if not checkpoint.done:
+            checkpoint.file = io.open(filename, "a")
+        return checkpoint
+
+    def next_batch(self, first_batch: int) -> int:
+        """Returns the id of the first batch still to be fetched"""
+        return first_batch if self.last_batch is None else self.last_batch + 1
+
+    def written(self, batch_id: int, position: str) -> None:
+        """
+        Records a batch once the sink has flushed it, called from the writer thread
+
+        :param batch_id: id of the batch
+        :param position: sink position after the batch
+        """
+        self.last_batch, self.position = batch_id, position
+        self.file.write(f"{batch_id} {position}\n")
+        self.file.flush()
+
+    def complete(self) -> None:
+        """Marks the request as complete and closes the checkpoint"""
+        self.done = True
+        self.file.write(f"{DONE_MARKER}\n")
+        self.close()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,105 @@
+from typing import Optional, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import json
+import workload_protocol_pb2
+from google.protobuf.message import DecodeError
+from workload_client.column_batch import json_columns, proto_columns
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    shared_memory = None
+
+OFFLOAD_BYTES = 1 << 20
+
+_executor: Optional[ProcessPoolExecutor] = None
+_offload_bytes = OFFLOAD_BYTES
+
+
+def configure(workers: int, offload_bytes: int = OFFLOAD_BYTES) -> None:
+    """
+    Starts the process pool decoding large payloads, or disables it when workers is 0
+
+    :param workers: number of worker processes
+    :param offload_bytes: payload size from which an RFD is decoded in the pool
+    """
+    global _executor, _offload_bytes
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+    _offload_bytes = offload_bytes
+    if workers > 0:
+        if shared_memory is not None:
+            # Workers forked before the tracker starts would each track the blocks they create and warn
+            # about them once this process unlinks them
+            resource_tracker.ensure_running()
+        _executor = ProcessPoolExecutor(max_workers=workers)
+
+
+def decode_payload(protocol: str, payload: bytes, decode: str) -> Tuple[List[str], List]:
+    """
+    :param protocol: "JSON" or "BUFF"
+    :param payload: serialized RFD
+    :param decode: "list" for a list of rows, "numpy" for one array per column
+    :return: keys and rows or columns of the RFD
+    :raises ValueError: if the payload is not a valid RFD
+    """
+    if protocol == "BUFF":
+        decoded_rfd = workload_protocol_pb2.ProtoRfd()
+        try:
+            decoded_rfd.ParseFromString(payload)
+        except DecodeError as err:
+            raise ValueError(err)
+        keys = list(decoded_rfd.keys)
+        if decode == "numpy":
+            return keys, proto_columns(decoded_rfd)
+        return keys, [[getattr(workload, key) for key in keys] for workload in decoded_rfd.workload]
+
+    try:
+        decoded_rfd = json.loads(payload)
+        keys, data = decoded_rfd["keys"], decoded_rfd["data"]
+    except (json.JSONDecodeError, KeyError, TypeError) as err:
+        raise ValueError(err)
+    if decode == "numpy":
+        return keys, json_columns(keys, data)
+    return keys, data
+
+
+def decode_shared(protocol: str, name: str, size: int, decode: str) -> Tuple[List[str], List]:
+    """Worker side of the pool: decodes a payload left in a shared memory block by the client"""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        payload = bytes(block.buf[:size])
+    finally:
+        block.close()
+    return decode_payload(protocol, payload, decode)
+
+
+async def decode_rfd(protocol: str, payload: bytes, decode: str) -> Tuple[List[str], List]:
+    """
+    Decodes an RFD inline, or in the process pool when it is at least offload_bytes long so the event loop
+    keeps receiving the other RFWs meanwhile
+
+    :param protocol: "JSON" or "BUFF"
+    :param payload: serialized RFD
+    :param decode: "list" or "numpy"
+    :return: keys and rows or columns of the RFD
+    :raises ValueError: if the payload is not a valid RFD
+    """
+    if _executor is None or len(payload) < _offload_bytes:
+        return decode_payload(protocol, payload, decode)
+
+    loop = asyncio.get_running_loop()
+    if shared_memory is None:
+        return await loop.run_in_executor(_executor, decode_payload, protocol, payload, decode)
+
+    block = shared_memory.SharedMemory(create=True, size=len(payload))
+    try:
+        block.buf[:len(payload)] = payload
+        return await loop.run_in_executor(_executor, decode_shared, protocol, block.name, len(payload), decode)
+    finally:
+        # Also when the task is cancelled while the worker runs: a worker that already mapped the payload keeps
+        # it mapped, one that did not fails to open it, and the decoded rows come back through the pool pipe
+        block.close()
+        block.unlink()
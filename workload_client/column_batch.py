@@ -0,0 +1,120 @@
+from typing import List, Optional, Iterator, Sequence
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DTYPES = {"cpu": "<i8", "net_in": "<i8", "net_out": "<i8", "memory": "<f8"}
+
+
+class ColumnRows:
+    """Read-only row view over the columns of a ColumnBatch, used where code expects rows"""
+    __slots__ = ("columns",)
+
+    def __init__(self, columns: List) -> None:
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    def __iter__(self) -> Iterator[tuple]:
+        return zip(*(column.tolist() for column in self.columns))
+
+
+class ColumnBatch:
+    """
+    Batch holding one NumPy array per selected column instead of a list of rows
+
+    It exposes the same fields as the batch namedtuple, data being a row view over the columns,
+    so the queue and sinks can carry it unchanged while columnar sinks write the arrays directly.
+    """
+    __slots__ = ("rfw_id", "bench_type", "batch_id", "keys", "columns", "final")
+
+    def __init__(self, rfw_id: int, bench_type: str, batch_id: int, keys: Sequence[str], columns: List,
+                 final: bool = True) -> None:
+        """
+
+        :param rfw_id:
+        :param bench_type:
+        :param batch_id:
+        :param keys: names of the columns
+        :param columns: one array per key
+        :param final: False for a chunk followed by more rows of the same batch
+        """
+        self.rfw_id = rfw_id
+        self.bench_type = bench_type
+        self.batch_id = batch_id
+        self.keys = list(keys)
+        self.columns = columns
+        self.final = final
+
+    @property
+    def data(self) -> ColumnRows:
+        return ColumnRows(self.columns)
+
+    @classmethod
+    def from_json(cls, rfw_id: int, bench_type: str, batch_id: int, keys: Sequence[str],
+                  data: List[List]) -> "ColumnBatch":
+        return cls(rfw_id, bench_type, batch_id, keys, json_columns(keys, data))
+
+    @classmethod
+    def from_proto(cls, rfw_id: int, bench_type: str, batch_id: int, proto_rfd) -> "ColumnBatch":
+        return cls(rfw_id, bench_type, batch_id, proto_rfd.keys, proto_columns(proto_rfd))
+
+
+def json_columns(keys: Sequence[str], data: List[List]) -> List:
+    """
+    Converts the decoded rows of a JSON RFD to columns with one bulk conversion per column
+
+    Each column is converted to its own type directly, so integers above 2 ** 53 keep their value.
+    """
+    values = list(zip(*data)) if data else [()] * len(keys)
+    if len(values) != len(keys):
+        raise ValueError(f"Rows of {len(values)} values for {len(keys)} keys")
+    return [numpy.array(column, dtype=DTYPES.get(key, "<f8")) for (key, column) in zip(keys, values)]
+
+
+def proto_columns(proto_rfd) -> List:
+    """Fills each column straight from the decoded ProtoRfd, without building intermediate rows"""
+    workloads = proto_rfd.workload
+    return [numpy.fromiter((getattr(workload, key) for workload in workloads),
+                           dtype=DTYPES.get(key, "<f8"), count=len(workloads))
+            for key in proto_rfd.keys]
+
+
+def skip_rows(new_batch, count: int):
+    """
+    Returns the batch without its first count rows
+
+    :param new_batch: ColumnBatch or batch namedtuple of rows
+    :param count: number of rows to drop
+    """
+    columns: Optional[List] = getattr(new_batch, "columns", None)
+    if columns is not None:
+        return ColumnBatch(new_batch.rfw_id, new_batch.bench_type, new_batch.batch_id, new_batch.keys,
+                           [column[count:] for column in columns], new_batch.final)
+    return new_batch._replace(data=new_batch.data[count:])
+
+
+def batch_memory(new_batch) -> int:
+    """
+    Returns the approximate number of bytes held by the data of a batch
+
+    :param new_batch: ColumnBatch or batch namedtuple of rows
+    :return: size of the arrays, or of the row lists extrapolated from their first row
+    """
+    columns: Optional[List] = getattr(new_batch, "columns", None)
+    if columns is not None:
+        return sum(column.nbytes for column in columns)
+    if not new_batch.data:
+        return sys.getsizeof(new_batch.data)
+    first_row = new_batch.data[0]
+    row_size = sys.getsizeof(first_row) + sum(sys.getsizeof(item) for item in first_row)
+    return sys.getsizeof(new_batch.data) + row_size * len(new_batch.data)
+
+
+def numpy_available() -> bool:
+    return numpy is not None
+
@@ -0,0 +1,68 @@
+from typing import Dict, List, Tuple
+import logging
+import asyncio
+from workload_client import transport
+
+MAX_IDLE = 16
+
+connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class ConnectionPool:
+    """Keeps idle server connections per host:port so consecutive RFWs do not reconnect"""
+    def __init__(self, max_idle: int = MAX_IDLE) -> None:
+        """
+
+        :param max_idle: maximum number of idle connections kept per host:port
+        """
+        self.max_idle = max_idle
+        self.idle: Dict[Tuple[str, int], List[connection]] = {}
+        self.opened = 0
+        self.reused = 0
+
+    async def acquire(self, host: str, port: int) -> connection:
+        """
+        Returns an idle connection to host:port, opening a new one if none is usable
+
+        :param host:
+        :param port:
+        :return: reader and writer of the connection
+        """
+        idle = self.idle.get((host, port), [])
+        while idle:
+            (reader, writer) = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                self.reused += 1
+                return reader, writer
+            writer.close()
+
+        logging.info(f"Connecting to server on {host}:{port}")
+        self.opened += 1
+        return await transport.open_connection(host, port)
+
+    def release(self, host: str, port: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Returns a connection to the pool once every reply of its RFW was read
+
+        :param host:
+        :param port:
+        :param reader:
+        :param writer:
+        """
+        idle = self.idle.setdefault((host, port), [])
+        if writer.is_closing() or reader.at_eof() or len(idle) >= self.max_idle:
+            writer.close()
+        else:
+            idle.append((reader, writer))
+
+    async def close(self) -> None:
+        """Closes every idle connection"""
+        writers = [writer for idle in self.idle.values() for (_, writer) in idle]
+        self.idle.clear()
+        for writer in writers:
+            writer.close()
+        for writer in writers:
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
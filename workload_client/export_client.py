@@ -0,0 +1,64 @@
+from typing import List, Optional
+import json
+import os
+import random
+import struct
+import aiofiles
+import workload_protocol_pb2
+from workload_client import transport
+from workload_client.rfw_tcp_client import RFW_HEADER_FORMAT, RFD_HEADER_FORMAT, RFD_HEADER_SIZE
+
+EXPORT_MARKER = "EXP"
+EXPORT_DATA_MARKER = "EXD"
+EXPORT_END_MARKER = "EXE"
+
+
+async def export_sources(host: str, port: int, protocol: str, sources: List[str], wl_metrics: int,
+                         filename: str, gzip: bool = False) -> Optional[int]:
+    """
+    Writes every row of the sources to a single CSV file, streamed by the server from one scan of its table
+
+    The stream is written to filename.part as it arrives, then renamed once complete, so an interrupted
+    export never leaves a truncated file under the final name.
+
+    :param host: address of the server, see transport.open_connection
+    :param port: port of the server
+    :param protocol: JSON or BUFF
+    :param sources: prefixes of the sources to export, like bench_type
+    :param wl_metrics: value to enable the columns bitwise (expects between 1 and 15)
+    :param filename: file the CSV is written to
+    :param gzip: have the server compress the stream, filename then holding a gzip file
+    :return: number of rows exported, None if the server rejected the request or the stream was cut
+    """
+    if protocol == "BUFF":
+        serialized = workload_protocol_pb2.ProtoExport(sources=sources, wl_metrics=wl_metrics,
+                                                       gzip=gzip).SerializeToString()
+    else:
+        serialized = bytes(json.dumps({"sources": sources, "wl_metrics": wl_metrics, "gzip": gzip}).encode("utf-8"))
+
+    partial = f"{filename}.part"
+    rows = None
+    (reader, writer) = await transport.open_connection(host, port)
+    try:
+        writer.write(struct.pack(RFW_HEADER_FORMAT, bytes(EXPORT_MARKER.encode("utf-8")), random.getrandbits(32),
+                                 bytes(protocol.encode("utf-8")), len(serialized)) + serialized)
+        await writer.drain()
+        async with aiofiles.open(partial, "wb") as file:
+            while True:
+                header = await reader.readexactly(RFD_HEADER_SIZE)
+                (marker, _, _, _, payload_size) = struct.unpack(RFD_HEADER_FORMAT, header)
+                payload = await reader.readexactly(payload_size)
+                if marker.decode() == EXPORT_DATA_MARKER:
+                    await file.write(payload)
+                    continue
+                if marker.decode() == EXPORT_END_MARKER:
+                    rows = int(payload)
+                break
+    finally:
+        writer.close()
+        if rows is None and os.path.exists(partial):
+            os.remove(partial)
+
+    if rows is not None:
+        os.replace(partial, filename)
+    return rows
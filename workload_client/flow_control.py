@@ -0,0 +1,101 @@
+from typing import Callable, Deque, Dict, Optional, Set, Union
+from collections import deque
+import asyncio
+
+CREDIT = 8
+
+# Windows of the RFWs being received, by rfw_id
+_windows: Dict[int, Union["CreditWindow", "SplitWindow"]] = {}
+
+
+class CreditWindow:
+    """
+    Credits of an RFW, each allowing the server to send one more data frame, granted back once the sink
+    has written the batches the frames carried
+
+    Credits are granted back in groups of half the window to keep the number of credit frames low. Batches
+    that did not come from the server, such as cached ones, are consumed too: the credits granted back never
+    exceed the frames received, so they only let the server run ahead by as many frames.
+    """
+    def __init__(self, credit: int, grant: Callable[[int], None]) -> None:
+        """
+
+        :param credit: initial credit of the RFW
+        :param grant: sends a number of credits to the server
+        """
+        self.credit = credit
+        self.grant = grant
+        self.loop = asyncio.get_running_loop()
+        self.received = 0
+        self.consumed = 0
+        self.granted = 0
+
+    def reset(self) -> None:
+        """Starts over with the initial credit, for an RFW sent again on a new connection"""
+        self.received = self.consumed = self.granted = 0
+
+    def receive(self) -> None:
+        """Accounts for a data frame received from the server"""
+        self.received += 1
+
+    def consume(self) -> None:
+        """Accounts for a batch or chunk written by the sink, granting credits back once enough are owed"""
+        self.consumed += 1
+        owed = min(self.consumed, self.received) - self.granted
+        if owed >= max(1, self.credit // 2):
+            self.granted += owed
+            self.grant(owed)
+
+
+class SplitWindow:
+    """
+    Window of an RFW received over several connections, each with the CreditWindow of its own client
+
+    The sink consumes batches in the order they were queued, so remembering which window queued each one is
+    enough to hand it back to the right connection. Windows are detached once their client is done, since
+    its connection may be serving another RFW by the time its last batches are written.
+    """
+    def __init__(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.queued: Deque[Optional[CreditWindow]] = deque()
+        self.attached: Set[CreditWindow] = set()
+
+    def attach(self, window: Optional[CreditWindow]) -> None:
+        if window is not None:
+            self.attached.add(window)
+
+    def detach(self, window: Optional[CreditWindow]) -> None:
+        self.attached.discard(window)
+
+    def queue(self, window: Optional[CreditWindow]) -> None:
+        """Accounts for a batch or chunk queued for the sink, None if it cost no credit"""
+        self.queued.append(window)
+
+    def consume(self) -> None:
+        if self.queued:
+            window = self.queued.popleft()
+            if window in self.attached:
+                window.consume()
+
+
+def register(rfw_id: int, window: Union[CreditWindow, SplitWindow]) -> None:
+    _windows[rfw_id] = window
+
+
+def unregister(rfw_id: int) -> None:
+    _windows.pop(rfw_id, None)
+
+
+def consumed(rfw_id: int) -> None:
+    """
+    Reports a batch or chunk of an RFW as written, from any thread
+
+    :param rfw_id: RFW the batch belongs to, ignored if it is not receiving with flow control
+    """
+    window = _windows.get(rfw_id)
+    if window is not None:
+        try:
+            window.loop.call_soon_threadsafe(window.consume)
+        except RuntimeError:
+            # The loop of the RFW already closed, there is nobody left to grant credits to
+            pass
@@ -0,0 +1,97 @@
+from typing import Iterable, Iterator, List, Optional, Tuple
+from itertools import islice
+import csv
+import io
+import json
+import logging
+import random
+import struct
+import asyncio
+import workload_protocol_pb2
+from workload_client import transport
+from workload_client.rfw_tcp_client import RFW_HEADER_FORMAT, RFD_HEADER_FORMAT, RFD_HEADER_SIZE
+
+INGEST_MARKER = "ING"
+BATCH_ROWS = 5_000
+# Requests sent ahead of their acknowledgement, so the server can commit them in the same transaction
+WINDOW = 4
+
+
+def serialize(protocol: str, source: str, rows: List[Tuple]) -> bytes:
+    if protocol == "BUFF":
+        proto_ingest = workload_protocol_pb2.ProtoIngest(source=source)
+        for (cpu, net_in, net_out, memory) in rows:
+            proto_ingest.rows.add(cpu=cpu, net_in=net_in, net_out=net_out, memory=memory)
+        return proto_ingest.SerializeToString()
+    return bytes(json.dumps({"source": source, "rows": rows}).encode("utf-8"))
+
+
+async def ingest_rows(host: str, port: int, protocol: str, source: str, rows: Iterable[Tuple],
+                      batch_rows: int = BATCH_ROWS, window: int = WINDOW) -> Optional[Tuple[int, str]]:
+    """
+    Appends rows to a source of the server, in requests of batch_rows rows
+
+    :param host: address of the server, see transport.open_connection
+    :param port: port of the server
+    :param protocol: JSON or BUFF
+    :param source: source the rows are appended to
+    :param rows: (cpu, net_in, net_out, memory) tuples
+    :param batch_rows: number of rows per request
+    :param window: number of requests sent before waiting for the first acknowledgement
+    :return: number of rows appended and dataset version after the last request, None if a request was refused
+    """
+    rfw_id = random.getrandbits(32)
+    (reader, writer) = await transport.open_connection(host, port)
+    appended = 0
+    version = ""
+    outstanding = 0
+
+    async def acknowledged() -> bool:
+        nonlocal appended, version, outstanding
+        header = await reader.readexactly(RFD_HEADER_SIZE)
+        (marker, _, count, _, payload_size) = struct.unpack(RFD_HEADER_FORMAT, header)
+        payload = await reader.readexactly(payload_size)
+        outstanding -= 1
+        if marker.decode() != INGEST_MARKER:
+            return False
+        appended += count
+        version = payload.decode()
+        return True
+
+    try:
+        iterator = iter(rows)
+        while True:
+            chunk = list(islice(iterator, batch_rows))
+            if not chunk:
+                break
+            serialized = serialize(protocol, source, chunk)
+            writer.write(struct.pack(RFW_HEADER_FORMAT, bytes(INGEST_MARKER.encode("utf-8")), rfw_id,
+                                     bytes(protocol.encode("utf-8")), len(serialized)) + serialized)
+            await writer.drain()
+            outstanding += 1
+            if outstanding >= window and not await acknowledged():
+                logging.error(f"Server refused rows {appended} and above of {source}")
+                return None
+
+        while outstanding > 0:
+            if not await acknowledged():
+                logging.error(f"Server refused rows {appended} and above of {source}")
+                return None
+    finally:
+        writer.close()
+    return appended, version
+
+
+def iter_csv_rows(filename: str) -> Iterator[Tuple]:
+    """
+    Reads rows laid out like the files of the dataset: a header, then CPU, Net_in, Net_out and Memory
+    columns followed by any other column
+
+    :param filename: CSV file
+    :return: iterator of (cpu, net_in, net_out, memory) tuples
+    """
+    with io.open(filename) as file:
+        csv_reader = csv.reader(file)
+        next(csv_reader, None)
+        for row in csv_reader:
+            yield int(row[0]), int(row[1]), int(row[2]), float(row[3])
@@ -0,0 +1,243 @@
+from typing import Callable, Dict, List, Optional, Set
+import asyncio
+import logging
+import random
+from workload_client.rfw_tcp_client import RfwTcpClient, MAX_FAIL
+from workload_client.column_batch import ColumnBatch, skip_rows
+from workload_client import flow_control
+
+# Pieces each connection gets at least, so the faster ones can take over the work of a slower one
+PIECES_PER_STREAM = 4
+# Batches of the largest piece
+MAX_PIECE_BATCHES = 64
+# Pieces a connection may run ahead of the first unfinished one, bounding the batches held by the sink
+LOOKAHEAD = 2
+
+
+def relabel(new_batch, rfw_id: int):
+    """Returns the batch as part of another RFW"""
+    if isinstance(new_batch, ColumnBatch):
+        return ColumnBatch(rfw_id, new_batch.bench_type, new_batch.batch_id, new_batch.keys, new_batch.columns,
+                           new_batch.final)
+    return new_batch._replace(rfw_id=rfw_id)
+
+
+class Piece:
+    """
+    Range of batches of a split RFW, standing in for the queue of the client fetching it
+
+    It keeps track of what was delivered, so a new client can fetch the rest after a failure: batches
+    already delivered are not requested again, and the rows already delivered of a batch received in chunks
+    are dropped.
+    """
+    def __init__(self, split: "SplitRfw", index: int, batch_id: int, end_batch: int) -> None:
+        """
+
+        :param split: RFW the piece belongs to
+        :param index: position of the piece in the RFW
+        :param batch_id: id of the first batch
+        :param end_batch: id following the last batch
+        """
+        self.split = split
+        self.index = index
+        self.next_batch = batch_id
+        self.end_batch = end_batch
+        self.attempts = 0
+        self.client: Optional[RfwTcpClient] = None
+        # Rows of next_batch delivered before, and received from the current client
+        self.delivered = 0
+        self.seen = 0
+        # Short batch found in the piece, which ends the source
+        self.short: Optional[int] = None
+
+    def attempt(self, client: RfwTcpClient) -> None:
+        self.client = client
+        self.attempts += 1
+        self.seen = 0
+
+    async def put(self, new_batch) -> None:
+        rows = len(new_batch.data)
+        skipped = min(rows, self.delivered - self.seen)
+        self.seen += rows
+        if not new_batch.final:
+            if skipped == rows:
+                self.drop()
+                return
+            self.delivered += rows - skipped
+            await self.split.forward(skip_rows(new_batch, skipped) if skipped > 0 else new_batch,
+                                     self.client.window)
+            return
+
+        rows = self.delivered + rows - skipped
+        self.next_batch = new_batch.batch_id + 1
+        self.delivered = self.seen = 0
+        if rows < self.split.batch_unit:
+            self.short = new_batch.batch_id
+            self.split.ended(new_batch.batch_id)
+        if rows == 0:
+            # Every piece past the end of the source gets an empty batch, only the first one is delivered
+            self.drop()
+            self.split.held[new_batch.batch_id] = new_batch
+            return
+        await self.split.forward(skip_rows(new_batch, skipped) if skipped > 0 else new_batch, self.client.window)
+
+    def drop(self) -> None:
+        """Returns the credit of a frame that is not handed to the sink"""
+        if self.client.window is not None:
+            self.client.window.consume()
+
+    def done(self) -> bool:
+        return self.next_batch >= self.end_batch or self.short is not None or \
+            (self.split.end is not None and self.next_batch > self.split.end)
+
+
+class SplitRfw:
+    """
+    Fetches the batches of one RFW over several connections at once
+
+    The range of batches is cut into pieces handed out in batch order to whichever connection is free, so a
+    slower connection simply takes fewer of them. Batches are queued as they arrive under the ID of the RFW,
+    the sink writing them in batch order, and connections never run more than LOOKAHEAD pieces each ahead of
+    the first unfinished one so the batches waiting for it stay bounded. A piece whose client fails is
+    fetched again from its first missing batch, by any connection.
+
+    It exposes the same run method and counters as RfwTcpClient.
+    """
+    def __init__(self,
+                 queue: asyncio.Queue,
+                 rfw_id: int,
+                 batch_id: int,
+                 batch_size: int,
+                 batch_unit: int,
+                 streams: int,
+                 create_client: Callable[[Piece, int, int, int], RfwTcpClient]
+                 ) -> None:
+        """
+
+        :param queue: queue receiving the batches
+        :param rfw_id: ID the batches are queued under
+        :param batch_id: id of the first batch
+        :param batch_size: number of batches
+        :param batch_unit: number of rows per batch
+        :param streams: number of connections
+        :param create_client: returns a client fetching a range of the batches, called with the queue, rfw_id,
+                              batch_id and batch_size of the range
+        """
+        self.queue = queue
+        self.rfw_id = rfw_id
+        self.batch_id = batch_id
+        self.end_batch = batch_id + batch_size
+        self.batch_unit = batch_unit
+        self.streams = max(1, streams)
+        self.piece_batches = max(1, min(MAX_PIECE_BATCHES, -(-batch_size // (self.streams * PIECES_PER_STREAM))))
+        self.create_client = create_client
+        self.pieces = 0
+        self.running: Set[Piece] = set()
+        self.retries: List[Piece] = []
+        self.changed: Optional[asyncio.Condition] = None
+        self.window: Optional[flow_control.SplitWindow] = None
+        self.failed = False
+        # Short batch ending the source, and the empty batches received past it
+        self.end: Optional[int] = None
+        self.held: Dict[int, object] = {}
+        self.batch_count = 0
+        self.bytes_rcv = 0
+        self.rows_rcv = 0
+        self.decode_time = 0.0
+        self.batch_memory = 0
+
+    async def run(self) -> bool:
+        """
+
+        :return: True if every batch was received
+        """
+        self.changed = asyncio.Condition()
+        self.window = flow_control.SplitWindow()
+        flow_control.register(self.rfw_id, self.window)
+        try:
+            await asyncio.gather(*(self.stream() for _ in range(self.streams)))
+            if self.end in self.held:
+                # The source ends on a batch boundary, which an empty batch tells like for an RFW in one piece
+                await self.forward(self.held[self.end], None)
+        finally:
+            flow_control.unregister(self.rfw_id)
+        return not self.failed
+
+    async def stream(self) -> None:
+        """Fetches pieces one after another over one connection, until none is left"""
+        while True:
+            piece = await self.next_piece()
+            if piece is None:
+                return
+            await self.fetch(piece)
+
+    async def next_piece(self) -> Optional[Piece]:
+        async with self.changed:
+            while not self.failed:
+                while self.retries:
+                    piece = self.retries.pop(0)
+                    if not piece.done():
+                        self.running.add(piece)
+                        return piece
+
+                start = self.batch_id + self.pieces * self.piece_batches
+                if start >= self.end_batch or (self.end is not None and start > self.end):
+                    if not self.running:
+                        return None
+                elif self.pieces < self.first_unfinished() + LOOKAHEAD * self.streams:
+                    piece = Piece(self, self.pieces, start, min(start + self.piece_batches, self.end_batch))
+                    self.pieces += 1
+                    self.running.add(piece)
+                    return piece
+                # Waits for a piece to end, which may be retried or let the next one be handed out
+                await self.changed.wait()
+        return None
+
+    def first_unfinished(self) -> int:
+        return min((piece.index for piece in (*self.running, *self.retries)), default=self.pieces)
+
+    async def fetch(self, piece: Piece) -> None:
+        client = self.create_client(piece, random.getrandbits(32), piece.next_batch,
+                                    piece.end_batch - piece.next_batch)
+        piece.attempt(client)
+        try:
+            await client.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            logging.error(f"RFW#{self.rfw_id} - Batches {piece.next_batch} to {piece.end_batch - 1} failed: {err!r}")
+        finally:
+            self.window.detach(client.window)
+        self.bytes_rcv += client.bytes_rcv
+        self.rows_rcv += client.rows_rcv
+        self.decode_time += client.decode_time
+        self.batch_memory += client.batch_memory
+
+        async with self.changed:
+            self.running.discard(piece)
+            if not piece.done():
+                if piece.attempts < MAX_FAIL:
+                    logging.warning(f"RFW#{self.rfw_id} - Fetching batches {piece.next_batch} to "
+                                    f"{piece.end_batch - 1} again")
+                    self.retries.append(piece)
+                    self.retries.sort(key=lambda retry: retry.index)
+                else:
+                    self.failed = True
+            self.changed.notify_all()
+
+    def ended(self, batch_id: int) -> None:
+        if self.end is None or batch_id < self.end:
+            self.end = batch_id
+
+    async def forward(self, new_batch, window: Optional[flow_control.CreditWindow]) -> None:
+        """Queues a batch or chunk for the sink under the ID of the RFW"""
+        self.window.attach(window)
+        if self.end is not None and new_batch.batch_id > self.end:
+            # Rows appended while the pieces were fetched, past the end the RFW already delivered
+            if window is not None:
+                window.consume()
+            return
+        self.window.queue(window)
+        if new_batch.final:
+            self.batch_count += 1
+        await self.queue.put(relabel(new_batch, self.rfw_id))
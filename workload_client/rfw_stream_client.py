@@ -0,0 +1,104 @@
+import logging
+import asyncio
+import json
+import workload_protocol_pb2
+from workload_client.rfw_tcp_client import RfwTcpClient, HOST, PORT, MAX_FAIL, RFD_HEADER_SIZE
+
+SUB_HEADER_MARKER = "SUB"
+
+POLICY = "drop"
+
+
+class RfwStreamClient(RfwTcpClient):
+    """
+    Subscribes to a source and receives its rows as a timed stream of small RFD frames
+
+    Every frame is put on the queue as a batch whose batch_id is the row offset of its first row,
+    until the server sends the empty frame marking the end of the source.
+    """
+    def __init__(self,
+                 queue: asyncio.Queue,
+                 rfw_id: int,
+                 protocol: str,
+                 bench_type: str,
+                 metrics: int,
+                 row_offset: int = 0,
+                 interval: float = 1.0,
+                 speed: float = 1.0,
+                 frame_rows: int = 1,
+                 policy: str = POLICY,
+                 host: str = HOST,
+                 port: int = PORT,
+                 tries: int = MAX_FAIL
+                 ) -> None:
+        """
+
+        :param queue:
+        :param rfw_id:
+        :param protocol:
+        :param bench_type:
+        :param metrics:
+        :param row_offset: first row of the source to stream
+        :param interval: seconds between two samples of the trace
+        :param speed: replay speed factor, rows are sent at one every interval / speed seconds
+        :param frame_rows: number of rows in each frame
+        :param policy: "drop" or "coalesce", what the server does with frames it cannot send in time
+        :param tries:
+        """
+        super().__init__(queue=queue, rfw_id=rfw_id, protocol=protocol, bench_type=bench_type, metrics=metrics,
+                         batch_unit=frame_rows, batch_id=row_offset, batch_size=0, host=host, port=port, tries=tries)
+        self.subscription = {"bench_type": bench_type,
+                             "wl_metrics": metrics,
+                             "row_offset": row_offset,
+                             "interval": interval,
+                             "speed": speed,
+                             "frame_rows": frame_rows,
+                             "policy": policy}
+
+    async def send_rfw(self) -> None:
+        """
+
+        :return:
+        """
+        logging.info(f"RFW#{self.rfw_id} - Subscribing to {self.subscription['bench_type']} from row "
+                     f"{self.subscription['row_offset']} every {self.subscription['interval']}s "
+                     f"at x{self.subscription['speed']} ({self.subscription['policy']})")
+        if self.protocol == "BUFF":
+            proto_sub = workload_protocol_pb2.ProtoSub(**self.subscription)
+            serialized_sub = proto_sub.SerializeToString()
+        else:
+            serialized_sub = bytes(json.dumps(self.subscription).encode("utf-8"))
+
+        await self.send_request(SUB_HEADER_MARKER, serialized_sub)
+
+    async def get_replies(self) -> bool:
+        """
+
+        :return: True once the end of the source was received
+        """
+        while not self.writer.is_closing():
+            try:
+                header = await self.reader.readexactly(RFD_HEADER_SIZE)
+            except asyncio.IncompleteReadError:
+                logging.error(f"RFW#{self.rfw_id} - Stream closed by the server after {self.batch_rcv} rows")
+                return False
+
+            # batch_rcv counts rows here, so check_header warns about the rows skipped by the server
+            header = await self.check_header(header)
+
+            if header is None or header.payload_size < 0:
+                return False
+
+            payload = await self.read_payload(header)
+            if payload is None:
+                return False
+            new_batch = await self.decode_rfd(header, payload)
+            if new_batch is None:
+                return False
+            if not new_batch.data:
+                logging.info(f"RFW#{self.rfw_id} - End of stream after {self.batch_rcv} rows")
+                return True
+
+            self.batch_rcv = header.last_batch - self.rfw["batch_id"] + len(new_batch.data)
+            await self.queue.put(new_batch)
+        return False
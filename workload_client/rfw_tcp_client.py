@@ -2,15 +2,26 @@ import logging
 from typing import Optional
 from collections import namedtuple
 import struct
+import random
+import time
 import json
 import asyncio
 import workload_protocol_pb2
-from google.protobuf.message import DecodeError
+from workload_client.connection_pool import ConnectionPool
+from workload_client.column_batch import ColumnBatch, batch_memory, skip_rows
+from workload_client.batch_cache import BatchCache
+from workload_client import codec, transport, flow_control
 
 HOST = "127.0.0.1"
 PORT = 8888
 
 MAX_FAIL = 5
+DECODE = "list"
+BACKOFF_BASE = 0.1
+BACKOFF_CAP = 10.0
+# Classes the server schedules the batch work of an RFW in, from the most urgent, as the protocol defines them
+PRIORITIES = tuple(name.lower() for name in workload_protocol_pb2.Priority.keys())
+DEFAULT_PRIORITY = workload_protocol_pb2.NORMAL
 
 RFW_HEADER_FORMAT = "!3sI4sQ"
 RFW_HEADER_MARKER = "RFW"
@@ -18,11 +29,23 @@ RFW_HEADER_MARKER = "RFW"
 RFD_HEADER_FORMAT = "!3sII4sQ"
 RFD_HEADER_SIZE = struct.calcsize(RFD_HEADER_FORMAT)
 RFD_HEADER_MARKER = "RFD"
+CHUNK_HEADER_MARKER = "RFH"
+CHUNK_MARKER = "RFC"
+CHUNK_END_MARKER = "RFE"
+SHARED_RFD_MARKER = "RFS"
+DATA_MARKERS = (RFD_HEADER_MARKER, CHUNK_HEADER_MARKER, CHUNK_MARKER, CHUNK_END_MARKER, SHARED_RFD_MARKER)
 
 FAIL_MARKER = "NOP"
+VERSION_MARKER = "VER"
+SHM_MARKER = "SHM"
+SHM_REQUEST_FORMAT = "!Q"
+CREDIT_MARKER = "CRD"
+CREDIT_FORMAT = "!I"
 
-rfd_header = namedtuple("RFD_HEADER", ["last_batch", "protocol", "payload_size"])
-batch = namedtuple("BATCH", ["rfw_id", "bench_type", "batch_id", "keys", "data"])
+rfd_header = namedtuple("RFD_HEADER", ["last_batch", "protocol", "payload_size", "marker"],
+                        defaults=(RFD_HEADER_MARKER,))
+# final is False for a chunk followed by more rows of the same batch
+batch = namedtuple("BATCH", ["rfw_id", "bench_type", "batch_id", "keys", "data", "final"], defaults=(True,))
 
 
 class RfwTcpClient:
@@ -40,7 +63,14 @@ class RfwTcpClient:
                  batch_size: int,
                  host: str = HOST,
                  port: int = PORT,
-                 tries: int = MAX_FAIL
+                 tries: int = MAX_FAIL,
+                 pool: Optional[ConnectionPool] = None,
+                 decode: str = DECODE,
+                 cache: Optional[BatchCache] = None,
+                 chunk_rows: int = 0,
+                 filter_expr: str = "",
+                 credit: int = 0,
+                 priority: int = DEFAULT_PRIORITY
                  ) -> None:
         """
 
@@ -53,6 +83,13 @@ class RfwTcpClient:
         :param batch_id:
         :param batch_size:
         :param tries:
+        :param pool: pool to borrow the connection from and return it to, if any
+        :param decode: "list" to decode batches as lists of rows, "numpy" as one NumPy array per column
+        :param cache: cache serving the batches it holds, only the missing ones being requested from the server
+        :param chunk_rows: have each batch streamed in chunks of at most this many rows, 0 for whole batches
+        :param filter_expr: filter evaluated by the server, batches being taken from the matching rows only
+        :param credit: number of batches, or chunks, the server may send ahead of the sink, 0 for no limit
+        :param priority: index in PRIORITIES of the class the server schedules the batches in
         """
         self.queue = queue
         self.rfw_id = rfw_id
@@ -62,27 +99,67 @@ class RfwTcpClient:
                     "batch_unit": batch_unit,
                     "batch_id": batch_id,
                     "batch_size": batch_size}
+        if chunk_rows > 0:
+            self.rfw["chunk_rows"] = chunk_rows
+        if filter_expr:
+            self.rfw["filter"] = filter_expr
+        if credit > 0:
+            self.rfw["credit"] = credit
+        if priority != DEFAULT_PRIORITY:
+            self.rfw["priority"] = priority
         self.host = host
         self.port = port
         self.retries = tries
         self.batch_rcv = 0
+        self.batch_count = 0
+        self.bytes_rcv = 0
+        self.end_of_data = False
+        self.pool = pool
+        self.decode = decode
+        self.decode_time = 0.0
+        self.rows_rcv = 0
+        self.batch_memory = 0
+        self.cache = cache
+        self.version: Optional[str] = None
+        # Empty batch decoded from the header of the chunked batch being received
+        self.chunk_head = None
+        self.chunk_delivered = 0
+        self.chunk_seen = 0
         self.reader = None
         self.writer = None
+        self.ring: Optional[transport.RingReader] = None
+        self.window: Optional[flow_control.CreditWindow] = None
 
-    async def run(self) -> None:
+    async def run(self) -> bool:
         """
 
-        :return:
+        :return: True if every batch was received
         """
         logging.basicConfig(format='%(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S', level=logging.INFO)
-        logging.info(f"Connecting to server on {self.host}:{self.port}")
-        (reader, writer) = await asyncio.open_connection(self.host, self.port)
+        if self.pool is not None:
+            (reader, writer) = await self.pool.acquire(self.host, self.port)
+        else:
+            logging.info(f"Connecting to server on {self.host}:{self.port}")
+            (reader, writer) = await transport.open_connection(self.host, self.port)
         self.reader, self.writer = reader, writer
-        await self.send_rfw()
-        await self.get_replies()
-        if self.writer is not None:
+        await self.open_ring()
+        if "credit" in self.rfw:
+            self.window = flow_control.CreditWindow(self.rfw["credit"], self.send_credit)
+            flow_control.register(self.rfw_id, self.window)
+        try:
+            if self.cache is not None:
+                success = await self.get_cached_replies()
+            else:
+                await self.send_rfw()
+                success = await self.get_replies()
+        finally:
+            flow_control.unregister(self.rfw_id)
+        if self.pool is not None and success:
+            self.pool.release(self.host, self.port, self.reader, self.writer)
+        elif self.writer is not None:
             self.writer.close()
             await self.writer.wait_closed()
+        return success
 
     async def send_rfw(self) -> None:
         """
@@ -98,14 +175,48 @@ class RfwTcpClient:
         else:
             serialized_rfw = bytes(json.dumps(self.rfw).encode("utf-8"))
 
+        # The server starts every RFW with the initial credit
+        if self.window is not None:
+            self.window.reset()
+        await self.send_request(RFW_HEADER_MARKER, serialized_rfw)
+
+    def send_credit(self, credits: int) -> None:
+        """Grants credits to the server, dropped if the connection is gone since a new RFW will be sent"""
+        if self.writer is None or self.writer.is_closing():
+            return
+        payload = struct.pack(CREDIT_FORMAT, credits)
         self.writer.write(struct.pack(RFW_HEADER_FORMAT,
-                                      bytes(RFW_HEADER_MARKER.encode("utf-8")),
+                                      bytes(CREDIT_MARKER.encode("utf-8")),
                                       self.rfw_id,
                                       bytes(self.protocol.encode("utf-8")),
-                                      len(serialized_rfw)))
-        logging.info(f"RFW#{self.rfw_id} - Sending {len(serialized_rfw)} bytes of the serialized RFW")
+                                      len(payload)) + payload)
+
+    def frame_received(self, queued: bool = True) -> None:
+        """
+        Accounts for a data frame of the server, which cost it a credit
+
+        :param queued: False if nothing was handed to the queue for the frame, its credit being returned at once
+        """
+        if self.window is not None:
+            self.window.receive()
+            if not queued:
+                self.window.consume()
+
+    async def send_request(self, marker: str, serialized: bytes) -> None:
+        """
+
+        :param marker: request type written in the header
+        :param serialized: serialized request
+        :return:
+        """
+        self.writer.write(struct.pack(RFW_HEADER_FORMAT,
+                                      bytes(marker.encode("utf-8")),
+                                      self.rfw_id,
+                                      bytes(self.protocol.encode("utf-8")),
+                                      len(serialized)))
+        logging.info(f"RFW#{self.rfw_id} - Sending {len(serialized)} bytes of the serialized {marker}")
         await self.writer.drain()
-        self.writer.write(serialized_rfw)
+        self.writer.write(serialized)
         await self.writer.drain()
 
     async def get_replies(self) -> bool:
@@ -113,7 +224,8 @@ class RfwTcpClient:
 
         :return:
         """
-        while self.retries > 0 and not self.writer.is_closing():
+        while self.batch_rcv < self.rfw["batch_size"] and not self.end_of_data \
+                and self.retries > 0 and not self.writer.is_closing():
             try:
                 header = await self.reader.readexactly(RFD_HEADER_SIZE)
             except asyncio.IncompleteReadError:
@@ -132,17 +244,20 @@ class RfwTcpClient:
                     await self.send_rfw()
                     continue
 
-                rcv_success = await self.receive_protobuf_rfd(header)\
-                    if header.protocol == "BUFF"\
-                    else await self.receive_json_rfd(header)
+                if header.marker == SHARED_RFD_MARKER:
+                    rcv_success = await self.receive_shared_rfd(header)
+                elif header.marker != RFD_HEADER_MARKER:
+                    rcv_success = await self.receive_chunk(header)
+                    if rcv_success and header.marker != CHUNK_END_MARKER:
+                        continue
+                else:
+                    rcv_success = await self.receive_rfd(header)
 
                 if rcv_success:
-                    if self.batch_rcv < self.rfw["batch_size"]:
-                        self.batch_rcv += 1
-                        logging.info(f"RFW#{self.rfw_id} - {header.payload_size} bytes of batch "
-                                     f"{self.batch_rcv}/{self.rfw['batch_size']} received.")
-                    else:
-                        logging.warning("Unexpected batch received")
+                    self.batch_rcv += 1
+                    self.batch_count += 1
+                    logging.info(f"RFW#{self.rfw_id} - {header.payload_size} bytes of batch "
+                                 f"{self.batch_rcv}/{self.rfw['batch_size']} received.")
                 else:
                     await self.reopen_connection()
                     self.retries -= 1
@@ -150,7 +265,8 @@ class RfwTcpClient:
                 await self.reopen_connection()
                 self.retries -= 1
 
-        if self.batch_rcv == self.rfw["batch_size"]:
+        # The server sends nothing after a short batch
+        if self.batch_rcv == self.rfw["batch_size"] or self.end_of_data:
             logging.info(f"RFW#{self.rfw_id} - All batches received")
             return True
         return False
@@ -163,7 +279,7 @@ class RfwTcpClient:
         """
         (marker, rfw_id, last_batch, protocol, payload_size) = struct.unpack(RFD_HEADER_FORMAT, header)
         decoded_marker = marker.decode()
-        if decoded_marker == RFD_HEADER_MARKER:
+        if decoded_marker in DATA_MARKERS:
             decoded_protocol = protocol.decode()
             if last_batch != self.batch_rcv + self.rfw["batch_id"]:
                 logging.warning(f"Non-sequential batch received. Expected {self.batch_rcv + self.rfw['batch_id']}, "
@@ -177,7 +293,8 @@ class RfwTcpClient:
                     logging.warning(f"Mismatching RFW ID received. Expected {self.rfw_id}, got {rfw_id} instead")
                 return rfd_header(last_batch=last_batch,
                                   protocol=decoded_protocol,
-                                  payload_size=payload_size)
+                                  payload_size=payload_size,
+                                  marker=decoded_marker)
 
         elif decoded_marker == FAIL_MARKER:
             logging.error("Server was unable to process request")
@@ -188,69 +305,254 @@ class RfwTcpClient:
         logging.error("Invalid data header received from server")
         return None
 
-    async def receive_json_rfd(self, header: rfd_header) -> bool:
+    async def receive_rfd(self, header: rfd_header) -> bool:
         """
+        Reads an RFD sent on the socket, decode_rfd handling both protocols
 
         :param header:
         :return:
         """
-        try:
-            payload = await self.reader.readexactly(header.payload_size)
-        except asyncio.IncompleteReadError:
-            logging.error(f"Connection with server closed before receiving payload")
+        payload = await self.read_payload(header)
+        new_batch = await self.decode_rfd(header, payload) if payload is not None else None
+        if new_batch is None:
             return False
 
-        try:
-            decoded_rfd = json.loads(payload)
-        except json.JSONDecodeError:
-            logging.error("Unable to decode received data from the server")
+        await self.store(header, payload)
+        self.frame_received()
+        await self.deliver(new_batch)
+        return True
+
+    async def receive_shared_rfd(self, header: rfd_header) -> bool:
+        """
+        Reads an RFD placed in the shared memory ring of the connection, whose descriptor is the payload of the frame
+
+        :param header:
+        :return:
+        """
+        descriptor = await self.read_payload(header)
+        if descriptor is None or self.ring is None or len(descriptor) != transport.DESCRIPTOR_SIZE:
+            logging.error(f"RFW#{self.rfw_id} - Invalid shared memory descriptor received")
+            return False
+        payload = self.ring.read(descriptor)
+        self.bytes_rcv += len(payload)
+        new_batch = await self.decode_rfd(header, payload)
+        if new_batch is None:
             return False
 
-        try:
-            new_batch = batch(rfw_id=self.rfw_id,
-                              bench_type=self.rfw["bench_type"],
-                              batch_id=header.last_batch,
-                              keys=decoded_rfd["keys"],
-                              data=decoded_rfd["data"])
-        except KeyError:
-            logging.error("Invalid RFD received")
+        await self.store(header, payload)
+        self.frame_received()
+        await self.deliver(new_batch)
+        return True
+
+    async def receive_chunk(self, header: rfd_header) -> bool:
+        """
+        Handles a frame of a chunked batch, handing each chunk to the queue as soon as it is decoded
+
+        Rows of a batch already delivered before a reconnection are skipped when the server sends
+        the batch again, so the sink receives each row once.
+
+        :param header: header of a RFH, RFC or RFE frame
+        :return: False if the frame is invalid or out of sequence
+        """
+        if header.marker == CHUNK_HEADER_MARKER:
+            payload = await self.read_payload(header)
+            head = await self.decode_rfd(header, payload, final=True) if payload is not None else None
+            if head is None:
+                return False
+            if self.chunk_head is None or self.chunk_head.batch_id != header.last_batch:
+                self.chunk_delivered = 0
+            self.chunk_head = head
+            self.chunk_seen = 0
+            return True
+
+        if self.chunk_head is None or self.chunk_head.batch_id != header.last_batch:
+            logging.error(f"RFW#{self.rfw_id} - Chunk of batch {header.last_batch} received without its header")
             return False
 
+        if header.marker == CHUNK_END_MARKER:
+            if self.chunk_seen < self.chunk_delivered:
+                logging.error(f"RFW#{self.rfw_id} - Batch {header.last_batch} shorter than when first received")
+                return False
+            if self.chunk_delivered < self.rfw["batch_unit"]:
+                self.end_of_data = True
+            # The empty final batch tells the sink the batch is complete
+            self.frame_received()
+            await self.queue.put(self.chunk_head)
+            self.chunk_head = None
+            return True
+
+        payload = await self.read_payload(header)
+        chunk = await self.decode_rfd(header, payload, final=False) if payload is not None else None
+        if chunk is None:
+            return False
+        rows = len(chunk.data)
+        skipped = min(rows, self.chunk_delivered - self.chunk_seen)
+        self.chunk_seen += rows
+        self.frame_received(queued=skipped < rows)
+        if skipped < rows:
+            await self.queue.put(skip_rows(chunk, skipped) if skipped > 0 else chunk)
+            self.chunk_delivered += rows - skipped
+        return True
+
+    async def deliver(self, new_batch) -> None:
+        """
+        Hands a batch over to the queue, a batch shorter than batch_unit being the last one of the source
+
+        :param new_batch:
+        """
         if len(new_batch.data) < self.rfw["batch_unit"]:
-            self.batch_rcv = self.rfw["batch_size"]
+            self.end_of_data = True
         await self.queue.put(new_batch)
+
+    async def open_ring(self) -> None:
+        """
+        Asks the server for a shared memory ring if the address is shm+unix:// and the connection has none yet,
+        batches being read from the socket if the server declines
+        """
+        self.ring = None
+        if not transport.wants_ring(self.host):
+            return
+        self.ring = transport.get_ring(self.writer)
+        if self.ring is not None or transport.ring_declined(self.writer):
+            return
+
+        await self.send_request(SHM_MARKER, struct.pack(SHM_REQUEST_FORMAT, transport.RING_SIZE))
+        try:
+            header = await self.reader.readexactly(RFD_HEADER_SIZE)
+            (marker, _, _, _, payload_size) = struct.unpack(RFD_HEADER_FORMAT, header)
+            if marker.decode() == SHM_MARKER:
+                name = (await self.reader.readexactly(payload_size)).decode()
+                self.ring = transport.attach_ring(self.writer, name)
+                return
+        except (asyncio.IncompleteReadError, UnicodeDecodeError, OSError) as err:
+            logging.warning(f"RFW#{self.rfw_id} - Unable to map the shared memory of the server: {err!r}")
+            transport.decline_ring(self.writer)
+            return
+        transport.decline_ring(self.writer)
+        logging.warning(f"RFW#{self.rfw_id} - Server declined shared memory, receiving batches from the socket")
+
+    async def get_version(self) -> Optional[str]:
+        """
+
+        :return: dataset version of the server, None if the server did not send one
+        """
+        await self.send_request(VERSION_MARKER, b"")
+        try:
+            header = await self.reader.readexactly(RFD_HEADER_SIZE)
+            (marker, _, _, _, payload_size) = struct.unpack(RFD_HEADER_FORMAT, header)
+            if marker.decode() != VERSION_MARKER:
+                return None
+            return (await self.reader.readexactly(payload_size)).decode()
+        except (asyncio.IncompleteReadError, UnicodeDecodeError):
+            return None
+
+    async def get_cached_replies(self) -> bool:
+        """
+        Delivers the batches found in the cache and requests each range of missing batches from the server
+
+        :return: True if every batch was received
+        """
+        self.version = await self.get_version()
+        if self.version is None:
+            logging.warning(f"RFW#{self.rfw_id} - Unable to get the dataset version, cache disabled")
+            await self.send_rfw()
+            return await self.get_replies()
+
+        curr_batch_id = self.rfw["batch_id"]
+        end_batch_id = curr_batch_id + self.rfw["batch_size"]
+        while curr_batch_id < end_batch_id and not self.end_of_data:
+            payload = await self.cache.get(self.cache_key(curr_batch_id))
+            if payload is not None:
+                header = rfd_header(last_batch=curr_batch_id, protocol=self.protocol, payload_size=len(payload))
+                new_batch = await self.decode_rfd(header, payload)
+                if new_batch is not None:
+                    await self.deliver(new_batch)
+                    self.batch_count += 1
+                    curr_batch_id += 1
+                    continue
+
+            missing_end = curr_batch_id + 1
+            while missing_end < end_batch_id and self.cache_key(missing_end) not in self.cache:
+                missing_end += 1
+            logging.info(f"RFW#{self.rfw_id} - Batches {curr_batch_id} to {missing_end - 1} not cached")
+            self.cache.misses += missing_end - curr_batch_id
+            self.rfw["batch_id"], self.rfw["batch_size"] = curr_batch_id, missing_end - curr_batch_id
+            self.batch_rcv = 0
+            await self.send_rfw()
+            if not await self.get_replies():
+                return False
+            curr_batch_id = missing_end
+
+        logging.info(f"RFW#{self.rfw_id} - All batches received")
         return True
 
-    async def receive_protobuf_rfd(self, header: rfd_header) -> bool:
+    def cache_key(self, batch_id: int) -> str:
+        return BatchCache.key(self.version, self.rfw["bench_type"], self.rfw["wl_metrics"], self.rfw["batch_unit"],
+                              batch_id, self.protocol, self.rfw.get("filter", ""))
+
+    async def store(self, header: rfd_header, payload: bytes) -> None:
+        """Caches the raw payload of a batch received from the server"""
+        if self.cache is not None and self.version is not None and header.protocol == self.protocol:
+            await self.cache.put(self.cache_key(header.last_batch), payload)
+
+    async def read_payload(self, header: rfd_header) -> Optional[bytes]:
         """
 
         :param header:
-        :return:
+        :return: payload or None if the connection was closed
         """
         try:
             payload = await self.reader.readexactly(header.payload_size)
+            self.bytes_rcv += RFD_HEADER_SIZE + len(payload)
+            return payload
         except asyncio.IncompleteReadError:
             logging.error(f"Connection with server closed before receiving payload")
-            return False
+            return None
+
+    async def decode_rfd(self, header: rfd_header, payload: bytes, final: bool = True) -> Optional[batch]:
+        """
+        Decodes an RFD payload into a batch of rows, or a ColumnBatch with the numpy decode path
 
-        decoded_rfd = workload_protocol_pb2.ProtoRfd()
+        :param header:
+        :param payload:
+        :param final: False for a chunk followed by more rows of the same batch
+        :return: decoded batch or None if the payload is invalid
+        """
+        start = time.perf_counter()
         try:
-            decoded_rfd.ParseFromString(payload)
-        except DecodeError:
+            (keys, data) = await codec.decode_rfd(header.protocol, payload, self.decode)
+        except ValueError:
             logging.error("Unable to decode received data from the server")
-            return False
+            return None
+
+        if self.decode == "numpy":
+            new_batch = ColumnBatch(rfw_id=self.rfw_id,
+                                    bench_type=self.rfw["bench_type"],
+                                    batch_id=header.last_batch,
+                                    keys=keys,
+                                    columns=data,
+                                    final=final)
+        else:
+            new_batch = batch(rfw_id=self.rfw_id,
+                              bench_type=self.rfw["bench_type"],
+                              batch_id=header.last_batch,
+                              keys=keys,
+                              data=data,
+                              final=final)
 
-        keys = decoded_rfd.keys
-        new_batch = batch(rfw_id=self.rfw_id,
-                          bench_type=self.rfw["bench_type"],
-                          batch_id=header.last_batch,
-                          keys=keys,
-                          data=[[getattr(workload, key) for key in keys] for workload in decoded_rfd.workload])
+        self.record_decode(new_batch, start)
+        return new_batch
 
-        if len(decoded_rfd.workload) < self.rfw["batch_unit"]:
-            self.batch_rcv = self.rfw["batch_size"]
-        await self.queue.put(new_batch)
-        return True
+    def record_decode(self, new_batch, start: float) -> None:
+        """
+        Accounts for the decode time and memory of a batch, memory being measured outside the timed section
+
+        :param new_batch: decoded batch
+        :param start: perf_counter value when decoding started
+        """
+        self.decode_time += time.perf_counter() - start
+        self.rows_rcv += len(new_batch.data)
+        self.batch_memory += batch_memory(new_batch)
 
     def create_proto_rfw(self) -> workload_protocol_pb2.ProtoRfw:
         proto_rfw = workload_protocol_pb2.ProtoRfw()
@@ -259,15 +561,47 @@ class RfwTcpClient:
         proto_rfw.batch_unit = self.rfw["batch_unit"]
         proto_rfw.batch_id = self.rfw["batch_id"]
         proto_rfw.batch_size = self.rfw["batch_size"]
+        if "chunk_rows" in self.rfw:
+            proto_rfw.chunk_rows = self.rfw["chunk_rows"]
+        if "filter" in self.rfw:
+            proto_rfw.filter = self.rfw["filter"]
+        if "credit" in self.rfw:
+            proto_rfw.credit = self.rfw["credit"]
+        if "priority" in self.rfw:
+            proto_rfw.priority = self.rfw["priority"]
         return proto_rfw
 
     async def reopen_connection(self):
+        """
+        Reconnects to the server after a jittered exponential backoff and requests the batches not received yet
+
+        :return:
+        """
         if self.writer is not None:
             self.writer.close()
-            await self.writer.wait_closed()
-        (reader, writer) = await asyncio.open_connection(HOST, PORT)
-        self.reader, self.writer = reader, writer
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
         self.rfw["batch_size"] -= self.batch_rcv
         self.rfw["batch_id"] += self.batch_rcv
         self.batch_rcv = 0
+
+        while True:
+            await asyncio.sleep(self.backoff())
+            try:
+                (reader, writer) = await transport.open_connection(self.host, self.port)
+                break
+            except OSError as err:
+                self.retries -= 1
+                if self.retries <= 0:
+                    raise
+                logging.warning(f"RFW#{self.rfw_id} - Unable to reconnect to {self.host}:{self.port}: {err}")
+        self.reader, self.writer = reader, writer
+        await self.open_ring()
         await self.send_rfw()
+
+    def backoff(self) -> float:
+        """Returns a delay drawn uniformly up to an exponentially growing cap, based on the retries used"""
+        attempt = max(0, MAX_FAIL - self.retries)
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
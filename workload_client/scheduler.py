@@ -0,0 +1,212 @@
+from typing import Iterable, List, Optional, Set, Union
+from collections import namedtuple
+import logging
+import asyncio
+import random
+import time
+import os
+from workload_client.rfw_tcp_client import RfwTcpClient, DECODE, DEFAULT_PRIORITY
+from workload_client.connection_pool import ConnectionPool
+from workload_client.sinks import BatchSink
+from workload_client.checkpoint import Checkpoint, CHECKPOINT_FOLDER
+from workload_client.batch_cache import BatchCache
+from workload_client.range_split import SplitRfw
+
+MAX_IN_FLIGHT = 32
+PROGRESS_EVERY = 100
+
+result = namedtuple("RESULT", ["rfw_id", "success", "latency", "batches", "bytes", "rows", "decode_time", "memory"])
+
+
+class RfwScheduler:
+    """
+    Dispatches RFWs with at most max_in_flight of them running at once, over pooled connections
+
+    Requests are pulled from the iterable only when a slot frees up, so arbitrarily long request files are
+    never loaded in memory.
+    """
+    def __init__(self,
+                 queue: asyncio.Queue,
+                 host: str,
+                 port: int,
+                 max_in_flight: int = MAX_IN_FLIGHT,
+                 pool: Optional[ConnectionPool] = None,
+                 progress_every: int = PROGRESS_EVERY,
+                 sink: Optional[BatchSink] = None,
+                 resume: bool = False,
+                 decode: str = DECODE,
+                 cache: Optional[BatchCache] = None,
+                 chunk_rows: int = 0,
+                 credit: int = 0,
+                 priority: int = DEFAULT_PRIORITY,
+                 split: int = 1
+                 ) -> None:
+        """
+
+        :param queue: queue receiving the batches
+        :param host:
+        :param port:
+        :param max_in_flight: maximum number of RFWs running at once
+        :param pool: pool of connections shared by the RFWs
+        :param progress_every: number of completed RFWs between progress reports
+        :param sink: sink writing the batches, told where each RFW starts and ends
+        :param resume: record the batches written by the sink in checkpoints, and skip the requests and batches
+                       already written according to them
+        :param decode: decode path of the clients, "list" or "numpy"
+        :param cache: batch cache shared by the clients
+        :param chunk_rows: have batches streamed in chunks of at most this many rows, 0 for whole batches
+        :param credit: batches, or chunks, the server may send to an RFW ahead of the sink, 0 for no limit
+        :param priority: index in PRIORITIES of the class the server schedules the batches of the RFWs in
+        :param split: number of connections each RFW is fetched over, its batches being reassembled in order
+                      by the sink
+        """
+        self.queue = queue
+        self.host = host
+        self.port = port
+        self.max_in_flight = max_in_flight
+        self.pool = pool if pool is not None else ConnectionPool(max_idle=max_in_flight)
+        self.progress_every = progress_every
+        self.sink = sink
+        self.resume = resume
+        self.decode = decode
+        self.cache = cache
+        self.chunk_rows = chunk_rows
+        self.credit = credit
+        self.priority = priority
+        self.split = split
+        self.results: List[result] = []
+        self.started = 0
+        self.skipped = 0
+        self.start_time = None
+
+    async def run(self, requests: Iterable) -> None:
+        """
+        Coroutine dispatching every request and waiting for all of them to complete
+
+        :param requests: iterable of requests with the fields of an RFW
+        """
+        random.seed()
+        self.start_time = time.perf_counter()
+        slots = asyncio.Semaphore(self.max_in_flight)
+        in_flight: Set[asyncio.Task] = set()
+
+        def done(task: asyncio.Task) -> None:
+            in_flight.discard(task)
+            slots.release()
+            if not task.cancelled() and task.exception() is not None:
+                # Retrieved here as the task is no longer gathered once it is done
+                logging.error(f"RFW failed before it could run: {task.exception()!r}")
+
+        for r in requests:
+            await slots.acquire()
+            task = asyncio.create_task(self.fetch(r))
+            in_flight.add(task)
+            task.add_done_callback(done)
+            self.started += 1
+
+        await asyncio.gather(*in_flight)
+        self.report()
+
+    def create_client(self, r, rfw_id: int) -> Union[RfwTcpClient, SplitRfw]:
+        if self.split > 1 and r.batch_size > 1:
+            return SplitRfw(self.queue, rfw_id, r.batch_id, r.batch_size, r.batch_unit, self.split,
+                            lambda queue, range_id, batch_id, batch_size: self.create_tcp_client(
+                                r._replace(batch_id=batch_id, batch_size=batch_size), range_id, queue))
+        return self.create_tcp_client(r, rfw_id, self.queue)
+
+    def create_tcp_client(self, r, rfw_id: int, queue) -> RfwTcpClient:
+        return RfwTcpClient(queue=queue,
+                            rfw_id=rfw_id,
+                            protocol=r.protocol,
+                            bench_type=r.bench_type,
+                            metrics=r.metrics,
+                            batch_unit=r.batch_unit,
+                            batch_id=r.batch_id,
+                            batch_size=r.batch_size,
+                            host=self.host,
+                            port=self.port,
+                            pool=self.pool,
+                            decode=self.decode,
+                            cache=self.cache,
+                            chunk_rows=self.chunk_rows,
+                            filter_expr=getattr(r, "filter", ""),
+                            credit=self.credit,
+                            priority=self.priority)
+
+    async def fetch(self, r) -> None:
+        """
+        Coroutine running a single RFW and recording its outcome
+
+        :param r: request with the fields of an RFW
+        """
+        rfw_id = random.getrandbits(32)
+        checkpoint = None
+        if self.sink is not None and self.resume:
+            # Checkpoints are only kept by runs which can be resumed, so the others write nothing but their outputs
+            folder = os.path.join(CHECKPOINT_FOLDER, self.sink.name)
+            checkpoint = Checkpoint.load(r, folder)
+            if checkpoint is None:
+                checkpoint = Checkpoint.create(r, rfw_id, folder)
+            elif checkpoint.done:
+                self.skipped += 1
+                return
+            else:
+                # Outputs are named after the RFW ID, so the resumed RFW appends to the same ones
+                rfw_id = checkpoint.rfw_id
+                first_batch = checkpoint.next_batch(r.batch_id)
+                logging.info(f"RFW#{rfw_id} - Resuming from batch {first_batch}")
+                r = r._replace(batch_id=first_batch, batch_size=r.batch_id + r.batch_size - first_batch)
+
+        client = self.create_client(r, rfw_id)
+        if self.sink is not None:
+            self.sink.register(client.rfw_id, r.bench_type, r.batch_id, checkpoint)
+        start = time.perf_counter()
+        try:
+            success = await client.run() if r.batch_size > 0 else True
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            # Whatever ends the RFW, like a truncated or undecodable frame, only fails this RFW
+            logging.error(f"RFW#{client.rfw_id} - Failed: {err!r}")
+            success = False
+        if self.sink is not None:
+            self.sink.finish(client.rfw_id, client.batch_count, success)
+        self.results.append(result(rfw_id=client.rfw_id,
+                                   success=success,
+                                   latency=time.perf_counter() - start,
+                                   batches=client.batch_count,
+                                   bytes=client.bytes_rcv,
+                                   rows=client.rows_rcv,
+                                   decode_time=client.decode_time,
+                                   memory=client.batch_memory))
+
+        if len(self.results) % self.progress_every == 0:
+            print(f"{len(self.results)} RFWs completed, {self.started - len(self.results)} in flight")
+
+    def report(self) -> None:
+        """Prints the latency and throughput of the RFWs run so far"""
+        elapsed = time.perf_counter() - self.start_time
+        if not self.results:
+            print(f"No RFW run, {self.skipped} already complete")
+            return
+        failed = sum(1 for r in self.results if not r.success)
+        latencies = sorted(r.latency for r in self.results)
+        batches = sum(r.batches for r in self.results)
+        received = sum(r.bytes for r in self.results)
+        print(f"{len(self.results)} RFWs in {elapsed:.2f}s, {failed} failed, {self.skipped} already complete, "
+              f"{self.pool.opened} connections opened, {self.pool.reused} reused")
+        print(f"Latency: mean {sum(latencies) / len(latencies) * 1000:.1f} ms, "
+              f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms, "
+              f"max {latencies[-1] * 1000:.1f} ms")
+        print(f"Throughput: {len(self.results) / elapsed:.1f} RFW/s, {batches / elapsed:.1f} batches/s, "
+              f"{received / elapsed / 1e6:.2f} MB/s")
+
+        if self.cache is not None:
+            print(f"Cache: {self.cache.hits} hits, {self.cache.misses} misses, {self.cache.size / 1e6:.2f} MB")
+
+        rows = sum(r.rows for r in self.results)
+        decode_time = sum(r.decode_time for r in self.results)
+        if batches > 0 and decode_time > 0:
+            print(f"Decode ({self.decode}): {rows / decode_time:.0f} rows/s, "
+                  f"{sum(r.memory for r in self.results) / batches / 1e3:.1f} kB per batch")
@@ -0,0 +1,350 @@
+from typing import Optional, Dict, List, Set
+import logging
+import threading
+import queue
+import struct
+import array
+import time
+import sys
+import csv
+import io
+import os
+from workload_client.async_filewriter import BATCHES_FOLDER
+from workload_client.checkpoint import Checkpoint
+from workload_client.column_batch import DTYPES
+from workload_client import flow_control
+
+BUFFER_SIZE = 1 << 20
+CHECKPOINT_EVERY = 16
+
+NPY_HEADER_SIZE = 128
+
+
+class RfwStream:
+    """Output state of a single RFW inside a sink"""
+    def __init__(self, rfw_id: int, source: str, next_batch: Optional[int],
+                 checkpoint: Optional[Checkpoint] = None) -> None:
+        """
+
+        :param rfw_id:
+        :param source:
+        :param next_batch: id of the first batch to write, None to write batches in arrival order
+        :param checkpoint: checkpoint recording the batches written, resumed from if it holds a position
+        """
+        self.rfw_id = rfw_id
+        self.source = source
+        self.next_batch = next_batch
+        self.checkpoint = checkpoint
+        self.pending: Dict[int, List] = {}
+        self.output = None
+        self.written = 0
+        self.unrecorded = 0
+        self.last_batch: Optional[int] = None
+        self.expected: Optional[int] = None
+        self.complete = False
+        self.failed = False
+        self.bytes = 0
+
+
+class BatchSink:
+    """
+    Base class of the sinks writing batches from a dedicated writer thread
+
+    Batches of a registered RFW are written in batch_id order whatever order they are submitted in,
+    batches of unregistered RFWs are written in arrival order. A batch may arrive as several chunks,
+    written as they come and counted once its final chunk is written. Subclasses implement open_stream,
+    write_batch and close_stream, which are only ever called from the writer thread. An RFW whose output
+    fails to be written is given up, its later batches dropped, and reported when the sink is closed.
+    """
+    name = ""
+
+    def __init__(self, folder: str = BATCHES_FOLDER) -> None:
+        """
+
+        :param folder: directory the outputs are written to
+        """
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.commands = queue.Queue()
+        self.streams: Dict[int, RfwStream] = {}
+        self.failed: Set[int] = set()
+        self.bytes_written = 0
+        self.start_time = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+        self.thread.start()
+
+    def register(self, rfw_id: int, source: str, first_batch: int, checkpoint: Optional[Checkpoint] = None) -> None:
+        """
+        Declares an RFW whose batches must be written in order starting at first_batch
+
+        :param rfw_id:
+        :param source:
+        :param first_batch: id of the first batch of the RFW
+        :param checkpoint: checkpoint to record the written batches in
+        """
+        self.commands.put(("register", rfw_id, source, first_batch, checkpoint))
+
+    def submit(self, new_batch) -> None:
+        """Queues a batch to be written, never blocks the caller"""
+        self.commands.put(("batch", new_batch))
+
+    def finish(self, rfw_id: int, batches: int, complete: bool = False) -> None:
+        """
+        Declares how many batches the RFW produced, its output is closed once they are all written
+
+        :param rfw_id:
+        :param batches: number of batches submitted for the RFW
+        :param complete: True if the RFW received all its batches, which completes its checkpoint
+        """
+        self.commands.put(("finish", rfw_id, batches, complete))
+
+    def close(self) -> None:
+        """Writes every queued batch, closes all outputs and reports the write throughput"""
+        self.commands.put(None)
+        self.thread.join()
+        elapsed = time.perf_counter() - self.start_time
+        print(f"{self.bytes_written / 1e6:.2f} MB written in {elapsed:.2f}s "
+              f"({self.bytes_written / elapsed / 1e6:.2f} MB/s)")
+        if self.failed:
+            print(f"{len(self.failed)} RFWs failed to be written: {', '.join(map(str, sorted(self.failed)))}")
+
+    def run(self) -> None:
+        """Writer thread loop"""
+        while True:
+            command = self.commands.get()
+            if command is None:
+                break
+            rfw_id = command[1].rfw_id if command[0] == "batch" else command[1]
+            try:
+                if command[0] == "batch":
+                    try:
+                        self.on_batch(command[1])
+                    finally:
+                        # Batches held until an earlier one arrives count too, the server sends in order
+                        flow_control.consumed(command[1].rfw_id)
+                elif command[0] == "register":
+                    (_, rfw_id, source, first_batch, checkpoint) = command
+                    self.streams.setdefault(rfw_id, RfwStream(rfw_id, source, first_batch, checkpoint))
+                elif command[0] == "finish" and command[1] in self.streams:
+                    stream = self.streams[command[1]]
+                    (_, _, stream.expected, stream.complete) = command
+                    if stream.written >= stream.expected or stream.failed:
+                        self.end_stream(stream)
+                        del self.streams[stream.rfw_id]
+            except Exception:
+                logging.exception(f"RFW#{rfw_id} - Unable to write batch")
+                self.fail(rfw_id)
+
+        for stream in list(self.streams.values()):
+            try:
+                self.end_stream(stream)
+            except Exception:
+                logging.exception(f"RFW#{stream.rfw_id} - Unable to close output")
+                self.fail(stream.rfw_id)
+        self.streams.clear()
+
+    def fail(self, rfw_id: int) -> None:
+        """Gives up the output of an RFW after an error, its checkpoint staying at the last flushed batch"""
+        self.failed.add(rfw_id)
+        stream = self.streams.get(rfw_id)
+        if stream is not None:
+            stream.failed = True
+            stream.pending.clear()
+            if stream.expected is not None:
+                self.end_stream(self.streams.pop(rfw_id))
+
+    def on_batch(self, new_batch) -> None:
+        stream = self.streams.get(new_batch.rfw_id)
+        if stream is None:
+            stream = self.streams[new_batch.rfw_id] = RfwStream(new_batch.rfw_id, new_batch.bench_type, None)
+
+        if stream.failed:
+            return
+        if stream.next_batch is None:
+            self.write(stream, new_batch)
+            return
+
+        stream.pending.setdefault(new_batch.batch_id, []).append(new_batch)
+        while stream.next_batch in stream.pending:
+            chunks = stream.pending[stream.next_batch]
+            for chunk in chunks:
+                self.write(stream, chunk)
+            if not chunks or not chunks[-1].final:
+                # Chunks written so far are dropped, the batch stays pending until its final chunk
+                chunks.clear()
+                break
+            del stream.pending[stream.next_batch]
+            stream.next_batch += 1
+
+        if stream.expected is not None and stream.written >= stream.expected:
+            # Only forgotten once ended, so an error closing the output still finds the stream to give up
+            self.end_stream(stream)
+            del self.streams[stream.rfw_id]
+
+    def end_stream(self, stream: RfwStream) -> None:
+        if stream.failed:
+            # Output is closed as it is, a resumed run truncating it back to the checkpoint
+            if stream.output is not None:
+                try:
+                    self.close_stream(stream)
+                except Exception:
+                    logging.exception(f"RFW#{stream.rfw_id} - Unable to close output")
+            if stream.checkpoint is not None:
+                stream.checkpoint.close()
+            return
+        # Batches still pending after a gap are written in order rather than lost, unless a checkpoint
+        # can have them fetched again in order by a resumed run
+        if stream.checkpoint is None:
+            for batch_id in sorted(stream.pending):
+                for chunk in stream.pending.pop(batch_id):
+                    self.write(stream, chunk)
+        if stream.output is not None:
+            if stream.checkpoint is not None and stream.unrecorded > 0:
+                stream.checkpoint.written(stream.last_batch, self.flush_stream(stream))
+            self.close_stream(stream)
+        if stream.checkpoint is not None:
+            if stream.complete:
+                stream.checkpoint.complete()
+            else:
+                stream.checkpoint.close()
+
+    def write(self, stream: RfwStream, new_batch) -> None:
+        if stream.output is None:
+            self.open_stream(stream, new_batch)
+        written = self.write_batch(stream, new_batch)
+        stream.bytes += written
+        self.bytes_written += written
+        if not new_batch.final:
+            return
+        stream.written += 1
+
+        stream.last_batch = new_batch.batch_id
+        stream.unrecorded += 1
+        if stream.checkpoint is not None and stream.unrecorded >= CHECKPOINT_EVERY:
+            # Batches are only recorded once flushed so a checkpoint never points past the file
+            stream.checkpoint.written(stream.last_batch, self.flush_stream(stream))
+            stream.unrecorded = 0
+
+    def open_stream(self, stream: RfwStream, new_batch) -> None:
+        raise NotImplementedError
+
+    def write_batch(self, stream: RfwStream, new_batch) -> int:
+        raise NotImplementedError
+
+    def flush_stream(self, stream: RfwStream) -> str:
+        """Flushes the output of the stream and returns its position, as recorded in checkpoints"""
+        raise NotImplementedError
+
+    def close_stream(self, stream: RfwStream) -> None:
+        raise NotImplementedError
+
+    @staticmethod
+    def resume_position(stream: RfwStream) -> Optional[str]:
+        """Returns the output position to resume the stream from, None to start a new output"""
+        if stream.checkpoint is not None:
+            return stream.checkpoint.position
+        return None
+
+
+class CsvSink(BatchSink):
+    """Appends every batch of an RFW to a single {rfw_id}-{source}.csv file behind a large write buffer"""
+    name = "csv"
+
+    def open_stream(self, stream: RfwStream, new_batch) -> None:
+        filename = os.path.join(self.folder, f"{stream.rfw_id}-{stream.source}.csv")
+        position = self.resume_position(stream)
+        if position is not None and os.path.exists(filename):
+            # Anything written after the last checkpoint was not recorded and is written again
+            os.truncate(filename, int(position))
+            stream.output = io.open(filename, "a", buffering=BUFFER_SIZE, newline="")
+            stream.writer = csv.writer(stream.output, lineterminator="\n")
+        else:
+            stream.output = io.open(filename, "w", buffering=BUFFER_SIZE, newline="")
+            stream.writer = csv.writer(stream.output, lineterminator="\n")
+            stream.writer.writerow(new_batch.keys)
+
+    def write_batch(self, stream: RfwStream, new_batch) -> int:
+        start = stream.output.tell()
+        stream.writer.writerows(new_batch.data)
+        return stream.output.tell() - start
+
+    def flush_stream(self, stream: RfwStream) -> str:
+        stream.output.flush()
+        return str(stream.output.tell())
+
+    def close_stream(self, stream: RfwStream) -> None:
+        stream.output.close()
+
+
+class NpySink(BatchSink):
+    """
+    Writes every column of an RFW to its own .npy file in a {rfw_id}-{source} directory
+
+    Each batch costs a single bulk write per column. The header of each file is rewritten with the
+    final shape when the RFW is finished.
+    """
+    name = "npy"
+
+    def open_stream(self, stream: RfwStream, new_batch) -> None:
+        directory = os.path.join(self.folder, f"{stream.rfw_id}-{stream.source}")
+        os.makedirs(directory, exist_ok=True)
+        position = self.resume_position(stream)
+        stream.output = {}
+        stream.dtypes = {}
+        stream.rows = int(position) if position is not None else 0
+        for key in new_batch.keys:
+            # Types come from the metric definitions, the first batch may be empty or hold integral floats
+            stream.dtypes[key] = "d" if DTYPES.get(key, "<f8") == "<f8" else "q"
+            filename = os.path.join(directory, f"{key}.npy")
+            if position is not None and os.path.exists(filename):
+                os.truncate(filename, NPY_HEADER_SIZE + stream.rows * 8)
+                column_file = io.open(filename, "r+b", buffering=BUFFER_SIZE)
+                column_file.seek(0, os.SEEK_END)
+            else:
+                column_file = io.open(filename, "wb", buffering=BUFFER_SIZE)
+                column_file.write(self.npy_header(stream.dtypes[key], 0))
+            stream.output[key] = column_file
+
+    def write_batch(self, stream: RfwStream, new_batch) -> int:
+        written = 0
+        columns = getattr(new_batch, "columns", None)
+        for i, key in enumerate(new_batch.keys):
+            if columns is not None:
+                # Arrays of a ColumnBatch are written as they are, only converted if their dtype differs
+                written += stream.output[key].write(
+                    columns[i].astype("<f8" if stream.dtypes[key] == "d" else "<i8", copy=False).tobytes())
+                continue
+            column = array.array(stream.dtypes[key], [row[i] for row in new_batch.data])
+            if sys.byteorder != "little":
+                column.byteswap()
+            written += stream.output[key].write(column.tobytes())
+        stream.rows += len(new_batch.data)
+        return written
+
+    def flush_stream(self, stream: RfwStream) -> str:
+        for column_file in stream.output.values():
+            column_file.flush()
+        return str(stream.rows)
+
+    def close_stream(self, stream: RfwStream) -> None:
+        for key, column_file in stream.output.items():
+            column_file.seek(0)
+            column_file.write(self.npy_header(stream.dtypes[key], stream.rows))
+            column_file.close()
+
+    @staticmethod
+    def npy_header(typecode: str, rows: int) -> bytes:
+        """
+        Builds a fixed size .npy version 1.0 header so it can be rewritten in place once the row count is known
+
+        :param typecode: array typecode of the column, "q" or "d"
+        :param rows: number of rows in the file
+        :return: header of NPY_HEADER_SIZE bytes
+        """
+        descr = "<f8" if typecode == "d" else "<i8"
+        header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({rows},), }}"
+        header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + "\n"
+        return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+SINKS = {sink.name: sink for sink in (CsvSink, NpySink)}
@@ -0,0 +1,86 @@
+from typing import Dict, List, Optional
+from google.protobuf.message import DecodeError
+import json
+import random
+import struct
+import asyncio
+import workload_protocol_pb2
+from workload_client import transport
+from workload_client.rfw_tcp_client import RFW_HEADER_FORMAT, RFD_HEADER_FORMAT, RFD_HEADER_SIZE
+
+STATS_MARKER = "STA"
+SUMMARY_FIELDS = ("min", "max", "mean", "stddev", "p50", "p90", "p95", "p99")
+
+
+async def fetch_stats(host: str, port: int, protocol: str, bench_type: str, batch_unit: int = 0,
+                      row_offset: int = 0, row_count: int = 0) -> Optional[List[Dict]]:
+    """
+    Asks the server for the precomputed statistics of the sources starting with bench_type
+
+    :param host: address of the server, see transport.open_connection
+    :param port: port of the server
+    :param protocol: JSON or BUFF
+    :param bench_type: prefix of the sources
+    :param batch_unit: batch_unit to count the batches of, 0 to leave them out
+    :param row_offset: index of the first row of each source to summarize
+    :param row_count: number of rows to summarize, 0 for every row from row_offset
+    :return: statistics of each source as sent in JSON, None if the server rejected the request
+    """
+    request = {"bench_type": bench_type, "batch_unit": batch_unit, "row_offset": row_offset, "row_count": row_count}
+    if protocol == "BUFF":
+        serialized = workload_protocol_pb2.ProtoStatsRequest(**request).SerializeToString()
+    else:
+        serialized = bytes(json.dumps(request).encode("utf-8"))
+
+    (reader, writer) = await transport.open_connection(host, port)
+    try:
+        writer.write(struct.pack(RFW_HEADER_FORMAT, bytes(STATS_MARKER.encode("utf-8")), random.getrandbits(32),
+                                 bytes(protocol.encode("utf-8")), len(serialized)) + serialized)
+        await writer.drain()
+        header = await reader.readexactly(RFD_HEADER_SIZE)
+        (marker, _, _, _, payload_size) = struct.unpack(RFD_HEADER_FORMAT, header)
+        if marker.decode() != STATS_MARKER:
+            return None
+        payload = await reader.readexactly(payload_size)
+    finally:
+        writer.close()
+
+    try:
+        if protocol == "BUFF":
+            return decode_proto_stats(payload)
+        return json.loads(payload)["sources"]
+    except (DecodeError, json.JSONDecodeError, KeyError):
+        return None
+
+
+def decode_proto_stats(payload: bytes) -> List[Dict]:
+    """Converts a serialized ProtoStats to the layout of the JSON reply"""
+    proto_stats = workload_protocol_pb2.ProtoStats()
+    proto_stats.ParseFromString(payload)
+    sources = []
+    for proto_source in proto_stats.sources:
+        columns = {}
+        for proto_column in proto_source.columns:
+            columns[proto_column.name] = {field: getattr(proto_column, field) for field in SUMMARY_FIELDS
+                                          if proto_column.HasField(field)}
+        sources.append({"source": proto_source.source,
+                        "rows": proto_source.rows,
+                        "batches": proto_source.batches if proto_source.HasField("batches") else None,
+                        "row_offset": proto_source.row_offset,
+                        "row_count": proto_source.row_count,
+                        "columns": columns})
+    return sources
+
+
+def format_stats(sources: List[Dict]) -> str:
+    """Lays the statistics of each source out as a table of its columns"""
+    lines = []
+    for stats in sources:
+        batches = f", {stats['batches']} batches" if stats["batches"] is not None else ""
+        lines.append(f"{stats['source']}: {stats['rows']} rows{batches}, "
+                     f"rows {stats['row_offset']} to {stats['row_offset'] + stats['row_count']}")
+        fields = [field for field in SUMMARY_FIELDS if any(field in summary for summary in stats["columns"].values())]
+        lines.append(f"  {'column':<8}" + "".join(f"{field:>14}" for field in fields))
+        for (column, summary) in stats["columns"].items():
+            lines.append(f"  {column:<8}" + "".join(f"{summary[field]:>14.6g}" for field in fields))
+    return "\n".join(lines)
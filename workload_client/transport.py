@@ -0,0 +1,103 @@
+from typing import Optional, Tuple
+import weakref
+import asyncio
+import struct
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    shared_memory = None
+
+UNIX_SCHEME = "unix://"
+SHM_SCHEME = "shm+unix://"
+
+RING_SIZE = 64 << 20
+# Must match the layout written by the server, see workload_server.shm_ring
+RING_HEADER_FORMAT = "<Q"
+RING_HEADER_SIZE = 64
+DESCRIPTOR_FORMAT = "!QQQ"
+DESCRIPTOR_SIZE = struct.calcsize(DESCRIPTOR_FORMAT)
+
+connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+_rings: "weakref.WeakKeyDictionary[asyncio.StreamWriter, RingReader]" = weakref.WeakKeyDictionary()
+# Connections whose server declined to share memory, so pooled connections do not ask again
+_declined: "weakref.WeakSet[asyncio.StreamWriter]" = weakref.WeakSet()
+
+
+class RingReader:
+    """Client side of the shared memory ring the server places the payloads of a connection in"""
+    def __init__(self, name: str) -> None:
+        """
+
+        :param name: name of the shared memory block created by the server
+        """
+        try:
+            self.block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            self.block = shared_memory.SharedMemory(name=name)
+            # Before Python 3.13 attaching registers the block with the resource tracker, which would unlink it
+            # when this process exits although the server owns it
+            resource_tracker.unregister(self.block._name, "shared_memory")
+
+    def read(self, descriptor: bytes) -> bytes:
+        """
+        Copies a payload out of the ring and releases its space to the server
+
+        :param descriptor: descriptor of the payload sent by the server
+        :return: payload
+        """
+        (offset, length, release) = struct.unpack(DESCRIPTOR_FORMAT, descriptor)
+        start = RING_HEADER_SIZE + offset
+        payload = bytes(self.block.buf[start:start + length])
+        struct.pack_into(RING_HEADER_FORMAT, self.block.buf, 0, release)
+        return payload
+
+    def close(self) -> None:
+        self.block.close()
+
+
+def is_unix(host: str) -> bool:
+    return host.startswith(UNIX_SCHEME) or host.startswith(SHM_SCHEME)
+
+
+def wants_ring(host: str) -> bool:
+    """Returns True if the address asks for batches to be sent through shared memory"""
+    return host.startswith(SHM_SCHEME) and shared_memory is not None
+
+
+def socket_path(host: str) -> str:
+    return host[len(SHM_SCHEME):] if host.startswith(SHM_SCHEME) else host[len(UNIX_SCHEME):]
+
+
+async def open_connection(host: str, port: int) -> connection:
+    """
+    Opens a connection to the server over TCP, or over a Unix domain socket for unix:// and shm+unix:// addresses
+
+    :param host: IP address or name, or unix:///path/of/socket
+    :param port: TCP port, ignored for Unix domain sockets
+    :return: reader and writer of the connection
+    """
+    if is_unix(host):
+        return await asyncio.open_unix_connection(socket_path(host))
+    return await asyncio.open_connection(host, port)
+
+
+def attach_ring(writer: asyncio.StreamWriter, name: str) -> "RingReader":
+    """Maps the ring of a connection, which is unmapped once the connection is garbage collected"""
+    ring = RingReader(name)
+    _rings[writer] = ring
+    weakref.finalize(writer, ring.close)
+    return ring
+
+
+def get_ring(writer: asyncio.StreamWriter) -> Optional[RingReader]:
+    return _rings.get(writer)
+
+
+def decline_ring(writer: asyncio.StreamWriter) -> None:
+    _declined.add(writer)
+
+
+def ring_declined(writer: asyncio.StreamWriter) -> bool:
+    return writer in _declined
@@ -1,12 +1,10 @@
 # -*- coding: utf-8 -*-
 # Generated by the protocol buffer compiler.  DO NOT EDIT!
 # source: workload_protocol.proto
-
-import sys
-_b=sys.version_info[0]<3 and (lambda x:x) or (lambda x:x.encode('latin1'))
+"""Generated protocol buffer code."""
+from google.protobuf.internal import builder as _builder
 from google.protobuf import descriptor as _descriptor
-from google.protobuf import message as _message
-from google.protobuf import reflection as _reflection
+from google.protobuf import descriptor_pool as _descriptor_pool
 from google.protobuf import symbol_database as _symbol_database
 # @@protoc_insertion_point(imports)
 
@@ -15,191 +13,33 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor.FileDescriptor(
-  name='workload_protocol.proto',
-  package='workload',
-  syntax='proto2',
-  serialized_options=None,
-  serialized_pb=_b('\n\x17workload_protocol.proto\x12\x08workload\"l\n\x08ProtoRfw\x12\x12\n\nbench_type\x18\x01 \x02(\t\x12\x12\n\nwl_metrics\x18\x02 \x02(\r\x12\x12\n\nbatch_unit\x18\x03 \x02(\r\x12\x10\n\x08\x62\x61tch_id\x18\x04 \x02(\r\x12\x12\n\nbatch_size\x18\x05 \x02(\r\"\x9b\x01\n\x08ProtoRfd\x12\x0c\n\x04keys\x18\x01 \x03(\t\x12\x32\n\x08workload\x18\x02 \x03(\x0b\x32 .workload.ProtoRfd.ProtoWorkload\x1aM\n\rProtoWorkload\x12\x0b\n\x03\x63pu\x18\x01 \x01(\r\x12\x0e\n\x06net_in\x18\x02 \x01(\r\x12\x0f\n\x07net_out\x18\x03 \x01(\r\x12\x0e\n\x06memory\x18\x04 \x01(\x01')
-)
-
-
-
-
-_PROTORFW = _descriptor.Descriptor(
-  name='ProtoRfw',
-  full_name='workload.ProtoRfw',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='bench_type', full_name='workload.ProtoRfw.bench_type', index=0,
-      number=1, type=9, cpp_type=9, label=2,
-      has_default_value=False, default_value=_b("").decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='wl_metrics', full_name='workload.ProtoRfw.wl_metrics', index=1,
-      number=2, type=13, cpp_type=3, label=2,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='batch_unit', full_name='workload.ProtoRfw.batch_unit', index=2,
-      number=3, type=13, cpp_type=3, label=2,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='batch_id', full_name='workload.ProtoRfw.batch_id', index=3,
-      number=4, type=13, cpp_type=3, label=2,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='batch_size', full_name='workload.ProtoRfw.batch_size', index=4,
-      number=5, type=13, cpp_type=3, label=2,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto2',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=37,
-  serialized_end=145,
-)
-
-
-_PROTORFD_PROTOWORKLOAD = _descriptor.Descriptor(
-  name='ProtoWorkload',
-  full_name='workload.ProtoRfd.ProtoWorkload',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='cpu', full_name='workload.ProtoRfd.ProtoWorkload.cpu', index=0,
-      number=1, type=13, cpp_type=3, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='net_in', full_name='workload.ProtoRfd.ProtoWorkload.net_in', index=1,
-      number=2, type=13, cpp_type=3, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='net_out', full_name='workload.ProtoRfd.ProtoWorkload.net_out', index=2,
-      number=3, type=13, cpp_type=3, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='memory', full_name='workload.ProtoRfd.ProtoWorkload.memory', index=3,
-      number=4, type=1, cpp_type=5, label=1,
-      has_default_value=False, default_value=float(0),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto2',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=226,
-  serialized_end=303,
-)
-
-_PROTORFD = _descriptor.Descriptor(
-  name='ProtoRfd',
-  full_name='workload.ProtoRfd',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='keys', full_name='workload.ProtoRfd.keys', index=0,
-      number=1, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='workload', full_name='workload.ProtoRfd.workload', index=1,
-      number=2, type=11, cpp_type=10, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-  ],
-  extensions=[
-  ],
-  nested_types=[_PROTORFD_PROTOWORKLOAD, ],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto2',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=148,
-  serialized_end=303,
-)
-
-_PROTORFD_PROTOWORKLOAD.containing_type = _PROTORFD
-_PROTORFD.fields_by_name['workload'].message_type = _PROTORFD_PROTOWORKLOAD
-DESCRIPTOR.message_types_by_name['ProtoRfw'] = _PROTORFW
-DESCRIPTOR.message_types_by_name['ProtoRfd'] = _PROTORFD
-_sym_db.RegisterFileDescriptor(DESCRIPTOR)
-
-ProtoRfw = _reflection.GeneratedProtocolMessageType('ProtoRfw', (_message.Message,), {
-  'DESCRIPTOR' : _PROTORFW,
-  '__module__' : 'workload_protocol_pb2'
-  # @@protoc_insertion_point(class_scope:workload.ProtoRfw)
-  })
-_sym_db.RegisterMessage(ProtoRfw)
-
-ProtoRfd = _reflection.GeneratedProtocolMessageType('ProtoRfd', (_message.Message,), {
-
-  'ProtoWorkload' : _reflection.GeneratedProtocolMessageType('ProtoWorkload', (_message.Message,), {
-    'DESCRIPTOR' : _PROTORFD_PROTOWORKLOAD,
-    '__module__' : 'workload_protocol_pb2'
-    # @@protoc_insertion_point(class_scope:workload.ProtoRfd.ProtoWorkload)
-    })
-  ,
-  'DESCRIPTOR' : _PROTORFD,
-  '__module__' : 'workload_protocol_pb2'
-  # @@protoc_insertion_point(class_scope:workload.ProtoRfd)
-  })
-_sym_db.RegisterMessage(ProtoRfd)
-_sym_db.RegisterMessage(ProtoRfd.ProtoWorkload)
-
-
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x17workload_protocol.proto\x12\x08workload\"\xbb\x01\n\x08ProtoRfw\x12\x12\n\nbench_type\x18\x01 \x02(\t\x12\x12\n\nwl_metrics\x18\x02 \x02(\r\x12\x12\n\nbatch_unit\x18\x03 \x02(\r\x12\x10\n\x08\x62\x61tch_id\x18\x04 \x02(\r\x12\x12\n\nbatch_size\x18\x05 \x02(\r\x12\x15\n\nchunk_rows\x18\x06 \x01(\r:\x01\x30\x12\x0e\n\x06\x66ilter\x18\x07 \x01(\t\x12\x11\n\x06\x63redit\x18\x08 \x01(\r:\x01\x30\x12\x13\n\x08priority\x18\t \x01(\r:\x01\x31\"\x9b\x01\n\x08ProtoRfd\x12\x0c\n\x04keys\x18\x01 \x03(\t\x12\x32\n\x08workload\x18\x02 \x03(\x0b\x32 .workload.ProtoRfd.ProtoWorkload\x1aM\n\rProtoWorkload\x12\x0b\n\x03\x63pu\x18\x01 \x01(\r\x12\x0e\n\x06net_in\x18\x02 \x01(\r\x12\x0f\n\x07net_out\x18\x03 \x01(\r\x12\x0e\n\x06memory\x18\x04 \x01(\x01\"M\n\x0bProtoIngest\x12\x0e\n\x06source\x18\x01 \x02(\t\x12.\n\x04rows\x18\x02 \x03(\x0b\x32 .workload.ProtoRfd.ProtoWorkload\"G\n\x0bProtoExport\x12\x0f\n\x07sources\x18\x01 \x03(\t\x12\x12\n\nwl_metrics\x18\x02 \x02(\r\x12\x13\n\x04gzip\x18\x03 \x01(\x08:\x05\x66\x61lse\"\x9d\x01\n\x08ProtoSub\x12\x12\n\nbench_type\x18\x01 \x02(\t\x12\x12\n\nwl_metrics\x18\x02 \x02(\r\x12\x15\n\nrow_offset\x18\x03 \x01(\x04:\x01\x30\x12\x13\n\x08interval\x18\x04 \x01(\x01:\x01\x31\x12\x10\n\x05speed\x18\x05 \x01(\x01:\x01\x31\x12\x15\n\nframe_rows\x18\x06 \x01(\r:\x01\x31\x12\x14\n\x06policy\x18\x07 \x01(\t:\x04\x64rop\"k\n\x11ProtoStatsRequest\x12\x12\n\nbench_type\x18\x01 \x02(\t\x12\x15\n\nbatch_unit\x18\x02 \x01(\r:\x01\x30\x12\x15\n\nrow_offset\x18\x03 \x01(\x04:\x01\x30\x12\x14\n\trow_count\x18\x04 \x01(\x04:\x01\x30\"\xf6\x02\n\nProtoStats\x12\x36\n\x07sources\x18\x01 \x03(\x0b\x32%.workload.ProtoStats.ProtoSourceStats\x1a\xa0\x01\n\x10ProtoSourceStats\x12\x0e\n\x06source\x18\x01 \x02(\t\x12\x0c\n\x04rows\x18\x02 \x02(\x04\x12\x0f\n\x07\x62\x61tches\x18\x03 \x01(\x04\x12\x12\n\nrow_offset\x18\x04 \x02(\x04\x12\x11\n\trow_count\x18\x05 \x02(\x04\x12\x36\n\x07\x63olumns\x18\x06 \x03(\x0b\x32%.workload.ProtoStats.ProtoColumnStats\x1a\x8c\x01\n\x10ProtoColumnStats\x12\x0c\n\x04name\x18\x01 \x02(\t\x12\x0b\n\x03min\x18\x02 \x02(\x01\x12\x0b\n\x03max\x18\x03 \x02(\x01\x12\x0c\n\x04mean\x18\x04 \x02(\x01\x12\x0e\n\x06stddev\x18\x05 \x02(\x01\x12\x0b\n\x03p50\x18\x06 \x01(\x01\x12\x0b\n\x03p90\x18\x07 \x01(\x01\x12\x0b\n\x03p95\x18\x08 \x01(\x01\x12\x0b\n\x03p99\x18\t \x01(\x01*1\n\x08Priority\x12\x0f\n\x0bINTERACTIVE\x10\x00\x12\n\n\x06NORMAL\x10\x01\x12\x08\n\x04\x42ULK\x10\x02')
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'workload_protocol_pb2', globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+  DESCRIPTOR._options = None
+  _PRIORITY._serialized_start=1183
+  _PRIORITY._serialized_end=1232
+  _PROTORFW._serialized_start=38
+  _PROTORFW._serialized_end=225
+  _PROTORFD._serialized_start=228
+  _PROTORFD._serialized_end=383
+  _PROTORFD_PROTOWORKLOAD._serialized_start=306
+  _PROTORFD_PROTOWORKLOAD._serialized_end=383
+  _PROTOINGEST._serialized_start=385
+  _PROTOINGEST._serialized_end=462
+  _PROTOEXPORT._serialized_start=464
+  _PROTOEXPORT._serialized_end=535
+  _PROTOSUB._serialized_start=538
+  _PROTOSUB._serialized_end=695
+  _PROTOSTATSREQUEST._serialized_start=697
+  _PROTOSTATSREQUEST._serialized_end=804
+  _PROTOSTATS._serialized_start=807
+  _PROTOSTATS._serialized_end=1181
+  _PROTOSTATS_PROTOSOURCESTATS._serialized_start=878
+  _PROTOSTATS_PROTOSOURCESTATS._serialized_end=1038
+  _PROTOSTATS_PROTOCOLUMNSTATS._serialized_start=1041
+  _PROTOSTATS_PROTOCOLUMNSTATS._serialized_end=1181
 # @@protoc_insertion_point(module_scope)
@@ -0,0 +1,205 @@
+from typing import AsyncIterator, Deque, Hashable, List, Optional, Tuple
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+import asyncio
+import time
+import workload_protocol_pb2
+
+# Classes of the batch work, from the most urgent, shared with the clients through the protocol
+PRIORITIES = tuple(name.lower() for name in workload_protocol_pb2.Priority.keys())
+DEFAULT_PRIORITY = workload_protocol_pb2.NORMAL
+BULK_PRIORITY = workload_protocol_pb2.BULK
+# Batches fetched and serialized at once, across every connection
+SLOTS = 4
+# Rows a peer may use each round before the next peer is served
+QUANTUM_ROWS = 10_000
+# Recent waits kept per class for the percentiles
+WAIT_SAMPLES = 1024
+
+# Future granting the slot, cost in rows and time queued
+waiter = Tuple[asyncio.Future, int, float]
+
+
+class Flow:
+    """Waiters of one peer, queued by connection"""
+    __slots__ = ("deficit", "queues")
+
+    def __init__(self) -> None:
+        self.deficit = 0
+        self.queues: "OrderedDict[Hashable, Deque[waiter]]" = OrderedDict()
+
+    def head(self) -> waiter:
+        return next(iter(self.queues.values()))[0]
+
+    def pop(self) -> waiter:
+        """Takes the first waiter of the first connection, which goes last for the next grant"""
+        (connection, queue) = next(iter(self.queues.items()))
+        first = queue.popleft()
+        if queue:
+            self.queues.move_to_end(connection)
+        else:
+            del self.queues[connection]
+        return first
+
+
+class ClassStats:
+    __slots__ = ("waiting", "active", "granted", "waits", "max_wait")
+
+    def __init__(self) -> None:
+        self.waiting = 0
+        self.active = 0
+        self.granted = 0
+        self.waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.max_wait = 0.0
+
+    def describe(self) -> str:
+        waits = sorted(self.waits)
+        p50 = waits[len(waits) // 2] * 1000 if waits else 0.0
+        p99 = waits[min(len(waits) - 1, int(len(waits) * 0.99))] * 1000 if waits else 0.0
+        return (f"{self.waiting} waiting, {self.active} active, {self.granted} granted, "
+                f"wait p50 {p50:.2f} ms, p99 {p99:.2f} ms, max {self.max_wait * 1000:.2f} ms")
+
+
+class BatchScheduler:
+    """
+    Grants the slots in which batches are fetched from the database and serialized, so that a connection
+    pulling a large RFW cannot take every slot from the others
+
+    Classes are served in priority order: bulk work only gets the slots no other class is waiting for.
+    Within a class, peers are served in deficit round-robin, each using up to quantum rows per round, and
+    the connections of a peer take turns. A batch of a large batch_unit thus waits for its peer to have
+    accumulated enough rounds, while the small batches of other peers go through in between.
+    """
+    def __init__(self, slots: int = SLOTS, quantum: int = QUANTUM_ROWS) -> None:
+        """
+
+        :param slots: number of batches fetched and serialized at once
+        :param quantum: number of rows added to the deficit of a peer each round
+        """
+        self.slots = slots
+        self.quantum = quantum
+        self.active = 0
+        # Peers with waiters of each class, in round-robin order
+        self.flows: List["OrderedDict[Hashable, Flow]"] = [OrderedDict() for _ in PRIORITIES]
+        self.stats = [ClassStats() for _ in PRIORITIES]
+
+    async def acquire(self, peer: Hashable, connection: Hashable, priority: int, cost: int) -> None:
+        """
+        Waits for a slot
+
+        :param peer: peer the work is done for, sharing its rounds between its connections
+        :param connection: connection the work is done for
+        :param priority: index of the class in PRIORITIES
+        :param cost: number of rows the work reads
+        """
+        stats = self.stats[priority]
+        if self.active < self.slots and not any(self.flows):
+            self.grant(stats, 0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (future, max(1, cost), time.perf_counter())
+        flow = self.flows[priority].get(peer)
+        if flow is None:
+            flow = self.flows[priority][peer] = Flow()
+        flow.queues.setdefault(connection, deque()).append(entry)
+        stats.waiting += 1
+        self.dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self.withdraw(priority, peer, connection, entry)
+            else:
+                # Granted as the waiting task was cancelled, the slot goes to the next waiter
+                self.release(priority)
+            raise
+
+    def release(self, priority: int) -> None:
+        self.active -= 1
+        self.stats[priority].active -= 1
+        self.dispatch()
+
+    def grant(self, stats: ClassStats, wait: float) -> None:
+        self.active += 1
+        stats.active += 1
+        stats.granted += 1
+        stats.waits.append(wait)
+        stats.max_wait = max(stats.max_wait, wait)
+
+    def withdraw(self, priority: int, peer: Hashable, connection: Hashable, entry: waiter) -> None:
+        """Removes a waiter whose task was cancelled, along with its queue and flow once empty"""
+        flow = self.flows[priority].get(peer)
+        if flow is None or entry not in flow.queues.get(connection, ()):
+            return
+        flow.queues[connection].remove(entry)
+        self.stats[priority].waiting -= 1
+        if not flow.queues[connection]:
+            del flow.queues[connection]
+        if not flow.queues:
+            del self.flows[priority][peer]
+
+    def dispatch(self) -> None:
+        """Grants the free slots to the next waiters"""
+        while self.active < self.slots:
+            selected = self.next_waiter()
+            if selected is None:
+                return
+            (priority, (future, _, queued)) = selected
+            self.stats[priority].waiting -= 1
+            self.grant(self.stats[priority], time.perf_counter() - queued)
+            future.set_result(None)
+
+    def next_waiter(self) -> Optional[Tuple[int, waiter]]:
+        for (priority, flows) in enumerate(self.flows):
+            if not flows:
+                continue
+            # Rounds each peer needs before it can afford its first waiter. The first peer needing the fewest is
+            # served once every peer got them, the peers before it getting one more as their turn came first
+            rounds = [max(0, -(-(flow.head()[1] - flow.deficit) // self.quantum)) for flow in flows.values()]
+            needed = min(rounds)
+            served = rounds.index(needed)
+            for (index, (peer, flow)) in enumerate(list(flows.items())):
+                flow.deficit += (needed + (index < served)) * self.quantum
+                if index < served:
+                    flows.move_to_end(peer)
+
+            (peer, flow) = next(iter(flows.items()))
+            flow.deficit -= flow.head()[1]
+            selected = flow.pop()
+            if not flow.queues:
+                # An idle peer does not keep the rows it did not use
+                del flows[peer]
+            return priority, selected
+        return None
+
+    @asynccontextmanager
+    async def slot(self, peer: Hashable, connection: Hashable, priority: int, cost: int) -> AsyncIterator[None]:
+        """Holds a slot for the duration of the block, see acquire"""
+        await self.acquire(peer, connection, priority, cost)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def report(self) -> str:
+        """Returns the queue depth and wait times of each class, on a single line"""
+        return "; ".join(f"{name}: {stats.describe()}" for (name, stats) in zip(PRIORITIES, self.stats))
+
+
+_scheduler = BatchScheduler()
+
+
+def configure(slots: int = SLOTS, quantum: int = QUANTUM_ROWS) -> None:
+    """Replaces the scheduler, before the server accepts connections"""
+    global _scheduler
+    _scheduler = BatchScheduler(slots, quantum)
+
+
+def get_scheduler() -> BatchScheduler:
+    return _scheduler
+
+
+def slot(peer: Hashable, connection: Hashable, priority: int, cost: int):
+    """Holds a slot of the scheduler for the duration of an async with block, see BatchScheduler.acquire"""
+    return _scheduler.slot(peer, connection, priority, cost)
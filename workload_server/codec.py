@@ -0,0 +1,182 @@
+from typing import Optional, List, Tuple, Union
+from concurrent.futures import Future, ProcessPoolExecutor
+from array import array
+import logging
+import asyncio
+import json
+import workload_protocol_pb2
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    shared_memory = None
+
+OFFLOAD_ROWS = 20_000
+# Array typecodes the metric columns are handed to the workers with, other columns being doubles
+TYPECODES = {"cpu": "q", "net_in": "q", "net_out": "q", "memory": "d"}
+
+_executor: Optional[ProcessPoolExecutor] = None
+_offload_rows = OFFLOAD_ROWS
+
+
+def configure(workers: int, offload_rows: int = OFFLOAD_ROWS) -> None:
+    """
+    Starts the process pool serializing large batches, or disables it when workers is 0
+
+    :param workers: number of worker processes
+    :param offload_rows: number of rows from which a batch is serialized in the pool
+    """
+    global _executor, _offload_rows
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+    _offload_rows = offload_rows
+    if workers > 0:
+        if shared_memory is not None:
+            # Workers forked before the tracker starts would each track the blocks they create and warn
+            # about them once this process unlinks them
+            resource_tracker.ensure_running()
+        _executor = ProcessPoolExecutor(max_workers=workers)
+        logging.info(f"Serializing batches of {offload_rows} rows or more in {workers} worker processes")
+
+
+def create_proto_rfd(batch: List, keys: Optional[List[str]] = None) -> workload_protocol_pb2.ProtoRfd:
+    proto_rfd = workload_protocol_pb2.ProtoRfd()
+    if keys is None:
+        keys = batch[0].keys()
+    proto_rfd.keys.extend(keys)
+    for row in batch:
+        workload = proto_rfd.workload.add()
+        for i, key in enumerate(keys):
+            setattr(workload, key, row[i])
+
+    return proto_rfd
+
+
+def encode_rows(protocol: str, keys: List[str], rows: List) -> bytes:
+    """
+    :param protocol: "JSON" or "BUFF"
+    :param keys: names of the columns of the rows
+    :param rows: rows to serialize
+    :return: serialized RFD payload
+    """
+    if protocol == "BUFF":
+        return create_proto_rfd(rows, keys).SerializeToString()
+    return bytes(json.dumps({"keys": keys, "data": rows}).encode("utf-8"))
+
+
+def encode_rows_shared(protocol: str, keys: List[str], rows: List) -> Union[bytes, Tuple[str, int]]:
+    """
+    Worker side of the pool: serializes rows into a new shared memory block, so the payload is not sent back
+    through the pool pipe
+
+    :return: name and size of the shared memory block, or the payload when shared memory is not available
+    """
+    serialized = encode_rows(protocol, keys, rows)
+    if shared_memory is None or not serialized:
+        return serialized
+    block = shared_memory.SharedMemory(create=True, size=len(serialized))
+    block.buf[:len(serialized)] = serialized
+    name = block.name
+    block.close()
+    return name, len(serialized)
+
+
+def encode_columns_shared(protocol: str, keys: List[str], name: str, count: int) -> Union[bytes, Tuple[str, int]]:
+    """
+    Worker side of the pool: serializes rows handed over as columns in a shared memory block, see share_columns
+
+    :param name: name of the shared memory block holding the columns
+    :param count: number of rows
+    :return: see encode_rows_shared
+    """
+    block = shared_memory.SharedMemory(name=name)
+    columns = []
+    offset = 0
+    try:
+        for key in keys:
+            column = array(TYPECODES.get(key, "d"))
+            size = count * column.itemsize
+            with block.buf[offset:offset + size] as view:
+                column.frombytes(view)
+            columns.append(column)
+            offset += size
+    finally:
+        block.close()
+    return encode_rows_shared(protocol, keys, list(zip(*columns)))
+
+
+def share_columns(keys: List[str], rows: List) -> Optional["shared_memory.SharedMemory"]:
+    """
+    Copies rows into a new shared memory block as one array per column, much cheaper to hand to a worker than
+    pickling the rows
+
+    :return: shared memory block, None if shared memory is not available or a value does not fit the type of
+        its column, the rows then going through the pool pipe
+    """
+    if shared_memory is None:
+        return None
+    try:
+        columns = [array(TYPECODES.get(key, "d"), values) for (key, values) in zip(keys, zip(*rows))]
+    except (TypeError, OverflowError):
+        return None
+    block = shared_memory.SharedMemory(create=True, size=sum(len(column) * column.itemsize for column in columns))
+    offset = 0
+    for column in columns:
+        size = len(column) * column.itemsize
+        block.buf[offset:offset + size] = memoryview(column).cast("B")
+        offset += size
+    return block
+
+
+def discard_result(work: Future) -> None:
+    """Unlinks the block of a payload serialized for a task cancelled meanwhile, once the worker is done"""
+    if work.cancelled() or work.exception() is not None:
+        return
+    result = work.result()
+    if not isinstance(result, bytes):
+        block = shared_memory.SharedMemory(name=result[0])
+        block.close()
+        block.unlink()
+
+
+async def serialize(protocol: str, keys: List[str], rows: List) -> bytes:
+    """
+    Serializes rows inline, or in the process pool when there are at least offload_rows of them so the
+    event loop keeps serving the other connections meanwhile
+
+    :param protocol: "JSON" or "BUFF"
+    :param keys: names of the columns of the rows
+    :param rows: rows to serialize, as tuples
+    :return: serialized RFD payload
+    """
+    if _executor is None or len(rows) < _offload_rows:
+        return encode_rows(protocol, keys, rows)
+
+    block = share_columns(keys, rows)
+    try:
+        if block is None:
+            work = _executor.submit(encode_rows_shared, protocol, keys, rows)
+        else:
+            work = _executor.submit(encode_columns_shared, protocol, keys, block.name, len(rows))
+        try:
+            result = await asyncio.wrap_future(work)
+        except asyncio.CancelledError:
+            # The worker may still be creating the block of the payload, which nobody would read
+            work.add_done_callback(discard_result)
+            raise
+    finally:
+        # A worker that already mapped the columns keeps them mapped, one that did not fails to open them
+        if block is not None:
+            block.close()
+            block.unlink()
+
+    if isinstance(result, bytes):
+        return result
+    (name, size) = result
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(block.buf[:size])
+    finally:
+        block.close()
+        block.unlink()
@@ -0,0 +1,98 @@
+from typing import AsyncIterator, Iterator, List, Optional, Sequence, Tuple
+from collections import namedtuple
+import asyncio
+from workload_server import wl_db
+from workload_server.predicate import Predicate, parse
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LAYOUTS = ("rows", "columns")
+DTYPES = {"cpu": "<i8", "net_in": "<i8", "net_out": "<i8", "memory": "<f8"}
+
+# data holds a tuple per row, or an array per key with the columns layout
+batch = namedtuple("BATCH", ["bench_type", "batch_id", "keys", "data"])
+
+
+def to_columns(keys: Sequence[str], rows: List[Tuple]) -> List:
+    """
+    Converts rows to one array per key with a single bulk conversion
+
+    The arrays are views over the fields of one record array, so selecting the columns copies nothing.
+    """
+    table = numpy.array(rows, dtype=[(key, DTYPES[key]) for key in keys])
+    return [table[key] for key in keys]
+
+
+async def aiter_batches(bench_type: str, metrics: int, batch_unit: int, start: int, count: int,
+                        filter_expr: str = "", layout: str = "rows") -> AsyncIterator[batch]:
+    """
+    Asynchronous generator yielding the batches of an RFW in-process, without a socket or serialization
+
+    The batches are those the server would send for the same RFW, read from a single cursor: iteration
+    stops after the first short batch since it marks the end of the source, which may be an empty batch
+    when the source ends on a batch boundary.
+
+    :param bench_type: source to read, matched as a prefix like in an RFW
+    :param metrics: value to enable the columns bitwise (expects between 1 and 15)
+    :param batch_unit: number of rows per batch
+    :param start: id of the first batch
+    :param count: maximum number of batches
+    :param filter_expr: filter the rows must match, batches being taken from the matching rows only
+    :param layout: "rows" for a tuple per row, "columns" for a NumPy array per selected column
+    :return: iterator of batches
+    :raises ValueError: if no metric is selected, the filter is invalid or the layout is unknown
+    :raises ImportError: if the columns layout is asked for without NumPy installed
+    """
+    keys = wl_db.selected_columns(metrics)
+    if not keys:
+        raise ValueError(f"No metric selected by {metrics}")
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout!r}, expected one of {', '.join(LAYOUTS)}")
+    if layout == "columns" and numpy is None:
+        raise ImportError("The columns layout requires NumPy to be installed")
+    predicate: Optional[Predicate] = parse(filter_expr) if filter_expr else None
+    if batch_unit <= 0 or count <= 0:
+        return
+
+    batch_id = start
+    chunks = wl_db.iter_rows(bench_type, metrics, batch_unit * start, batch_unit * count, batch_unit, predicate)
+    try:
+        async for rows in chunks:
+            rows = [tuple(row) for row in rows]
+            yield batch(bench_type, batch_id, keys, to_columns(keys, rows) if layout == "columns" else rows)
+            batch_id += 1
+            if len(rows) < batch_unit:
+                return
+    finally:
+        # Closes the cursor when the caller stops early
+        await chunks.aclose()
+
+    # The cursor ended on a batch boundary, the server answers the next batch with an empty one
+    if batch_id < start + count:
+        yield batch(bench_type, batch_id, keys, to_columns(keys, []) if layout == "columns" else [])
+
+
+def iter_batches(bench_type: str, metrics: int, batch_unit: int, start: int, count: int,
+                 filter_expr: str = "", layout: str = "rows") -> Iterator[batch]:
+    """
+    Generator yielding the batches of an RFW in-process, see aiter_batches
+
+    The batches are read on a private event loop, so it cannot be called from a coroutine, which should
+    use aiter_batches instead.
+
+    :return: iterator of batches
+    """
+    loop = asyncio.new_event_loop()
+    batches = aiter_batches(bench_type, metrics, batch_unit, start, count, filter_expr, layout)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(batches.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(batches.aclose())
+        loop.close()
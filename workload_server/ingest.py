@@ -0,0 +1,171 @@
+from typing import List, Optional, Tuple
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import aiosqlite
+from google.protobuf.message import DecodeError
+from workload_server import wl_db, wl_stats
+import workload_protocol_pb2
+
+# Rows of the requests waiting when a transaction starts are committed together, up to this many
+MAX_TRANSACTION_ROWS = 50_000
+MAX_REQUEST_ROWS = 100_000
+SOURCE_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]{0,63}")
+
+_ingestor: Optional["Ingestor"] = None
+
+
+class IngestError(ValueError):
+    """Raised when an ingest request is invalid"""
+
+
+class Ingestor:
+    """
+    Single writer appending the rows of ingest requests to the database
+
+    The database is switched to write-ahead logging, so readers keep reading the last committed rows while
+    a transaction is open instead of waiting for it. Requests queue up while a transaction runs and are
+    committed together by the next one, then the derived structures are updated with the committed rows.
+    """
+    def __init__(self, max_transaction_rows: int = MAX_TRANSACTION_ROWS) -> None:
+        """
+
+        :param max_transaction_rows: number of queued rows from which a transaction stops taking more requests
+        """
+        self.max_transaction_rows = max_transaction_rows
+        self.queue: "asyncio.Queue[Tuple[str, List[Tuple], asyncio.Future]]" = asyncio.Queue()
+        self.con: Optional[aiosqlite.Connection] = None
+        self.task: Optional[asyncio.Task] = None
+        self.rows_ingested = 0
+        self.transactions = 0
+
+    async def start(self) -> None:
+        self.con = await aiosqlite.connect(wl_db.DB)
+        await self.con.execute("PRAGMA journal_mode=WAL")
+        # With write-ahead logging, NORMAL only gives up the durability of the last transactions on power loss
+        await self.con.execute("PRAGMA synchronous=NORMAL")
+        await self.con.execute("PRAGMA busy_timeout=5000")
+        # Loaded before the first append, so the version is advanced from the rows it counted
+        wl_db.get_dataset_version()
+        self.task = asyncio.create_task(self.run())
+
+    async def append(self, source: str, rows: List[Tuple]) -> str:
+        """
+        Queues rows for the next transaction and waits for it to commit
+
+        :param source: source the rows are appended to
+        :param rows: values of the metric columns, in wl_db.COLUMNS order
+        :return: dataset version including the rows
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((source, rows, future))
+        return await future
+
+    async def run(self) -> None:
+        while True:
+            pending = [await self.queue.get()]
+            queued_rows = len(pending[0][1])
+            while not self.queue.empty() and queued_rows < self.max_transaction_rows:
+                pending.append(self.queue.get_nowait())
+                queued_rows += len(pending[-1][1])
+            await self.commit(pending)
+
+    async def commit(self, pending: List[Tuple[str, List[Tuple], asyncio.Future]]) -> None:
+        """Appends the rows of the pending requests in one transaction and records them once committed"""
+        appended = []
+        try:
+            # Query can use f-string evaluation safely for TABLE and COLUMNS because they are local constant
+            # string literals but NOT for VALUES, so we use placeholders to make sure input is sanitized
+            async with self.con.execute(f"SELECT COALESCE(MAX(id), 0) FROM {wl_db.TABLE}") as cur:
+                (next_id,) = await cur.fetchone()
+            next_id += 1
+            for (source, rows, _) in pending:
+                await self.con.executemany(f"INSERT INTO {wl_db.TABLE} (id, {', '.join(wl_db.COLUMNS)}) "
+                                           f"VALUES (?, ?, ?, ?, ?, ?)",
+                                           [(next_id + i, *row, source) for (i, row) in enumerate(rows)])
+                appended.append((source, next_id, rows))
+                next_id += len(rows)
+            await self.con.commit()
+        except sqlite3.Error as err:
+            await self.con.rollback()
+            logging.error(f"Unable to append {sum(len(rows) for (_, rows, _) in pending)} rows: {err!r}")
+            for (_, _, future) in pending:
+                if not future.done():
+                    future.set_exception(err)
+            return
+
+        for (source, first_id, rows) in appended:
+            wl_db.record_append(source, first_id, rows)
+            wl_stats.record_append(source, rows)
+        try:
+            await wl_stats.persist(self.con, {source for (source, _, _) in appended})
+            await self.con.commit()
+        except sqlite3.Error as err:
+            # Stored statistics of another version are recomputed on the next start
+            logging.warning(f"Unable to store the statistics of the appended rows: {err!r}")
+
+        self.rows_ingested += sum(len(rows) for (_, _, rows) in appended)
+        self.transactions += 1
+        version = wl_db.get_dataset_version()
+        for (_, _, future) in pending:
+            if not future.done():
+                future.set_result(version)
+
+    async def close(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+        if self.con is not None:
+            await self.con.close()
+
+
+async def enable(max_transaction_rows: int = MAX_TRANSACTION_ROWS) -> Ingestor:
+    """Starts the writer, letting the server accept ingest requests"""
+    global _ingestor
+    _ingestor = Ingestor(max_transaction_rows)
+    await _ingestor.start()
+    return _ingestor
+
+
+def get_ingestor() -> Optional[Ingestor]:
+    """Returns the writer, None if ingestion is not enabled"""
+    return _ingestor
+
+
+def parse_request(protocol: str, payload: bytes) -> Tuple[str, List[Tuple]]:
+    """
+    Decodes and validates an ingest request
+
+    :param protocol: JSON or BUFF
+    :param payload: serialized request
+    :return: source and rows, each a (cpu, net_in, net_out, memory) tuple
+    :raises IngestError: if the request cannot be decoded or holds invalid rows
+    """
+    try:
+        if protocol == "BUFF":
+            proto_ingest = workload_protocol_pb2.ProtoIngest()
+            proto_ingest.ParseFromString(payload)
+            source = proto_ingest.source
+            received = [tuple(getattr(row, column) if row.HasField(column) else None
+                              for column in wl_db.COLUMNS[:-1]) for row in proto_ingest.rows]
+        else:
+            decoded = json.loads(payload)
+            source = decoded["source"]
+            received = decoded["rows"]
+    except (DecodeError, json.JSONDecodeError, KeyError, TypeError) as err:
+        raise IngestError(f"Unable to decode ingest request: {err!r}")
+
+    if not isinstance(source, str) or SOURCE_NAME.fullmatch(source) is None:
+        raise IngestError(f"Invalid source name {source!r}")
+    if not isinstance(received, list) or not 0 < len(received) <= MAX_REQUEST_ROWS:
+        raise IngestError(f"An ingest request holds between 1 and {MAX_REQUEST_ROWS} rows")
+
+    rows = []
+    for row in received:
+        try:
+            (cpu, net_in, net_out, memory) = row
+            rows.append((int(cpu), int(net_in), int(net_out), float(memory)))
+        except (TypeError, ValueError):
+            raise IngestError(f"Invalid row {row!r}, expected cpu, net_in, net_out and memory")
+    return source, rows
@@ -0,0 +1,163 @@
+from typing import Callable, List, Mapping, Tuple, Union
+import operator
+import re
+
+# Only the metric columns can be filtered on, anything else is rejected before reaching SQL
+COLUMNS = ("cpu", "net_in", "net_out", "memory")
+OPERATORS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+             "=": operator.eq, "==": operator.eq, "!=": operator.ne}
+SQL_OPERATORS = {"==": "="}
+
+MAX_LENGTH = 1024
+MAX_DEPTH = 32
+
+TOKEN = re.compile(r"\s*(?:(?P<number>-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)|(?P<op><=|>=|==|!=|<|>|=)"
+                   r"|(?P<paren>[()])|(?P<word>[A-Za-z_]+))")
+
+Number = Union[int, float]
+
+
+class PredicateError(ValueError):
+    """Raised when a filter expression is invalid"""
+
+
+class Predicate:
+    """
+    Filter expression over the workload columns, compiled once to a parameterized SQL condition
+    and to a Python callable evaluating a row
+
+    The grammar is comparisons between a column and a number, combined with AND, OR, NOT and parentheses:
+
+        expr := term (OR term)*
+        term := factor (AND factor)*
+        factor := NOT factor | "(" expr ")" | column op number
+    """
+    def __init__(self, canonical: str, sql: str, params: Tuple[Number, ...],
+                 evaluate: Callable[[Mapping], bool]) -> None:
+        """
+
+        :param canonical: normalized text of the expression, equal for equivalent spellings
+        :param sql: SQL condition with a placeholder per number
+        :param params: numbers of the expression, in placeholder order
+        :param evaluate: callable returning True if a row, indexable by column name, matches
+        """
+        self.canonical = canonical
+        self.sql = sql
+        self.params = params
+        self.evaluate = evaluate
+
+    def __call__(self, row: Mapping) -> bool:
+        return self.evaluate(row)
+
+    def __repr__(self) -> str:
+        return f"Predicate({self.canonical!r})"
+
+
+def tokenize(text: str) -> List[Tuple[str, str]]:
+    """
+    :param text: filter expression
+    :return: list of (kind, value) tokens
+    :raises PredicateError: on any character outside the language
+    """
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None:
+            raise PredicateError(f"Unexpected character at {position}: {text[position:position + 10]!r}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+class Parser:
+    """Recursive descent parser building the canonical text, SQL and callable of each node at once"""
+    def __init__(self, tokens: List[Tuple[str, str]]) -> None:
+        self.tokens = tokens
+        self.position = 0
+        self.params: List[Number] = []
+
+    def peek(self) -> Tuple[str, str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else ("end", "")
+
+    def keyword(self, word: str) -> bool:
+        (kind, value) = self.peek()
+        if kind == "word" and value.upper() == word:
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, kind: str) -> str:
+        (token_kind, value) = self.peek()
+        if token_kind != kind:
+            raise PredicateError(f"Expected {kind}, got {value or 'end of expression'!r}")
+        self.position += 1
+        return value
+
+    def expr(self, depth: int) -> Tuple[str, str, Callable]:
+        nodes = [self.term(depth)]
+        while self.keyword("OR"):
+            nodes.append(self.term(depth))
+        if len(nodes) == 1:
+            return nodes[0]
+        evaluates = [evaluate for (_, _, evaluate) in nodes]
+        return ("(" + " OR ".join(canonical for (canonical, _, _) in nodes) + ")",
+                "(" + " OR ".join(sql for (_, sql, _) in nodes) + ")",
+                lambda row: any(evaluate(row) for evaluate in evaluates))
+
+    def term(self, depth: int) -> Tuple[str, str, Callable]:
+        nodes = [self.factor(depth)]
+        while self.keyword("AND"):
+            nodes.append(self.factor(depth))
+        if len(nodes) == 1:
+            return nodes[0]
+        evaluates = [evaluate for (_, _, evaluate) in nodes]
+        return ("(" + " AND ".join(canonical for (canonical, _, _) in nodes) + ")",
+                "(" + " AND ".join(sql for (_, sql, _) in nodes) + ")",
+                lambda row: all(evaluate(row) for evaluate in evaluates))
+
+    def factor(self, depth: int) -> Tuple[str, str, Callable]:
+        if depth > MAX_DEPTH:
+            raise PredicateError("Expression nested too deeply")
+        if self.keyword("NOT"):
+            (canonical, sql, evaluate) = self.factor(depth + 1)
+            return f"NOT {canonical}", f"NOT {sql}", lambda row: not evaluate(row)
+        if self.peek() == ("paren", "("):
+            self.position += 1
+            node = self.expr(depth + 1)
+            if self.expect("paren") != ")":
+                raise PredicateError("Expected ')'")
+            return node
+
+        column = self.expect("word").lower()
+        if column not in COLUMNS:
+            raise PredicateError(f"Unknown column {column!r}, expected one of {', '.join(COLUMNS)}")
+        op = self.expect("op")
+        literal = self.expect("number")
+        value = float(literal) if any(c in literal for c in ".eE") else int(literal)
+        self.params.append(value)
+        compare = OPERATORS[op]
+        return (f"{column} {SQL_OPERATORS.get(op, op)} {value!r}",
+                f"{column} {SQL_OPERATORS.get(op, op)} ?",
+                lambda row: compare(row[column], value))
+
+
+def parse(text: str) -> Predicate:
+    """
+    Parses and compiles a filter expression such as "cpu > 80 AND (memory > 0.7 OR net_in >= 1000)"
+
+    :param text: filter expression
+    :return: compiled predicate
+    :raises PredicateError: if the expression is invalid
+    """
+    if len(text) > MAX_LENGTH:
+        raise PredicateError(f"Expression longer than {MAX_LENGTH} characters")
+    parser = Parser(tokenize(text))
+    if not parser.tokens:
+        raise PredicateError("Empty expression")
+    (canonical, sql, evaluate) = parser.expr(0)
+    if parser.position != len(parser.tokens):
+        raise PredicateError(f"Unexpected {parser.peek()[1]!r} after the expression")
+    return Predicate(canonical, sql, tuple(parser.params), evaluate)
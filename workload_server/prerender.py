@@ -0,0 +1,249 @@
+"""
+Pre-renders the batches of popular RFWs into packed files the server sends without serializing them again.
+
+Every full batch of a (bench_type, wl_metrics, batch_unit, protocol) combination is serialized once into a
+.rfd file, next to a .idx file holding the offset of each batch. Rows are only ever appended, so a full batch
+never changes: running the job again only renders the batches completed since the last run. The short batch
+ending a source is never rendered and always goes through the normal path.
+
+Run in the directory of the database, with the repository on the Python path:
+python -m workload_server.prerender DVD-training:15:1000:BUFF [...] [--workers N]
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from array import array
+from contextlib import closing
+import argparse
+import logging
+import os
+import sqlite3
+from workload_server import wl_db
+from workload_server.codec import encode_rows
+
+PRERENDER_FOLDER = "prerendered"
+PROTOCOLS = ("JSON", "BUFF")
+# Offsets are written as unsigned 64 bit integers
+OFFSET_TYPE = "Q"
+
+
+# Named after the variable so combinations can be sent to the rendering processes
+Combination = namedtuple("Combination", ["bench_type", "wl_metrics", "batch_unit", "protocol"])
+
+
+class RenderedBatches:
+    """Packed file of the batches of a combination, opened once for the life of the server"""
+    def __init__(self, path: str, offsets: array) -> None:
+        """
+
+        :param path: packed file
+        :param offsets: offset of every batch in the file followed by the end of the last one
+        """
+        self.file = open(path, "rb")
+        self.offsets = offsets
+
+    def locate(self, batch_id: int) -> Optional[Tuple[int, int]]:
+        """Returns the offset and size of a batch in the file, None if it was not rendered"""
+        if not 0 <= batch_id < len(self.offsets) - 1:
+            return None
+        return self.offsets[batch_id], self.offsets[batch_id + 1] - self.offsets[batch_id]
+
+    def close(self) -> None:
+        self.file.close()
+
+
+_rendered: Dict[Combination, RenderedBatches] = {}
+
+
+def parse_combination(text: str) -> Combination:
+    """
+    Parses a combination written bench_type:wl_metrics:batch_unit:protocol, e.g. DVD-training:15:1000:BUFF
+
+    :raises ValueError: if the combination is malformed
+    """
+    try:
+        (bench_type, wl_metrics, batch_unit, protocol) = text.rsplit(":", 3)
+        combination = Combination(bench_type, int(wl_metrics), int(batch_unit), protocol.upper())
+    except ValueError:
+        raise ValueError(f"Invalid combination {text!r}, expected bench_type:wl_metrics:batch_unit:protocol")
+    if not wl_db.selected_columns(combination.wl_metrics) or combination.batch_unit <= 0 or \
+            combination.protocol not in PROTOCOLS or not combination.bench_type:
+        raise ValueError(f"Invalid combination {text!r}")
+    return combination
+
+
+def combination_name(combination: Combination) -> str:
+    """Returns the combination as written on the command line"""
+    return ":".join(str(field) for field in combination)
+
+
+def file_paths(combination: Combination, folder: str) -> Tuple[str, str]:
+    """Returns the packed file and the index file of a combination"""
+    stem = os.path.join(folder, "-".join(str(field) for field in combination))
+    return f"{stem}.rfd", f"{stem}.idx"
+
+
+def read_index(path: str) -> Optional[array]:
+    if not os.path.exists(path):
+        return None
+    offsets = array(OFFSET_TYPE)
+    with open(path, "rb") as file:
+        offsets.frombytes(file.read())
+    return offsets if len(offsets) > 0 and offsets[0] == 0 else None
+
+
+def write_index(path: str, offsets: array) -> None:
+    # Replaced at once, so a reader never sees an index pointing past the batches written
+    with open(f"{path}.tmp", "wb") as file:
+        file.write(offsets.tobytes())
+    os.replace(f"{path}.tmp", path)
+
+
+def render_batch(con: sqlite3.Connection, combination: Combination, keys: List[str], batch_id: int) -> bytes:
+    """Serializes a batch the way the server does, as read by wl_db.get_batch"""
+    # Query can use f-string evaluation safely for TABLE and COLUMNS because they are local constant string
+    # literals or validated column names, but NOT for VALUES, so we use placeholders for them
+    rows = con.execute(f"SELECT {', '.join(keys)} FROM {wl_db.TABLE} WHERE {wl_db.COLUMNS[-1]} LIKE ? "
+                       f"LIMIT ? OFFSET ?;",
+                       (combination.bench_type+"%", combination.batch_unit,
+                        combination.batch_unit * batch_id)).fetchall()
+    return encode_rows(combination.protocol, keys, rows)
+
+
+def is_current(con: sqlite3.Connection, combination: Combination, keys: List[str], packed_path: str,
+               offsets: array) -> bool:
+    """
+    Tells whether the rendered batches still match the database, by rendering the last one again
+
+    Appending rows never changes a full batch, so a mismatch means the database was replaced.
+    """
+    if len(offsets) < 2:
+        return True
+    if not os.path.exists(packed_path) or os.path.getsize(packed_path) < offsets[-1]:
+        return False
+    with open(packed_path, "rb") as file:
+        file.seek(offsets[-2])
+        stored = file.read(offsets[-1] - offsets[-2])
+    return stored == render_batch(con, combination, keys, len(offsets) - 2)
+
+
+def render(combination: Combination, folder: str = PRERENDER_FOLDER) -> int:
+    """
+    Renders the full batches of a combination missing from its packed file, starting over if the rendered
+    ones no longer match the database
+
+    :param combination: combination to render
+    :param folder: directory of the packed files
+    :return: number of batches rendered
+    """
+    keys = wl_db.selected_columns(combination.wl_metrics)
+    (packed_path, index_path) = file_paths(combination, folder)
+    os.makedirs(folder, exist_ok=True)
+    with closing(sqlite3.connect(wl_db.DB)) as con:
+        offsets = read_index(index_path)
+        if offsets is None or not is_current(con, combination, keys, packed_path, offsets):
+            # Written to a new file, so a server still sending the previous one is not affected
+            offsets = array(OFFSET_TYPE, [0])
+            open(f"{packed_path}.tmp", "wb").close()
+            os.replace(f"{packed_path}.tmp", packed_path)
+        rendered = len(offsets) - 1
+
+        # Batches are appended after the last one, the bytes a server may be sending stay untouched
+        with open(packed_path, "r+b") as file:
+            file.truncate(offsets[-1])
+            file.seek(offsets[-1])
+            cur = con.execute(f"SELECT {', '.join(keys)} FROM {wl_db.TABLE} WHERE {wl_db.COLUMNS[-1]} LIKE ? "
+                              f"LIMIT -1 OFFSET ?;",
+                              (combination.bench_type+"%", combination.batch_unit * rendered))
+            while True:
+                rows = cur.fetchmany(combination.batch_unit)
+                if len(rows) < combination.batch_unit:
+                    break
+                file.write(encode_rows(combination.protocol, keys, rows))
+                offsets.append(file.tell())
+            file.flush()
+            os.fsync(file.fileno())
+    write_index(index_path, offsets)
+    logging.info(f"Rendered {len(offsets) - 1 - rendered} batches of {combination_name(combination)}, "
+                 f"{len(offsets) - 1} in {packed_path}")
+    return len(offsets) - 1 - rendered
+
+
+def render_all(combinations: Iterable[Combination], folder: str = PRERENDER_FOLDER, workers: int = 0) -> int:
+    """
+    Renders the combinations, in parallel in worker processes unless workers is 0
+
+    :return: number of batches rendered
+    """
+    combinations = list(dict.fromkeys(combinations))
+    if workers <= 0 or len(combinations) < 2:
+        return sum(render(combination, folder) for combination in combinations)
+    with ProcessPoolExecutor(max_workers=min(workers, len(combinations))) as executor:
+        return sum(executor.map(render, combinations, [folder] * len(combinations)))
+
+
+def load(folder: str = PRERENDER_FOLDER) -> Dict[Combination, RenderedBatches]:
+    """
+    Opens the packed files still matching the database, for the server to send their batches
+
+    :param folder: directory of the packed files
+    :return: rendered batches by combination
+    """
+    global _rendered
+    for rendered in _rendered.values():
+        rendered.close()
+    _rendered = {}
+    if not os.path.isdir(folder):
+        return _rendered
+
+    with closing(sqlite3.connect(wl_db.DB)) as con:
+        for filename in sorted(os.listdir(folder)):
+            if not filename.endswith(".idx"):
+                continue
+            try:
+                combination = parse_combination(":".join(filename[:-len(".idx")].rsplit("-", 3)))
+            except ValueError:
+                continue
+            (packed_path, index_path) = file_paths(combination, folder)
+            offsets = read_index(index_path)
+            if offsets is None or len(offsets) < 2:
+                continue
+            if not is_current(con, combination, wl_db.selected_columns(combination.wl_metrics), packed_path,
+                              offsets):
+                logging.warning(f"Ignoring {packed_path}, rendered from another database")
+                continue
+            _rendered[combination] = RenderedBatches(packed_path, offsets)
+            logging.info(f"Serving {len(offsets) - 1} pre-rendered batches of {combination_name(combination)}")
+    return _rendered
+
+
+def locate(combination: Combination, batch_id: int) -> Optional[Tuple[RenderedBatches, int, int]]:
+    """
+    Finds a pre-rendered batch
+
+    :return: packed file, offset and size of the batch, None if it was not rendered
+    """
+    rendered = _rendered.get(combination)
+    if rendered is None:
+        return None
+    location = rendered.locate(batch_id)
+    if location is None:
+        return None
+    return (rendered, *location)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("combinations", nargs="+", type=parse_combination,
+                        help="combinations to render, written bench_type:wl_metrics:batch_unit:protocol")
+    parser.add_argument("--folder", default=PRERENDER_FOLDER,
+                        help=f"directory of the packed files, defaults to {PRERENDER_FOLDER}")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="render the combinations in this many worker processes, 0 to render them inline")
+    args = parser.parse_args()
+    logging.basicConfig(format='%(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S', level=logging.INFO)
+    render_all(args.combinations, args.folder, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+from typing import Optional, List, Dict
+from collections import Counter
+import logging
+import asyncio
+import cProfile
+import tracemalloc
+import signal
+import time
+import os
+from workload_server import batch_scheduler
+
+PROFILE_FOLDER = "profiles"
+DURATION = 30
+TRACE_FRAMES = 25
+TOP_STATS = 50
+LAG_INTERVAL = 0.1
+SLOW_CALLBACK = 0.05
+
+
+class SlowCallbackHandler(logging.Handler):
+    """Collects the slow callback warnings emitted by asyncio while the loop is in debug mode"""
+    def __init__(self) -> None:
+        super().__init__(logging.WARNING)
+        self.durations: List[float] = []
+        self.callbacks = Counter()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # asyncio logs "Executing <callback> took <seconds> seconds"
+        if record.msg.startswith("Executing") and len(record.args) == 2:
+            self.callbacks[str(record.args[0])] += 1
+            self.durations.append(record.args[1])
+
+
+class Profiler:
+    """
+    On-demand CPU, memory and event loop profiling of the server
+
+    Nothing is installed until a profile is started, so the server runs without overhead otherwise.
+    Every result is written in folder: cProfile stats as .prof, tracemalloc snapshots as .snap with
+    a text diff against the previous snapshot, and event loop reports as .txt.
+    """
+    def __init__(self, folder: str = PROFILE_FOLDER) -> None:
+        """
+
+        :param folder: directory where profiles are written
+        """
+        self.folder = folder
+        self.cpu_profile: Optional[cProfile.Profile] = None
+        self.cpu_timer: Optional[asyncio.TimerHandle] = None
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.lag_task: Optional[asyncio.Task] = None
+        self.lags: List[float] = []
+        self.slow_handler: Optional[SlowCallbackHandler] = None
+
+    def filename(self, kind: str, extension: str) -> str:
+        os.makedirs(self.folder, exist_ok=True)
+        return os.path.join(self.folder, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.{extension}")
+
+    def start_cpu(self, duration: float = DURATION) -> str:
+        """
+        Profiles the event loop thread with cProfile for duration seconds
+
+        :param duration: seconds before the profile is written
+        :return: status message
+        """
+        if self.cpu_profile is not None:
+            return "CPU profile already running"
+        self.cpu_profile = cProfile.Profile()
+        self.cpu_profile.enable()
+        self.cpu_timer = asyncio.get_running_loop().call_later(duration, self.stop_cpu)
+        return f"CPU profile started for {duration}s"
+
+    def stop_cpu(self) -> str:
+        """Stops the CPU profile and writes its stats"""
+        if self.cpu_profile is None:
+            return "No CPU profile running"
+        self.cpu_profile.disable()
+        self.cpu_timer.cancel()
+        filename = self.filename("cpu", "prof")
+        self.cpu_profile.dump_stats(filename)
+        self.cpu_profile = None
+        logging.info(f"CPU profile written to {filename}")
+        return f"CPU profile written to {filename}"
+
+    def snapshot_memory(self) -> str:
+        """
+        Takes a tracemalloc snapshot, starting the tracing on first call, and diffs it against the previous one
+
+        :return: status message
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+            self.snapshot = None
+            return "Memory tracing started, next snapshot will be the baseline"
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        filename = self.filename("mem", "snap")
+        snapshot.dump(filename)
+        if self.snapshot is not None:
+            diff_filename = filename.replace(".snap", "-diff.txt")
+            with open(diff_filename, "w") as file:
+                for stat in snapshot.compare_to(self.snapshot, "lineno")[:TOP_STATS]:
+                    file.write(f"{stat}\n")
+            filename = diff_filename
+        self.snapshot = snapshot
+        logging.info(f"Memory snapshot written to {filename}")
+        return f"Memory snapshot written to {filename}"
+
+    def stop_memory(self) -> str:
+        """Stops tracing memory allocations"""
+        if not tracemalloc.is_tracing():
+            return "Memory tracing not running"
+        tracemalloc.stop()
+        self.snapshot = None
+        return "Memory tracing stopped"
+
+    def start_loop(self, duration: float = DURATION) -> str:
+        """
+        Measures event loop lag and collects slow callbacks with asyncio debug mode for duration seconds
+
+        :param duration: seconds before the report is written
+        :return: status message
+        """
+        if self.lag_task is not None:
+            return "Event loop profile already running"
+        loop = asyncio.get_running_loop()
+        self.lags = []
+        self.slow_handler = SlowCallbackHandler()
+        logging.getLogger("asyncio").addHandler(self.slow_handler)
+        loop.slow_callback_duration = SLOW_CALLBACK
+        loop.set_debug(True)
+        self.lag_task = loop.create_task(self.measure_lag(duration))
+        return f"Event loop profile started for {duration}s"
+
+    async def measure_lag(self, duration: float) -> None:
+        """Coroutine sampling how late the loop wakes up from a sleep of LAG_INTERVAL"""
+        loop = asyncio.get_running_loop()
+        end = loop.time() + duration
+        try:
+            while loop.time() < end:
+                expected = loop.time() + LAG_INTERVAL
+                await asyncio.sleep(LAG_INTERVAL)
+                self.lags.append(max(0.0, loop.time() - expected))
+        finally:
+            self.write_loop_report()
+
+    def stop_loop(self) -> str:
+        """Stops the event loop profile, which writes its report"""
+        if self.lag_task is None:
+            return "No event loop profile running"
+        self.lag_task.cancel()
+        return "Event loop profile stopped"
+
+    def write_loop_report(self) -> None:
+        loop = asyncio.get_running_loop()
+        loop.set_debug(False)
+        logging.getLogger("asyncio").removeHandler(self.slow_handler)
+        self.lag_task = None
+
+        filename = self.filename("loop", "txt")
+        lags = sorted(self.lags)
+        slow = self.slow_handler.durations
+        with open(filename, "w") as file:
+            file.write(f"lag samples: {len(lags)}\n")
+            if lags:
+                file.write(f"lag mean: {sum(lags) / len(lags) * 1000:.3f} ms\n"
+                           f"lag p50: {lags[len(lags) // 2] * 1000:.3f} ms\n"
+                           f"lag p99: {lags[int(len(lags) * 0.99)] * 1000:.3f} ms\n"
+                           f"lag max: {lags[-1] * 1000:.3f} ms\n")
+            file.write(f"slow callbacks (> {SLOW_CALLBACK * 1000:.0f} ms): {len(slow)}\n")
+            if slow:
+                file.write(f"slow callbacks total: {sum(slow) * 1000:.3f} ms\n"
+                           f"slow callbacks max: {max(slow) * 1000:.3f} ms\n")
+            for callback, count in self.slow_handler.callbacks.most_common(TOP_STATS):
+                file.write(f"{count}\t{callback}\n")
+        logging.info(f"Event loop report written to {filename}")
+
+    def status(self) -> str:
+        return (f"cpu: {'on' if self.cpu_profile is not None else 'off'}, "
+                f"memory: {'on' if tracemalloc.is_tracing() else 'off'}, "
+                f"loop: {'on' if self.lag_task is not None else 'off'}")
+
+    def command(self, line: str) -> str:
+        """
+        Executes an admin command: "cpu [seconds|stop]", "mem [stop]", "loop [seconds|stop]", "sched" or "status"
+
+        :param line: command line received on the admin port
+        :return: status message
+        """
+        words = line.split()
+        if not words:
+            return self.status()
+        try:
+            duration = float(words[1]) if len(words) > 1 and words[1] != "stop" else DURATION
+        except ValueError:
+            return f"Invalid duration {words[1]}"
+        stop = len(words) > 1 and words[1] == "stop"
+        commands: Dict = {
+            "cpu": self.stop_cpu if stop else lambda: self.start_cpu(duration),
+            "mem": self.stop_memory if stop else self.snapshot_memory,
+            "loop": self.stop_loop if stop else lambda: self.start_loop(duration),
+            "sched": lambda: batch_scheduler.get_scheduler().report(),
+            "status": self.status,
+        }
+        if words[0] not in commands:
+            return f"Unknown command {words[0]}"
+        return commands[words[0]]()
+
+    def install_signal_handlers(self) -> None:
+        """SIGUSR1 profiles CPU and event loop for DURATION seconds, SIGUSR2 takes a memory snapshot"""
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, lambda: logging.info(
+                f"{self.start_cpu()}, {self.start_loop()}"))
+            loop.add_signal_handler(signal.SIGUSR2, lambda: logging.info(self.snapshot_memory()))
+        except (NotImplementedError, AttributeError):
+            logging.warning("Profiling signals are not supported on this platform")
+
+    async def admin_handler(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answers one admin command per line until the peer closes the connection"""
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            writer.write(f"{self.command(line.decode(errors='replace'))}\n".encode("utf-8"))
+            await writer.drain()
+        writer.close()
+
+    async def start_admin_server(self, host: str, port: int) -> asyncio.AbstractServer:
+        logging.info(f"Admin commands accepted on {host}:{port}")
+        return await asyncio.start_server(self.admin_handler, host, port)
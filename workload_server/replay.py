@@ -0,0 +1,160 @@
+from typing import Optional, List
+from collections import namedtuple, deque
+import logging
+import asyncio
+from workload_server import wl_db
+from workload_server.timer_wheel import TimerWheel, TimerHandle
+
+POLICIES = ("drop", "coalesce")
+
+PREFETCH_ROWS = 1024
+HIGH_WATER = 64 * 1024
+MAX_COALESCED_ROWS = 4096
+
+subscription = namedtuple("SUBSCRIPTION", ["bench_type", "wl_metrics", "row_offset", "interval", "speed",
+                                           "frame_rows", "policy"])
+
+_wheel: Optional[TimerWheel] = None
+
+
+def get_wheel() -> TimerWheel:
+    """Returns the timer wheel shared by every subscription of the server"""
+    global _wheel
+    if _wheel is None:
+        _wheel = TimerWheel()
+    return _wheel
+
+
+class ReplaySubscription:
+    """
+    Streams the rows of a source as small RFD frames of frame_rows rows, one every frame_rows * interval / speed
+    seconds so rows go out at one per interval / speed seconds whatever the size of the frames
+
+    Frames carry the row offset of their first row in place of the batch id, and an empty frame marks the end
+    of the source. Frames are due at absolute times, the timer wheel rounding each delay to its ticks without
+    the error adding up, and every frame due by a tick is sent in it when frames are due faster than the wheel
+    ticks. When the connection cannot keep up, frames are either dropped or coalesced into the next
+    frame sent, depending on the policy of the subscription.
+    """
+    def __init__(self, connection, protocol: str, request: subscription) -> None:
+        """
+
+        :param connection: AsyncConnection the frames are written to
+        :param protocol: protocol used to serialize the frames
+        :param request: parameters of the subscription
+        """
+        self.connection = connection
+        self.protocol = protocol
+        self.request = request
+        self.period = request.frame_rows * request.interval / request.speed
+        self.due = 0.0
+        self.keys = wl_db.selected_columns(request.wl_metrics)
+        self.buffer = deque()
+        self.position = request.row_offset
+        # Id of the last row prefetched, the first refill skipping the rows before row_offset
+        self.last_id = 0
+        self.skip = request.row_offset
+        self.exhausted = False
+        self.refill_task: Optional[asyncio.Task] = None
+        self.pending: List = []
+        self.pending_offset = request.row_offset
+        self.dropped = 0
+        self.sent = 0
+        self.handle: Optional[TimerHandle] = None
+        self.done: Optional[asyncio.Future] = None
+
+    async def run(self) -> None:
+        """Coroutine returning once the source is exhausted or the subscription is stopped"""
+        self.done = asyncio.get_running_loop().create_future()
+        await self.refill()
+        self.due = asyncio.get_running_loop().time() + self.period
+        self.handle = get_wheel().schedule(self.period, self.tick)
+        try:
+            await self.done
+        finally:
+            self.stop()
+            logging.info(f"Subscription to {self.request.bench_type} ended after {self.sent} rows, "
+                         f"{self.dropped} dropped")
+
+    def stop(self) -> None:
+        """Cancels the pending frame and releases the subscription"""
+        if self.handle is not None:
+            self.handle.cancel()
+        if self.refill_task is not None:
+            self.refill_task.cancel()
+        if self.done is not None and not self.done.done():
+            self.done.set_result(None)
+
+    async def refill(self) -> None:
+        """Coroutine prefetching the next rows of the source"""
+        (rows, self.last_id) = await wl_db.get_rows_after(self.request.bench_type, self.request.wl_metrics,
+                                                          self.last_id, PREFETCH_ROWS, self.skip)
+        self.skip = 0
+        self.buffer.extend(rows)
+        if len(rows) < PREFETCH_ROWS:
+            self.exhausted = True
+
+    def tick(self) -> None:
+        """Timer wheel callback sending the frames due now and scheduling the next one"""
+        now = asyncio.get_running_loop().time()
+        # A tick may fire up to half a tick early, the wheel rounding delays to the nearest tick
+        late = now + get_wheel().resolution / 2 - self.due
+        frames = int(late // self.period) + 1 if late >= 0 else 0
+        for _ in range(frames):
+            if not self.send_frame():
+                return
+        self.due += frames * self.period
+        self.handle = get_wheel().schedule(max(0.0, self.due - now), self.tick)
+
+    def send_frame(self) -> bool:
+        """
+        Sends the next frame, or applies the subscription policy to it if the connection cannot keep up
+
+        :return: False once the subscription is over
+        """
+        if self.connection.writer.is_closing():
+            self.stop()
+            return False
+
+        rows = [self.buffer.popleft() for _ in range(min(self.request.frame_rows, len(self.buffer)))]
+        if not self.exhausted and len(self.buffer) < PREFETCH_ROWS // 2 \
+                and (self.refill_task is None or self.refill_task.done()):
+            self.refill_task = asyncio.get_running_loop().create_task(self.refill())
+
+        if not rows and not self.pending:
+            if self.exhausted and not self.buffer:
+                # Source is over, an empty frame tells the subscriber no more rows will follow
+                self.connection.write_rfd(self.position, self.protocol, self.keys, [])
+                self.stop()
+                return False
+        elif self.connection.writer.transport.get_write_buffer_size() > HIGH_WATER:
+            self.backpressure(rows)
+        else:
+            if not self.pending:
+                self.pending_offset = self.position
+            self.pending.extend(rows)
+            self.position += len(rows)
+            self.connection.write_rfd(self.pending_offset, self.protocol, self.keys, self.pending)
+            self.sent += len(self.pending)
+            self.pending = []
+        return True
+
+    def backpressure(self, rows: List) -> None:
+        """
+        Applies the subscription policy to rows which cannot be sent right now
+
+        :param rows: rows of the frame being held back
+        """
+        if self.request.policy == "coalesce":
+            if not self.pending:
+                self.pending_offset = self.position
+            self.pending.extend(rows)
+            overflow = len(self.pending) - MAX_COALESCED_ROWS
+            if overflow > 0:
+                # Only the most recent rows are kept once the coalescing buffer is full
+                del self.pending[:overflow]
+                self.pending_offset += overflow
+                self.dropped += overflow
+        else:
+            self.dropped += len(rows)
+        self.position += len(rows)
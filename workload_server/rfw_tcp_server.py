@@ -1,11 +1,20 @@
-from typing import Optional, List
+from typing import Optional, List, Tuple
 import logging
 from collections import namedtuple
 import struct
 import json
 import asyncio
+import socket
+import os
+import io
+import csv
+import zlib
+import sqlite3
 from sqlite3 import Row
-from workload_server import wl_db
+from workload_server import wl_db, codec
+from workload_server.replay import ReplaySubscription, subscription, POLICIES
+from workload_server.predicate import parse, PredicateError
+from workload_server import shm_ring, wl_stats, ingest, prerender, batch_scheduler
 import workload_protocol_pb2
 from google.protobuf.message import DecodeError
 
@@ -17,14 +26,97 @@ MAX_FAIL = 3
 RFW_HEADER_FORMAT = "!3sI4sQ"
 RFW_HEADER_SIZE = struct.calcsize(RFW_HEADER_FORMAT)
 RFW_HEADER_MARKER = "RFW"
+SUB_HEADER_MARKER = "SUB"
+VERSION_MARKER = "VER"
+SHM_MARKER = "SHM"
+# Statistics of the sources, answered from the precomputed summaries with a frame of the same marker
+STATS_MARKER = "STA"
+# Rows appended to a source, acknowledged with a frame of the same marker once committed
+INGEST_MARKER = "ING"
+# Frames the client allows the server to send in addition to those already allowed, see Credit
+CREDIT_MARKER = "CRD"
+# Every row of some sources as one CSV stream, sent in data frames then an end frame holding the row count
+EXPORT_MARKER = "EXP"
+REQUEST_MARKERS = (RFW_HEADER_MARKER, SUB_HEADER_MARKER, VERSION_MARKER, SHM_MARKER, STATS_MARKER, INGEST_MARKER,
+                   CREDIT_MARKER, EXPORT_MARKER)
+SHM_REQUEST_FORMAT = "!Q"
+CREDIT_FORMAT = "!I"
+CREDIT_FRAME_SIZE = RFW_HEADER_SIZE + struct.calcsize(CREDIT_FORMAT)
 
 RFD_HEADER_FORMAT = "!3sII4sQ"
 RFD_HEADER_MARKER = "RFD"
+# A chunked batch is sent as a header frame holding its keys, row chunks, then an end frame
+CHUNK_HEADER_MARKER = "RFH"
+CHUNK_MARKER = "RFC"
+CHUNK_END_MARKER = "RFE"
+# Descriptor of an RFD payload placed in the shared memory ring of the connection
+SHARED_RFD_MARKER = "RFS"
+EXPORT_DATA_MARKER = "EXD"
+EXPORT_END_MARKER = "EXE"
+EXPORT_CHUNK_ROWS = 10_000
+MAX_EXPORT_SOURCES = 16
+# Fastest level, so compressing keeps up with the network
+EXPORT_GZIP_LEVEL = 1
 
 FAIL_MARKER = "NOP"
 
-rfw_header = namedtuple("RFW_Header", ["protocol", "payload_size"])
-rfw = namedtuple("RFW", ["bench_type", "wl_metrics", "batch_unit", "batch_id", "batch_size"])
+rfw_header = namedtuple("RFW_Header", ["marker", "protocol", "payload_size"])
+rfw = namedtuple("RFW", ["bench_type", "wl_metrics", "batch_unit", "batch_id", "batch_size", "chunk_rows",
+                         "predicate", "credit", "priority"],
+                 defaults=(0, None, 0, batch_scheduler.DEFAULT_PRIORITY))
+
+
+class Credit:
+    """
+    Number of data frames the client allows the server to send, for RFWs asking for flow control
+
+    Every frame the client hands to its sink costs a credit: RFD, RFS and RFC frames, and the RFE frame
+    ending a chunked batch. The client grants credits back as its sink writes the batches, so a slow sink
+    holds the server back instead of letting batches pile up in buffers.
+    """
+    def __init__(self, initial: int) -> None:
+        self.available = initial
+        self.granted = asyncio.Event()
+        self.closed = False
+
+    def grant(self, credits: int) -> None:
+        self.available += credits
+        self.granted.set()
+
+    def close(self) -> None:
+        """Wakes up the sender for good, the peer being gone"""
+        self.closed = True
+        self.granted.set()
+
+    async def spend(self) -> None:
+        """
+        Waits for a credit and takes it
+
+        :raises ConnectionResetError: if the peer went away while the server waited
+        """
+        while self.available <= 0:
+            if self.closed:
+                raise ConnectionResetError("Peer closed the connection while the server waited for credit")
+            self.granted.clear()
+            await self.granted.wait()
+        self.available -= 1
+
+
+def is_count(value) -> bool:
+    """Tells whether a field of a request holds a non-negative integer, booleans excluded"""
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def encode_csv(template: str, rows: List, compressor=None) -> bytes:
+    """
+    Formats rows as CSV lines, compressed as the continuation of the stream of the compressor if given
+
+    :param template: %-format of a line, with a %s field per column
+    :param rows: row tuples
+    :param compressor: zlib compression object of the stream, None to leave the lines uncompressed
+    """
+    data = "".join([template % row for row in rows]).encode("utf-8")
+    return compressor.compress(data) if compressor is not None else data
 
 
 class AsyncConnection:
@@ -37,30 +129,66 @@ class AsyncConnection:
         """
         self.reader = reader
         self.writer = writer
-        self.peer = self.writer.get_extra_info('peername')
+        # Unix socket peers have no address, the socket path stands in for it
+        self.peer = self.writer.get_extra_info('peername') or (self.writer.get_extra_info('sockname'), 0)
         self.rfw_id = None
         self.failed_attempts = 0
-        self.writer_tasks = []
+        self.writer_tasks = set()
+        self.ring: Optional[shm_ring.ShmRing] = None
+        self.credit: Optional[Credit] = None
         logging.info(f"Connection open with {self.peer[0]}:{self.peer[1]}")
 
     async def run(self) -> None:
         """Coroutine to handle a TCP stream asynchronously"""
+        try:
+            await self.serve_requests()
+        finally:
+            # Unlinked whatever ended the connection, a ring left behind would hold its memory until reboot
+            if self.ring is not None:
+                self.ring.close()
+                self.ring = None
+
+    async def serve_requests(self) -> None:
+        """Answers the requests of the peer until it closes the connection"""
         while not self.writer.is_closing():
             n_header = await self.get_header()
             if n_header is not None:
                 payload = await self.get_payload(n_header.payload_size)
 
                 if payload is not None:
-                    if n_header.protocol == "JSON":
-                        if await self.prepare_json_replies(payload):
-                            await asyncio.gather(*self.writer_tasks)
+                    if n_header.marker == VERSION_MARKER:
+                        await self.send_version(n_header.protocol)
+                        continue
+                    elif n_header.marker == SUB_HEADER_MARKER:
+                        if await self.start_subscription(n_header.protocol, payload):
                             self.writer.close()
                             break
+                    elif n_header.marker == SHM_MARKER:
+                        if await self.open_ring(n_header.protocol, payload):
+                            continue
+                    elif n_header.marker == STATS_MARKER:
+                        if await self.send_stats(n_header.protocol, payload):
+                            continue
+                    elif n_header.marker == INGEST_MARKER:
+                        if await self.ingest_rows(n_header.protocol, payload):
+                            continue
+                    elif n_header.marker == EXPORT_MARKER:
+                        if await self.export_sources(n_header.protocol, payload):
+                            continue
+                    elif n_header.marker == CREDIT_MARKER:
+                        # Credits granted after the last frame of the previous RFW have nothing left to pay for
+                        continue
+                    elif n_header.protocol == "JSON":
+                        if await self.prepare_json_replies(payload):
+                            # The connection stays open for the next RFW of the peer
+                            await asyncio.gather(*self.writer_tasks)
+                            continue
                     elif n_header.protocol == "BUFF":
                         if await self.prepare_protobuf_replies(payload):
                             await asyncio.gather(*self.writer_tasks)
-                            self.writer.close()
-                            break
+                            continue
+            elif self.reader.at_eof():
+                break
 
             self.writer.write(struct.pack(RFD_HEADER_FORMAT,
                                           bytes(FAIL_MARKER.encode("utf-8")),
@@ -74,9 +202,12 @@ class AsyncConnection:
                 logging.error(f"Too many failed attempts from {self.peer[0]}:{self.peer[1]}, closing connection")
                 self.writer.close()
 
+        # The transport stays half open after the EOF of the peer until it is closed here
+        self.writer.close()
         try:
             await self.writer.wait_closed()
-        except BrokenPipeError:
+        except (BrokenPipeError, ConnectionResetError):
+            # A peer that went away mid reply resets the connection instead of closing it
             pass
 
     async def get_header(self) -> Optional[rfw_header]:
@@ -87,23 +218,26 @@ class AsyncConnection:
         """
         try:
             header = await self.reader.readexactly(RFW_HEADER_SIZE)
-        except asyncio.IncompleteReadError:
-            logging.error(f"Connection with {self.peer[0]}:{self.peer[1]} closed before receiving header")
-            self.failed_attempts += 1
+        except asyncio.IncompleteReadError as err:
+            if err.partial:
+                logging.error(f"Connection with {self.peer[0]}:{self.peer[1]} closed before receiving header")
+                self.failed_attempts += 1
+            else:
+                logging.info(f"Connection closed by {self.peer[0]}:{self.peer[1]}")
             return None
         (marker, rfw_id, protocol, payload_size) = struct.unpack(RFW_HEADER_FORMAT, header)
 
         decoded_marker = marker.decode()
-        if decoded_marker == RFW_HEADER_MARKER:
+        if decoded_marker in REQUEST_MARKERS:
             decoded_protocol = protocol.decode()
             if decoded_protocol == "JSON" or decoded_protocol == "BUFF":
-                if self.rfw_id is None:
+                # A pooled connection carries the requests of successive clients, replies echo the ID of the
+                # request being served. Credit frames of an RFW that already ended are dropped as they are.
+                if decoded_marker != CREDIT_MARKER:
                     self.rfw_id = rfw_id
-                elif self.rfw_id != rfw_id:
-                    logging.warning(f"Mismatching RFW ID received from {self.peer[0]}:{self.peer[1]}. "
-                                    f"Expected {self.rfw_id}, got {rfw_id} instead")
 
-                return rfw_header(protocol=decoded_protocol,
+                return rfw_header(marker=decoded_marker,
+                                  protocol=decoded_protocol,
                                   payload_size=payload_size)
 
         logging.error(f"Invalid header received from {self.peer[0]}:{self.peer[1]}")
@@ -131,15 +265,34 @@ class AsyncConnection:
         :return: RFW or NoneType
         """
         try:
+            filter_expr = received.get("filter")
+            if filter_expr is not None and not isinstance(filter_expr, str):
+                raise PredicateError(f"Expected a string, got {type(filter_expr).__name__}")
             n_rfw = rfw(bench_type=received["bench_type"],
                         wl_metrics=received["wl_metrics"],
                         batch_unit=received["batch_unit"],
                         batch_id=received["batch_id"],
-                        batch_size=received["batch_size"])
+                        batch_size=received["batch_size"],
+                        chunk_rows=received.get("chunk_rows", 0),
+                        predicate=parse(filter_expr) if filter_expr else None,
+                        credit=received.get("credit", 0),
+                        priority=received.get("priority", batch_scheduler.DEFAULT_PRIORITY))
         except KeyError:
             self.failed_attempts += 1
             logging.error(f"Wrong json format from {self.peer[0]}:{self.peer[1]}")
             return None
+        except PredicateError as err:
+            self.failed_attempts += 1
+            logging.error(f"Invalid filter from {self.peer[0]}:{self.peer[1]}: {err}")
+            return None
+        # Used in comparisons and arithmetic while the batches are sent, where other types would raise
+        # The priority also indexes the classes of the batch scheduler
+        for field in ("chunk_rows", "credit", "priority"):
+            value = getattr(n_rfw, field)
+            if not is_count(value) or (field == "priority" and value >= len(batch_scheduler.PRIORITIES)):
+                self.failed_attempts += 1
+                logging.error(f"Invalid {field} {value!r} from {self.peer[0]}:{self.peer[1]}")
+                return None
 
         logging.info(f"Received request for workload from {self.peer[0]}:{self.peer[1]}")
         return n_rfw
@@ -157,23 +310,9 @@ class AsyncConnection:
             logging.error(f"Unable to decode received data from {self.peer[0]}:{self.peer[1]}")
             return False
 
-        for i in range(new_rfw.batch_size):
-            curr_batch_id = new_rfw.batch_id+i
-            curr_batch = await wl_db.get_batch(new_rfw.bench_type, new_rfw.wl_metrics,
-                                               new_rfw.batch_unit, curr_batch_id)
-            serialized = json.dumps({"keys": curr_batch[0].keys(),
-                                     "data": [tuple(row) for row in curr_batch]})
-            serialized_length = len(serialized)
-            rfd_header = struct.pack(RFD_HEADER_FORMAT,
-                                     bytes(RFD_HEADER_MARKER.encode("utf-8")),
-                                     self.rfw_id,
-                                     curr_batch_id,
-                                     b"JSON",
-                                     serialized_length)
-            self.writer_tasks.append(asyncio.create_task(self.send_reply(rfd_header, bytes(serialized.encode("utf-8")),
-                                                                         serialized_length, curr_batch_id)))
-
-        return True
+        if new_rfw is None:
+            return False
+        return await self.send_batches(new_rfw, "JSON")
 
     async def prepare_protobuf_replies(self, payload: bytes) -> bool:
         proto_rfw = workload_protocol_pb2.ProtoRfw()
@@ -184,45 +323,511 @@ class AsyncConnection:
             logging.error(f"Unable to decode received data from {self.peer[0]}:{self.peer[1]}")
             return False
 
-        logging.info(f"Received request for workload from {self.peer[0]}:{self.peer[1]}")
+        new_rfw = await self.check_rfw({field.name: getattr(proto_rfw, field.name)
+                                        for field in proto_rfw.DESCRIPTOR.fields})
+        if new_rfw is None:
+            return False
+        return await self.send_batches(new_rfw, "BUFF")
+
+    async def send_batches(self, new_rfw: rfw, protocol: str) -> bool:
+        """
+        Queries, serializes and sends the batches of an RFW, stopping after the first short batch
+        since it marks the end of the source
+
+        :param new_rfw: validated RFW
+        :param protocol: protocol used to serialize the batches
+        :return: False if the RFW selects no column
+        """
+        keys = wl_db.selected_columns(new_rfw.wl_metrics)
+        if not keys:
+            self.failed_attempts += 1
+            logging.error(f"No metric selected by {self.peer[0]}:{self.peer[1]}")
+            return False
+
+        credit_reader = None
+        if new_rfw.credit > 0:
+            self.credit = Credit(new_rfw.credit)
+            credit_reader = asyncio.create_task(self.read_credits(self.credit))
+        try:
+            await self.send_batch_range(new_rfw, protocol, keys)
+        except ConnectionResetError as err:
+            logging.error(f"Unable to send batches to {self.peer[0]}:{self.peer[1]}: {err}")
+        finally:
+            if credit_reader is not None:
+                # A credit frame being read stays in the stream buffer, the request loop drops it. The reader
+                # is waited for, since the request loop cannot read the stream until it is done
+                credit_reader.cancel()
+                await asyncio.gather(credit_reader, return_exceptions=True)
+                self.credit = None
+        return True
+
+    async def send_batch_range(self, new_rfw: rfw, protocol: str, keys: List[str]) -> None:
+        """Sends the batches of an RFW, taking a credit before each data frame when the RFW asked for credit"""
+        for i in range(new_rfw.batch_size):
+            curr_batch_id = new_rfw.batch_id + i
+            if new_rfw.chunk_rows > 0:
+                if await self.send_chunked_batch(new_rfw, protocol, keys, curr_batch_id) < new_rfw.batch_unit:
+                    break
+                continue
+
+            # Taken before querying, so a batch waiting for credit holds no memory
+            await self.spend_credit()
+            if await self.send_prerendered(new_rfw, protocol, curr_batch_id):
+                # Only full batches are pre-rendered, so the source goes on
+                continue
+            # Only the query and serialization hold a slot, not the wait for the client
+            async with batch_scheduler.slot(self.peer[0], self, new_rfw.priority, new_rfw.batch_unit):
+                curr_batch = await wl_db.get_batch(new_rfw.bench_type, new_rfw.wl_metrics,
+                                                   new_rfw.batch_unit, curr_batch_id, new_rfw.predicate)
+                serialized = await codec.serialize(protocol, keys, [tuple(row) for row in curr_batch])
+            serialized_length = len(serialized)
+            if self.ring is not None:
+                await self.send_shared(curr_batch_id, protocol, serialized)
+                if len(curr_batch) < new_rfw.batch_unit:
+                    break
+                continue
 
-        for i in range(proto_rfw.batch_size):
-            curr_batch_id = proto_rfw.batch_id + i
-            curr_batch = await wl_db.get_batch(proto_rfw.bench_type, proto_rfw.wl_metrics,
-                                               proto_rfw.batch_unit, curr_batch_id)
-            proto_rfd = self.create_proto_rfd(curr_batch)
-            serialized = proto_rfd.SerializeToString()
-            serialized_length = proto_rfd.ByteSize()
             rfd_header = struct.pack(RFD_HEADER_FORMAT,
                                      bytes(RFD_HEADER_MARKER.encode("utf-8")),
                                      self.rfw_id,
                                      curr_batch_id,
-                                     b"BUFF",
+                                     bytes(protocol.encode("utf-8")),
                                      serialized_length)
-            self.writer_tasks.append(asyncio.create_task(self.send_reply(rfd_header, serialized,
-                                                                         serialized_length, curr_batch_id)))
+            self.track_writer(asyncio.create_task(self.send_reply(rfd_header, serialized,
+                                                                  serialized_length, curr_batch_id)))
+            if len(curr_batch) < new_rfw.batch_unit:
+                break
+
+    async def send_prerendered(self, new_rfw: rfw, protocol: str, batch_id: int) -> bool:
+        """
+        Sends a batch from its pre-rendered file, copied by the kernel from the page cache to the socket
+
+        :return: False if the batch was not pre-rendered, or cannot be sent as is
+        """
+        if new_rfw.predicate is not None or self.ring is not None:
+            return False
+        location = prerender.locate(prerender.Combination(new_rfw.bench_type, new_rfw.wl_metrics,
+                                                          new_rfw.batch_unit, protocol), batch_id)
+        if location is None:
+            return False
+        (rendered, offset, size) = location
+        # Replies of the previous batches are written before the header, so frames cannot interleave
+        if self.writer_tasks:
+            await asyncio.wait(set(self.writer_tasks))
+        self.writer.write(self.pack_rfd_header(RFD_HEADER_MARKER, batch_id, protocol, size))
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.sendfile(self.writer.transport, rendered.file, offset, size, fallback=False)
+        except asyncio.SendfileNotAvailableError:
+            # Read at an explicit offset, since the file is shared by every connection, and off the event loop
+            self.writer.write(await loop.run_in_executor(None, os.pread, rendered.file.fileno(), size, offset))
+            await self.writer.drain()
+        return True
+
+    async def read_credits(self, credit: Credit) -> None:
+        """
+        Reads the credit frames the client sends while the batches of an RFW are being sent
+
+        The header is read first, so any other request is detected before its payload is touched. The stream
+        cannot be parsed past a request the server will not answer, so the connection is closed on one.
+        Once a credit header is read, its payload is read even if the reader is cancelled meanwhile, leaving
+        the request loop at the start of the next frame.
+        """
+        try:
+            while True:
+                header = await self.reader.readexactly(RFW_HEADER_SIZE)
+                (marker, _, _, payload_size) = struct.unpack(RFW_HEADER_FORMAT, header)
+                if marker != bytes(CREDIT_MARKER.encode("utf-8")) or \
+                        payload_size != CREDIT_FRAME_SIZE - RFW_HEADER_SIZE:
+                    self.failed_attempts += 1
+                    logging.error(f"Unexpected request from {self.peer[0]}:{self.peer[1]} while sending batches, "
+                                  f"closing connection")
+                    self.writer.close()
+                    break
+                payload_read = asyncio.ensure_future(self.reader.readexactly(payload_size))
+                try:
+                    payload = await asyncio.shield(payload_read)
+                except asyncio.CancelledError:
+                    await asyncio.gather(payload_read, return_exceptions=True)
+                    raise
+                credit.grant(struct.unpack(CREDIT_FORMAT, payload)[0])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            credit.close()
+
+    async def spend_credit(self) -> None:
+        if self.credit is not None:
+            await self.credit.spend()
+
+    async def send_chunked_batch(self, new_rfw: rfw, protocol: str, keys: List[str], batch_id: int) -> int:
+        """
+        Streams a batch as chunks of at most chunk_rows rows read from a cursor, so neither side ever holds
+        more than a chunk of it
+
+        :param new_rfw: validated RFW
+        :param protocol: protocol used to serialize the chunks
+        :param keys: names of the selected columns
+        :param batch_id: id of the batch
+        :return: number of rows sent
+        """
+        # The header frame is an empty RFD, giving the keys even if the batch has no row
+        head = codec.encode_rows(protocol, keys, [])
+        self.writer.writelines((self.pack_rfd_header(CHUNK_HEADER_MARKER, batch_id, protocol, len(head)), head))
+        rows = 0
+        chunks = wl_db.iter_rows(new_rfw.bench_type, new_rfw.wl_metrics, new_rfw.batch_unit * batch_id,
+                                 new_rfw.batch_unit, new_rfw.chunk_rows, new_rfw.predicate)
+        try:
+            while True:
+                # Each chunk is scheduled on its own, so a large batch takes turns with the other connections
+                async with batch_scheduler.slot(self.peer[0], self, new_rfw.priority, new_rfw.chunk_rows):
+                    try:
+                        chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    serialized = await codec.serialize(protocol, keys, [tuple(row) for row in chunk])
+                await self.spend_credit()
+                self.writer.writelines((self.pack_rfd_header(CHUNK_MARKER, batch_id, protocol, len(serialized)),
+                                        serialized))
+                # Waiting for the transport to drain bounds the memory to a chunk per connection
+                await self.writer.drain()
+                rows += len(chunk)
+        finally:
+            await chunks.aclose()
+        await self.spend_credit()
+        self.writer.write(self.pack_rfd_header(CHUNK_END_MARKER, batch_id, protocol, 0))
+        await self.writer.drain()
+        logging.info(f"Sent {rows} rows of batch {batch_id} to {self.peer[0]}:{self.peer[1]} in chunks")
+        return rows
+
+    async def send_shared(self, batch_id: int, protocol: str, serialized: bytes) -> None:
+        """
+        Copies a payload in the shared memory ring and sends its descriptor, or sends the payload itself when
+        it is larger than the ring
+
+        Frames are written in order rather than from separate tasks, since a descriptor can only be sent
+        once the ring has room for its payload.
+
+        :param batch_id: id of the batch
+        :param protocol: protocol the payload is serialized with
+        :param serialized: serialized RFD
+        """
+        if self.ring.fits(len(serialized)):
+            descriptor = self.ring.descriptor(await self.ring.put(serialized, self.connected))
+            self.writer.writelines((self.pack_rfd_header(SHARED_RFD_MARKER, batch_id, protocol, len(descriptor)),
+                                    descriptor))
+        else:
+            self.writer.writelines((self.pack_rfd_header(RFD_HEADER_MARKER, batch_id, protocol, len(serialized)),
+                                    serialized))
+        await self.writer.drain()
+
+    def connected(self) -> bool:
+        """Tells whether the peer may still read replies, as far as can be seen without reading the stream"""
+        return not self.writer.is_closing() and not self.reader.at_eof() and self.reader.exception() is None
 
+    async def open_ring(self, protocol: str, payload: bytes) -> bool:
+        """
+        Creates the shared memory ring batches are sent through from now on and replies with its name
+
+        Only peers connected through the Unix socket, hence running on this host, can use a ring.
+
+        :param protocol: protocol of the request, echoed in the reply header
+        :param payload: requested ring size
+        :return: False if the ring could not be created
+        """
+        sock = self.writer.get_extra_info("socket")
+        if sock is None or sock.family != getattr(socket, "AF_UNIX", None) or not shm_ring.available() \
+                or len(payload) != struct.calcsize(SHM_REQUEST_FORMAT):
+            self.failed_attempts += 1
+            logging.error(f"Unable to share memory with {self.peer[0]}:{self.peer[1]}")
+            return False
+
+        if self.ring is None:
+            (size,) = struct.unpack(SHM_REQUEST_FORMAT, payload)
+            self.ring = shm_ring.create_ring(size)
+            logging.info(f"Sending batches to {self.peer[0]}:{self.peer[1]} through {self.ring.size} bytes "
+                         f"of shared memory")
+        name = bytes(self.ring.name.encode("utf-8"))
+        self.writer.writelines((self.pack_rfd_header(SHM_MARKER, 0, protocol, len(name)), name))
+        await self.writer.drain()
         return True
 
+    def pack_rfd_header(self, marker: str, batch_id: int, protocol: str, payload_size: int) -> bytes:
+        return struct.pack(RFD_HEADER_FORMAT,
+                           bytes(marker.encode("utf-8")),
+                           self.rfw_id,
+                           batch_id,
+                           bytes(protocol.encode("utf-8")),
+                           payload_size)
+
+    def track_writer(self, task: asyncio.Task) -> None:
+        """
+        Keeps a reference to a send task until it completes, so finished tasks are not retained for the
+        life of the connection
+
+        :param task: task sending a reply
+        """
+        self.writer_tasks.add(task)
+        task.add_done_callback(self.writer_done)
+
+    def writer_done(self, task: asyncio.Task) -> None:
+        self.writer_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Unable to send reply to {self.peer[0]}:{self.peer[1]}: {task.exception()!r}")
+
     async def send_reply(self, rfd_header: bytes, rfd: bytes, length: int, batch_id: int) -> None:
-        logging.error(f"Sending {length} bytes of batch {batch_id} "
-                      f"to {self.peer[0]}:{self.peer[1]}")
-        self.writer.write(rfd_header)
+        logging.debug(f"Sending {length} bytes of batch {batch_id} to {self.peer[0]}:{self.peer[1]}")
+        # Header and payload are written together so concurrent replies cannot interleave
+        self.writer.writelines((rfd_header, rfd))
+        await self.writer.drain()
+
+    async def send_version(self, protocol: str) -> None:
+        """
+        Replies with the version of the dataset, letting clients tell whether their cached batches are still valid
+
+        :param protocol: protocol of the request, echoed in the reply header
+        """
+        version = bytes(wl_db.get_dataset_version().encode("utf-8"))
+        self.writer.write(struct.pack(RFD_HEADER_FORMAT,
+                                      bytes(VERSION_MARKER.encode("utf-8")),
+                                      self.rfw_id,
+                                      0,
+                                      bytes(protocol.encode("utf-8")),
+                                      len(version)) + version)
         await self.writer.drain()
-        self.writer.write(rfd)
+
+    async def send_stats(self, protocol: str, payload: bytes) -> bool:
+        """
+        Replies with the statistics of the sources selected by a stats request, answered from the summaries and
+        range indexes built when the statistics were loaded, without touching the database
+
+        :param protocol: protocol of the request and of the reply
+        :param payload: serialized stats request
+        :return: False if the request could not be decoded
+        """
+        try:
+            if protocol == "BUFF":
+                proto_request = workload_protocol_pb2.ProtoStatsRequest()
+                proto_request.ParseFromString(payload)
+                received = {field.name: getattr(proto_request, field.name)
+                            for field in proto_request.DESCRIPTOR.fields}
+            else:
+                received = json.loads(payload)
+            sources = wl_stats.get_stats(received["bench_type"],
+                                         int(received.get("batch_unit", 0)),
+                                         int(received.get("row_offset", 0)),
+                                         int(received.get("row_count", 0)))
+        except (DecodeError, json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError):
+            self.failed_attempts += 1
+            logging.error(f"Unable to decode stats request from {self.peer[0]}:{self.peer[1]}")
+            return False
+
+        if protocol == "BUFF":
+            serialized = self.create_proto_stats(sources).SerializeToString()
+        else:
+            serialized = json.dumps({"sources": sources}).encode("utf-8")
+        self.writer.writelines((self.pack_rfd_header(STATS_MARKER, 0, protocol, len(serialized)), serialized))
         await self.writer.drain()
+        return True
+
+    async def export_sources(self, protocol: str, payload: bytes) -> bool:
+        """
+        Streams every row of the sources selected by an export request as CSV, read from a single scan of the
+        table and optionally compressed as one gzip stream
+
+        The CSV is sent in data frames of at most EXPORT_CHUNK_ROWS rows, each written once the previous one
+        drained, so the memory used does not depend on the size of the sources. An end frame holding the
+        number of rows follows the last one.
+
+        :param protocol: protocol of the request, echoed in the reply headers
+        :param payload: serialized export request
+        :return: False if the request could not be decoded or selects no column
+        """
+        try:
+            if protocol == "BUFF":
+                proto_export = workload_protocol_pb2.ProtoExport()
+                proto_export.ParseFromString(payload)
+                (sources, wl_metrics, gzip) = (list(proto_export.sources), proto_export.wl_metrics,
+                                               proto_export.gzip)
+            else:
+                received = json.loads(payload)
+                (sources, wl_metrics, gzip) = (received["sources"], int(received["wl_metrics"]),
+                                               bool(received.get("gzip", False)))
+            if not isinstance(sources, list) or not all(isinstance(source, str) for source in sources):
+                raise TypeError("sources must be a list of strings")
+        except (DecodeError, json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError):
+            self.failed_attempts += 1
+            logging.error(f"Unable to decode export request from {self.peer[0]}:{self.peer[1]}")
+            return False
+
+        keys = wl_db.selected_columns(wl_metrics)
+        if not keys or not 0 < len(sources) <= MAX_EXPORT_SOURCES:
+            self.failed_attempts += 1
+            logging.error(f"Export request from {self.peer[0]}:{self.peer[1]} selects no column, "
+                          f"or not between 1 and {MAX_EXPORT_SOURCES} sources")
+            return False
+
+        compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, wbits=31) if gzip else None
+        frames = 0
+
+        async def send(data: bytes) -> None:
+            nonlocal frames
+            if data:
+                self.writer.writelines((self.pack_rfd_header(EXPORT_DATA_MARKER, frames, protocol, len(data)), data))
+                await self.writer.drain()
+                frames += 1
+
+        columns = [*keys, wl_db.COLUMNS[-1]]
+        header = f"{','.join(columns)}\n".encode("utf-8")
+        await send(compressor.compress(header) if compressor is not None else header)
+        template = ",".join("%s" for _ in columns) + "\n"
+        loop = asyncio.get_running_loop()
+        rows = 0
+        chunks = wl_db.iter_sources(sources, wl_metrics, EXPORT_CHUNK_ROWS)
+
+        async def read_chunk() -> List[Tuple]:
+            # Exports are bulk work, reading only in the slots the RFWs leave free
+            async with batch_scheduler.slot(self.peer[0], self, batch_scheduler.BULK_PRIORITY, EXPORT_CHUNK_ROWS):
+                return await chunks.__anext__()
+
+        next_chunk = asyncio.ensure_future(read_chunk())
+        try:
+            while True:
+                try:
+                    chunk = await next_chunk
+                except StopAsyncIteration:
+                    break
+                # The next rows are read while these are formatted and sent
+                next_chunk = asyncio.ensure_future(read_chunk())
+                await send(await loop.run_in_executor(None, encode_csv, template, chunk, compressor))
+                rows += len(chunk)
+            if compressor is not None:
+                await send(compressor.flush())
+            count = bytes(str(rows).encode("utf-8"))
+            self.writer.writelines((self.pack_rfd_header(EXPORT_END_MARKER, frames, protocol, len(count)), count))
+            await self.writer.drain()
+        except sqlite3.Error as err:
+            # The client sees a failure frame instead of the end frame and drops what it received
+            logging.error(f"Unable to export {sources} to {self.peer[0]}:{self.peer[1]}: {err!r}")
+            return False
+        except ConnectionError as err:
+            logging.error(f"Unable to send export to {self.peer[0]}:{self.peer[1]}: {err!r}")
+            return True
+        finally:
+            # Stops the read ahead, so the cursor is closed even if the peer went away
+            next_chunk.cancel()
+            await asyncio.gather(next_chunk, return_exceptions=True)
+            await chunks.aclose()
+        logging.info(f"Exported {rows} rows of {', '.join(sources)} to {self.peer[0]}:{self.peer[1]}")
+        return True
+
+    async def ingest_rows(self, protocol: str, payload: bytes) -> bool:
+        """
+        Appends the rows of an ingest request and acknowledges them once committed, with the number of rows
+        in the batch id field and the new dataset version as payload
+
+        :param protocol: protocol of the request, echoed in the reply header
+        :param payload: serialized ingest request
+        :return: False if ingestion is disabled or the request is invalid
+        """
+        ingestor = ingest.get_ingestor()
+        if ingestor is None:
+            self.failed_attempts += 1
+            logging.error(f"Ingest request from {self.peer[0]}:{self.peer[1]} refused, ingestion is disabled")
+            return False
+        try:
+            (source, rows) = ingest.parse_request(protocol, payload)
+            version = await ingestor.append(source, rows)
+        except ingest.IngestError as err:
+            self.failed_attempts += 1
+            logging.error(f"Invalid ingest request from {self.peer[0]}:{self.peer[1]}: {err}")
+            return False
+        except sqlite3.Error:
+            return False
+
+        logging.info(f"Appended {len(rows)} rows to {source} for {self.peer[0]}:{self.peer[1]}")
+        version = bytes(version.encode("utf-8"))
+        self.writer.writelines((self.pack_rfd_header(INGEST_MARKER, len(rows), protocol, len(version)), version))
+        await self.writer.drain()
+        return True
 
     @staticmethod
-    def create_proto_rfd(batch: List[Row]) -> workload_protocol_pb2.ProtoRfd:
-        proto_rfd = workload_protocol_pb2.ProtoRfd()
-        keys = batch[0].keys()
-        proto_rfd.keys.extend(keys)
-        for row in batch:
-            workload = proto_rfd.workload.add()
-            for i, key in enumerate(keys):
-                setattr(workload, key, row[i])
+    def create_proto_stats(sources: List[dict]) -> workload_protocol_pb2.ProtoStats:
+        proto_stats = workload_protocol_pb2.ProtoStats()
+        for stats in sources:
+            proto_source = proto_stats.sources.add(source=stats["source"], rows=stats["rows"],
+                                                   row_offset=stats["row_offset"], row_count=stats["row_count"])
+            if stats["batches"] is not None:
+                proto_source.batches = stats["batches"]
+            for (name, summary) in stats["columns"].items():
+                proto_source.columns.add(name=name, **summary)
+        return proto_stats
+
+    async def start_subscription(self, protocol: str, payload: bytes) -> bool:
+        """
+        Streams a source to the peer at the rate requested in the subscription, until the source is exhausted
+        or the peer goes away
 
-        return proto_rfd
+        :param protocol: protocol of the subscription and of the frames sent back
+        :param payload: serialized subscription
+        :return: False if the subscription could not be decoded
+        """
+        try:
+            if protocol == "BUFF":
+                proto_sub = workload_protocol_pb2.ProtoSub()
+                proto_sub.ParseFromString(payload)
+                received = {field.name: getattr(proto_sub, field.name) for field in proto_sub.DESCRIPTOR.fields}
+            else:
+                received = json.loads(payload)
+            new_sub = subscription(bench_type=received["bench_type"],
+                                   wl_metrics=received["wl_metrics"],
+                                   row_offset=received.get("row_offset", 0),
+                                   interval=float(received.get("interval", 1.0)),
+                                   speed=float(received.get("speed", 1.0)),
+                                   frame_rows=received.get("frame_rows", 1),
+                                   policy=received.get("policy", "drop"))
+        except (DecodeError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+            self.failed_attempts += 1
+            logging.error(f"Unable to decode subscription from {self.peer[0]}:{self.peer[1]}")
+            return False
+
+        if new_sub.policy not in POLICIES or new_sub.interval <= 0 or new_sub.speed <= 0 \
+                or new_sub.frame_rows < 1 or not wl_db.selected_columns(new_sub.wl_metrics):
+            self.failed_attempts += 1
+            logging.error(f"Invalid subscription from {self.peer[0]}:{self.peer[1]}")
+            return False
+
+        logging.info(f"Received subscription to {new_sub.bench_type} from {self.peer[0]}:{self.peer[1]}")
+        replay = ReplaySubscription(self, protocol, new_sub)
+        # Anything read from the subscriber, including EOF, ends the subscription
+        watcher = asyncio.create_task(self.reader.read(1))
+        streamer = asyncio.create_task(replay.run())
+        await asyncio.wait((watcher, streamer), return_when=asyncio.FIRST_COMPLETED)
+        replay.stop()
+        watcher.cancel()
+        await streamer
+        return True
+
+    def write_rfd(self, batch_id: int, protocol: str, keys: List[str], rows: List) -> int:
+        """
+        Serializes rows and writes them as a single RFD frame without waiting for the transport
+
+        :param batch_id: value written in the batch id field of the header
+        :param protocol: protocol used to serialize the rows
+        :param keys: names of the columns of the rows
+        :param rows: rows to send
+        :return: size of the serialized payload
+        """
+        serialized = codec.encode_rows(protocol, keys, rows)
+        self.writer.write(struct.pack(RFD_HEADER_FORMAT,
+                                      bytes(RFD_HEADER_MARKER.encode("utf-8")),
+                                      self.rfw_id,
+                                      batch_id,
+                                      bytes(protocol.encode("utf-8")),
+                                      len(serialized)) + serialized)
+        return len(serialized)
+
+    create_proto_rfd = staticmethod(codec.create_proto_rfd)
 
 
 async def rfw_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
@@ -235,8 +840,28 @@ async def rfw_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter
     await AsyncConnection(reader, writer).run()
 
 
-async def start_rfw_server(host: str = HOST, port: int = PORT) -> asyncio.AbstractServer:
+def configure_logging() -> None:
+    """Sets the log format of the server, which only takes effect if nothing was logged before"""
     logging.basicConfig(format='%(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S', level=logging.INFO)
 
+
+async def start_rfw_server(host: str = HOST, port: int = PORT) -> asyncio.AbstractServer:
+    configure_logging()
+
     logging.info(f"Initializing server on {host}:{port}")
     return await asyncio.start_server(rfw_handler, host, port)
+
+
+async def start_unix_server(path: str) -> asyncio.AbstractServer:
+    """
+    Starts a server on a Unix domain socket, for clients on this host, which may also receive batches through
+    shared memory
+
+    :param path: path of the socket, replaced if it exists
+    """
+    configure_logging()
+
+    logging.info(f"Initializing server on unix://{path}")
+    if os.path.exists(path):
+        os.remove(path)
+    return await asyncio.start_unix_server(rfw_handler, path)
@@ -0,0 +1,93 @@
+from typing import Callable, Optional, Tuple
+import asyncio
+import struct
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+# The first 8 bytes of the block hold the position released by the client, payloads follow
+RING_HEADER_FORMAT = "<Q"
+RING_HEADER_SIZE = 64
+# Descriptor sent over the socket: offset of the payload in the ring, its length and the position the client
+# releases once it has copied the payload
+DESCRIPTOR_FORMAT = "!QQQ"
+
+MIN_RING_SIZE = 1 << 20
+MAX_RING_SIZE = 1 << 28
+POLL_INTERVAL = 0.001
+
+
+def available() -> bool:
+    return shared_memory is not None
+
+
+class ShmRing:
+    """
+    Single producer, single consumer ring of payloads in a shared memory block, written by the server
+
+    Positions count every byte ever written, so the space in use is the written position minus the position
+    released by the client. A payload never wraps: when it does not fit before the end of the ring, writing
+    starts over at its beginning and the skipped bytes are released along with the payload.
+    """
+    def __init__(self, size: int) -> None:
+        """
+
+        :param size: requested size of the block, clamped between MIN_RING_SIZE and MAX_RING_SIZE
+        """
+        size = max(MIN_RING_SIZE, min(MAX_RING_SIZE, size))
+        self.block = shared_memory.SharedMemory(create=True, size=size)
+        self.capacity = size - RING_HEADER_SIZE
+        self.written = 0
+        struct.pack_into(RING_HEADER_FORMAT, self.block.buf, 0, 0)
+
+    @property
+    def name(self) -> str:
+        return self.block.name
+
+    @property
+    def size(self) -> int:
+        return self.capacity + RING_HEADER_SIZE
+
+    def released(self) -> int:
+        # The client only ever stores this aligned 8 byte counter, which it increases monotonically
+        return struct.unpack_from(RING_HEADER_FORMAT, self.block.buf, 0)[0]
+
+    def fits(self, length: int) -> bool:
+        return length <= self.capacity
+
+    async def put(self, payload: bytes, alive: Callable[[], bool]) -> Tuple[int, int, int]:
+        """
+        Copies a payload in the ring, waiting for the client to release enough space
+
+        :param payload: serialized RFD, at most capacity bytes long
+        :param alive: tells whether the connection of the client is still open, checked while the ring is full
+        :return: descriptor fields, offset and length of the payload and position to release after reading it
+        :raises ConnectionResetError: if the connection closed while the ring was full
+        """
+        offset = self.written % self.capacity
+        start = self.written if offset + len(payload) <= self.capacity else self.written + self.capacity - offset
+        end = start + len(payload)
+        while end - self.released() > self.capacity:
+            if not alive():
+                # The client will never release the space, nobody is left to read the payload
+                raise ConnectionResetError("Connection closed while the shared memory ring was full")
+            await asyncio.sleep(POLL_INTERVAL)
+
+        offset = start % self.capacity
+        self.block.buf[RING_HEADER_SIZE + offset:RING_HEADER_SIZE + offset + len(payload)] = payload
+        self.written = end
+        return offset, len(payload), end
+
+    def descriptor(self, fields: Tuple[int, int, int]) -> bytes:
+        return struct.pack(DESCRIPTOR_FORMAT, *fields)
+
+    def close(self) -> None:
+        self.block.close()
+        self.block.unlink()
+
+
+def create_ring(size: int) -> Optional[ShmRing]:
+    """Returns a new ring, None if shared memory is not available on this platform"""
+    return ShmRing(size) if available() else None
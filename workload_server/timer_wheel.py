@@ -0,0 +1,79 @@
+from typing import Callable, List, Optional
+import logging
+import asyncio
+
+RESOLUTION = 0.01
+SLOTS = 512
+
+
+class TimerHandle:
+    """Handle on a callback scheduled in a TimerWheel"""
+    __slots__ = ("callback", "rounds", "cancelled")
+
+    def __init__(self, callback: Callable[[], None], rounds: int) -> None:
+        self.callback = callback
+        self.rounds = rounds
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel firing every scheduled callback from a single task
+
+    Callbacks are bucketed in SLOTS slots of RESOLUTION seconds each, so thousands of timers cost one
+    sleeping task instead of one per timer. Callbacks run on the event loop and must not block.
+    """
+    def __init__(self, resolution: float = RESOLUTION, slots: int = SLOTS) -> None:
+        """
+
+        :param resolution: duration of a tick in seconds
+        :param slots: number of slots in the wheel
+        """
+        self.resolution = resolution
+        self.slots: List[List[TimerHandle]] = [[] for _ in range(slots)]
+        self.position = 0
+        self.pending = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> TimerHandle:
+        """
+        Schedules callback to be called once after delay seconds, rounded to the nearest tick and at least one
+
+        :param delay: seconds to wait before calling callback
+        :param callback: function called without arguments
+        :return: handle which can be used to cancel the callback
+        """
+        ticks = max(1, int(delay / self.resolution + 0.5))
+        handle = TimerHandle(callback, (ticks - 1) // len(self.slots))
+        self.slots[(self.position + ticks) % len(self.slots)].append(handle)
+        self.pending += 1
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return handle
+
+    async def run(self) -> None:
+        """Coroutine advancing the wheel by one slot per tick until no timer is left"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while self.pending > 0:
+            # Sleep until an absolute deadline so slow ticks do not accumulate drift
+            deadline += self.resolution
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+            self.position = (self.position + 1) % len(self.slots)
+            slot = self.slots[self.position]
+            due = [handle for handle in slot if handle.rounds == 0]
+            kept = [handle for handle in slot if handle.rounds > 0]
+            for handle in kept:
+                handle.rounds -= 1
+            self.slots[self.position] = kept
+            self.pending -= len(due)
+
+            for handle in due:
+                if not handle.cancelled:
+                    try:
+                        handle.callback()
+                    except Exception:
+                        logging.exception("Timer callback failed")
@@ -1,10 +1,14 @@
 from io import StringIO
-from typing import Optional, Iterable, Tuple, List
+from typing import Optional, Iterable, Tuple, List, AsyncIterator, Sequence
 import requests
+import hashlib
 import csv
 import sqlite3
 import aiosqlite
 from contextlib import closing
+from collections import OrderedDict
+from array import array
+from workload_server.predicate import Predicate
 
 DB = "workload.db"
 SOURCE_URL = "https://raw.githubusercontent.com/"
@@ -17,6 +21,17 @@ ND_TEST_FILE = "NDBench-testing.csv"
 ND_TRAIN_FILE = "NDBench-training.csv"
 COLUMNS = ("cpu", "net_in", "net_out", "memory", "source")
 
+MATCH_CACHE_SIZE = 64
+
+_dataset_version: Optional[str] = None
+_row_count = 0
+_max_id = 0
+# Number of appends since startup, lets a reader tell whether rows were appended while it was querying
+_generation = 0
+# Predicate and ids of the rows matching it, by source, canonical filter and dataset version, least recently used
+# first. Appended rows are added to the ids as they are committed, the entries moving to the new version
+_match_positions: "OrderedDict[Tuple[str, str, str], Tuple[Predicate, array]]" = OrderedDict()
+
 
 def initialize_database() -> None:
     """Checks if database is populated, populating it if it isn't"""
@@ -116,7 +131,8 @@ def __insert_file(con: sqlite3.Connection, filename: str, csv_file: Iterable[Tup
                          for (CPU, Net_in, Net_out, Memory, Target) in csv_iterator])
 
 
-async def get_batch(bench_type: str, wl_metrics: int, batch_unit: int, batch_id: int) -> Optional[List[aiosqlite.Row]]:
+async def get_batch(bench_type: str, wl_metrics: int, batch_unit: int, batch_id: int,
+                    predicate: Optional[Predicate] = None) -> Optional[List[aiosqlite.Row]]:
     """
     Asynchronous coroutine that returns up to batch_unit metrics matching bench_type
 
@@ -124,18 +140,248 @@ async def get_batch(bench_type: str, wl_metrics: int, batch_unit: int, batch_id:
     :param wl_metrics: value to enable the columns bitwise (expects between 1 and 15)
     :param batch_unit: value representing the number of samples to return
     :param batch_id: value representing the current batch used to calculate offset
+    :param predicate: filter the rows must match, batches being taken from the matching rows only
     :return: Iterator of matching rows containing up to batch_unit values
     """
 
-    selected_col = [COLUMNS[n] for n in range(len(COLUMNS)-1) if (wl_metrics & (1 << n))]
+    return await get_rows(bench_type, wl_metrics, batch_unit * batch_id, batch_unit, predicate)
+
+
+async def get_rows(bench_type: str, wl_metrics: int, row_offset: int, count: int,
+                   predicate: Optional[Predicate] = None) -> Optional[List[aiosqlite.Row]]:
+    """
+    Asynchronous coroutine that returns up to count metrics matching bench_type, starting at row_offset
+
+    :param bench_type: String representing the files to get samples from (expects "DVD-training" or "NDBench-test")
+    :param wl_metrics: value to enable the columns bitwise (expects between 1 and 15)
+    :param row_offset: index of the first matching row to return
+    :param count: maximum number of rows to return
+    :param predicate: filter the rows must match, row_offset being counted in matching rows
+    :return: Iterator of matching rows containing up to count values
+    """
+
+    selected_col = selected_columns(wl_metrics)
     if not selected_col:
         return None
 
+    query = await __rows_query(bench_type, selected_col, row_offset, count, predicate)
+    if query is None:
+        return []
     async with aiosqlite.connect(DB) as con:
-        # Query can use f-string evaluation safely for TABLE and COLUMNS because they are local constant
-        # string literals but NOT for VALUES, so we use placeholders to make sure input is sanitized
         con.row_factory = sqlite3.Row
-        async with await con.execute(f"SELECT {', '.join(selected_col)} FROM {TABLE} WHERE "
-                                     f"{COLUMNS[-1]} LIKE ? LIMIT ? OFFSET ?;",
-                                     (bench_type+"%", batch_unit, batch_unit * batch_id)) as cur:
+        async with await con.execute(*query) as cur:
             return await cur.fetchall()
+
+
+async def iter_rows(bench_type: str, wl_metrics: int, row_offset: int, count: int,
+                    chunk_rows: int, predicate: Optional[Predicate] = None) -> AsyncIterator[List[aiosqlite.Row]]:
+    """
+    Asynchronous generator yielding up to count metrics matching bench_type, starting at row_offset,
+    in chunks of at most chunk_rows rows read from a single cursor
+
+    :param bench_type: String representing the files to get samples from (expects "DVD-training" or "NDBench-test")
+    :param wl_metrics: value to enable the columns bitwise (expects between 1 and 15)
+    :param row_offset: index of the first matching row to return
+    :param count: maximum number of rows to return
+    :param chunk_rows: maximum number of rows per chunk
+    :param predicate: filter the rows must match, row_offset being counted in matching rows
+    :return: Iterator of chunks of matching rows
+    """
+
+    selected_col = selected_columns(wl_metrics)
+    if not selected_col:
+        return
+
+    query = await __rows_query(bench_type, selected_col, row_offset, count, predicate)
+    if query is None:
+        return
+    async with aiosqlite.connect(DB) as con:
+        con.row_factory = sqlite3.Row
+        async with await con.execute(*query) as cur:
+            while True:
+                chunk = await cur.fetchmany(chunk_rows)
+                if not chunk:
+                    break
+                yield chunk
+
+
+async def get_rows_after(bench_type: str, wl_metrics: int, after_id: int, count: int,
+                         row_offset: int = 0) -> Tuple[List[Tuple], int]:
+    """
+    Asynchronous coroutine that returns up to count metrics matching bench_type stored after the row after_id,
+    in primary key order, along with the id of the last row returned
+
+    The next page starts after that id, so reading a source page by page costs the same for every page where
+    an OFFSET would scan every row before the page again.
+
+    :param bench_type: String representing the files to get samples from (expects "DVD-training" or "NDBench-test")
+    :param wl_metrics: value to enable the columns bitwise (expects between 1 and 15)
+    :param after_id: id of the last row already read, 0 to start from the first row of the source
+    :param count: maximum number of rows to return
+    :param row_offset: number of rows after after_id to skip first
+    :return: row tuples, and the id to pass to read the next page (after_id if no row was returned)
+    """
+
+    selected_col = selected_columns(wl_metrics)
+    if not selected_col:
+        return [], after_id
+
+    async with aiosqlite.connect(DB) as con:
+        # Query can use f-string evaluation safely for TABLE and COLUMNS because they are local constant string
+        # literals, but NOT for VALUES, so we use placeholders for them
+        async with await con.execute(f"SELECT id, {', '.join(selected_col)} FROM {TABLE} WHERE id > ? AND "
+                                     f"{COLUMNS[-1]} LIKE ? ORDER BY id LIMIT ? OFFSET ?;",
+                                     (after_id, bench_type+"%", count, row_offset)) as cur:
+            rows = await cur.fetchall()
+    if not rows:
+        return [], after_id
+    return [tuple(row[1:]) for row in rows], rows[-1][0]
+
+
+async def iter_sources(sources: Sequence[str], wl_metrics: int,
+                       chunk_rows: int) -> AsyncIterator[List[Tuple]]:
+    """
+    Asynchronous generator yielding every row of the sources starting with any of the prefixes, followed by
+    its source, in chunks of at most chunk_rows rows read from a single sequential scan of the table
+
+    :param sources: prefixes of the sources, like bench_type
+    :param wl_metrics: value to enable the columns bitwise (expects between 1 and 15)
+    :param chunk_rows: maximum number of rows per chunk
+    :return: Iterator of chunks of row tuples
+    """
+
+    selected_col = selected_columns(wl_metrics)
+    if not selected_col or not sources:
+        return
+
+    async with aiosqlite.connect(DB) as con:
+        # Query can use f-string evaluation safely for TABLE and COLUMNS because they are local constant string
+        # literals, but NOT for VALUES, so we use placeholders for the prefixes. Rows are read in primary key
+        # order, which is the order they are stored in
+        async with await con.execute(f"SELECT {', '.join(selected_col)}, {COLUMNS[-1]} FROM {TABLE} WHERE "
+                                     f"{' OR '.join(f'{COLUMNS[-1]} LIKE ?' for _ in sources)} ORDER BY id;",
+                                     tuple(source+"%" for source in sources)) as cur:
+            while True:
+                chunk = await cur.fetchmany(chunk_rows)
+                if not chunk:
+                    break
+                yield chunk
+
+
+async def __rows_query(bench_type: str, selected_col: List[str], row_offset: int, count: int,
+                       predicate: Optional[Predicate]) -> Optional[Tuple[str, Tuple]]:
+    """
+    Builds the query selecting a range of the rows of bench_type
+
+    Without a predicate, the range is an offset in the rows of the source. With one, it is an offset in the
+    ids of the matching rows, so it becomes a range of primary keys and a batch_id always designates the
+    same matching rows for a given dataset version.
+
+    :return: query and its parameters, None if the range holds no row
+    """
+
+    # Query can use f-string evaluation safely for TABLE, COLUMNS and the predicate because they are local
+    # constant string literals or validated column names, but NOT for VALUES, so we use placeholders for them
+    if predicate is None:
+        return (f"SELECT {', '.join(selected_col)} FROM {TABLE} WHERE "
+                f"{COLUMNS[-1]} LIKE ? LIMIT ? OFFSET ?;",
+                (bench_type+"%", count, row_offset))
+
+    matched = (await get_match_positions(bench_type, predicate))[row_offset:row_offset + count]
+    if not matched:
+        return None
+    return (f"SELECT {', '.join(selected_col)} FROM {TABLE} WHERE id BETWEEN ? AND ? AND "
+            f"{COLUMNS[-1]} LIKE ? AND {predicate.sql} ORDER BY id;",
+            (matched[0], matched[-1], bench_type+"%", *predicate.params))
+
+
+async def get_match_positions(bench_type: str, predicate: Predicate) -> array:
+    """
+    Returns the ids of the rows of bench_type matching the predicate in ascending order, reusing the ids found
+    for the same source, filter and dataset version
+
+    :param bench_type: String representing the files to get samples from (expects "DVD-training" or "NDBench-test")
+    :param predicate: filter the rows must match
+    :return: array of row ids
+    """
+    key = (bench_type, predicate.canonical, get_dataset_version())
+    entry = _match_positions.get(key)
+    if entry is not None:
+        _match_positions.move_to_end(key)
+        return entry[1]
+
+    generation = _generation
+    async with aiosqlite.connect(DB) as con:
+        # Query can use f-string evaluation safely for TABLE, COLUMNS and the predicate, see __rows_query
+        async with await con.execute(f"SELECT id FROM {TABLE} WHERE {COLUMNS[-1]} LIKE ? AND "
+                                     f"{predicate.sql} ORDER BY id;",
+                                     (bench_type+"%", *predicate.params)) as cur:
+            positions = array("q", (row_id for (row_id,) in await cur.fetchall()))
+
+    # Rows committed during the query may be missing from its result, which is then not kept
+    if generation != _generation:
+        return positions
+    _match_positions[key] = (predicate, positions)
+    while len(_match_positions) > MATCH_CACHE_SIZE:
+        _match_positions.popitem(last=False)
+    return positions
+
+
+def get_dataset_version() -> str:
+    """
+    Returns an identifier of the current content of the database, computed on first call
+
+    Rows are only ever appended, so the row count and the highest id identify a version of the dataset.
+
+    :return: hexadecimal version string
+    """
+    global _dataset_version, _row_count, _max_id
+    if _dataset_version is None:
+        with closing(sqlite3.connect(DB)) as con:
+            # Query can be built safely from f-string evaluation because TABLE is a local constant string literal
+            (count, max_id) = con.execute(f"SELECT COUNT(*), MAX(id) FROM {TABLE}").fetchone()
+        (_row_count, _max_id) = (count, max_id or 0)
+        _dataset_version = __version(count, max_id)
+    return _dataset_version
+
+
+def __version(count: int, max_id: Optional[int]) -> str:
+    return hashlib.sha1(f"{DB}:{count}:{max_id}".encode("utf-8")).hexdigest()[:16]
+
+
+def record_append(source: str, first_id: int, rows: Sequence[Tuple]) -> None:
+    """
+    Updates the dataset version and the cached filter matches after rows were committed, without querying
+
+    :param source: source the rows were appended to
+    :param first_id: id of the first row, the others following it
+    :param rows: appended values of the metric columns, in COLUMNS order
+    """
+    global _dataset_version, _row_count, _max_id, _generation
+    _generation += 1
+    # Left to be computed from the database on first use if it never was
+    if _dataset_version is not None:
+        _row_count += len(rows)
+        _max_id = max(_max_id, first_id + len(rows) - 1)
+        _dataset_version = __version(_row_count, _max_id)
+
+    entries = list(_match_positions.items())
+    _match_positions.clear()
+    for ((bench_type, canonical, _), (predicate, positions)) in entries:
+        # Compared without case, like the LIKE prefix of the queries
+        if source.lower().startswith(bench_type.lower()):
+            positions.extend(first_id + i for (i, row) in enumerate(rows)
+                             if predicate(dict(zip(COLUMNS, row))))
+        # Entries were computed once the version was, so the ids now match the new version
+        _match_positions[(bench_type, canonical, _dataset_version)] = (predicate, positions)
+
+
+def selected_columns(wl_metrics: int) -> List[str]:
+    """
+    Returns the metric columns enabled by wl_metrics
+
+    :param wl_metrics: value to enable the columns bitwise (expects between 1 and 15)
+    :return: List of column names in table order
+    """
+
+    return [COLUMNS[n] for n in range(len(COLUMNS)-1) if (wl_metrics & (1 << n))]
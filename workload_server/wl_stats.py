@@ -0,0 +1,309 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+from array import array
+from itertools import accumulate
+from contextlib import closing
+import logging
+import math
+import sqlite3
+import aiosqlite
+from workload_server import wl_db
+
+STATS_TABLE = "workload_stats"
+METRICS = wl_db.COLUMNS[:-1]
+PERCENTILES = (("p50", 0.50), ("p90", 0.90), ("p95", 0.95), ("p99", 0.99))
+SUMMARY_FIELDS = ("min", "max", "mean", "stddev") + tuple(name for (name, _) in PERCENTILES)
+
+_sources: Optional[Dict[str, "SourceStats"]] = None
+
+
+class SparseTable:
+    """Minimum or maximum of any range of a sequence in O(1), level k holding the result for 2 ** k entries"""
+    def __init__(self, reduce, values: Sequence[float]) -> None:
+        """
+
+        :param reduce: min or max
+        :param values: initial entries
+        """
+        self.reduce = reduce
+        self.levels = [array("d", values)]
+        width = 1
+        while width * 2 <= len(values):
+            previous = self.levels[-1]
+            count = len(values) - width * 2 + 1
+            self.levels.append(array("d", map(reduce, previous[:count], previous[width:width + count])))
+            width *= 2
+
+    def append(self, value: float) -> None:
+        """Appends an entry, adding the entry of each level ending with it"""
+        self.levels[0].append(value)
+        count = len(self.levels[0])
+        level = 1
+        while (1 << level) <= count:
+            if level == len(self.levels):
+                self.levels.append(array("d"))
+            start = count - (1 << level)
+            previous = self.levels[level - 1]
+            self.levels[level].append(self.reduce(previous[start], previous[start + (1 << (level - 1))]))
+            level += 1
+
+    def query(self, start: int, end: int) -> float:
+        level = (end - start).bit_length() - 1
+        return self.reduce(self.levels[level][start], self.levels[level][end - (1 << level)])
+
+
+class ColumnIndex:
+    """
+    Range summaries of a column without scanning it: prefix sums of the values and of their squares give the mean
+    and standard deviation, sparse tables over the extremes of blocks of BLOCK values give the extremes of the
+    whole blocks of a range, the partial blocks at its ends being scanned
+    """
+    BLOCK = 64
+
+    def __init__(self, values: array) -> None:
+        """
+
+        :param values: values of the column in row order
+        """
+        self.values = values
+        # accumulate only takes an initial value from Python 3.8
+        self.prefix = array("d", [0.0, *accumulate(values)])
+        self.prefix_sq = array("d", [0.0, *accumulate(value * value for value in values)])
+        # Only complete blocks are indexed, the values after the last one are always scanned
+        blocks = range(0, len(values) - self.BLOCK + 1, self.BLOCK)
+        self.minimums = SparseTable(min, [min(values[i:i + self.BLOCK]) for i in blocks])
+        self.maximums = SparseTable(max, [max(values[i:i + self.BLOCK]) for i in blocks])
+
+    def extend(self, values: Sequence[float]) -> None:
+        """Appends values to the column, indexing the blocks they complete"""
+        for value in values:
+            self.values.append(value)
+            self.prefix.append(self.prefix[-1] + value)
+            self.prefix_sq.append(self.prefix_sq[-1] + value * value)
+            if len(self.values) % self.BLOCK == 0:
+                block = self.values[-self.BLOCK:]
+                self.minimums.append(min(block))
+                self.maximums.append(max(block))
+
+    def summary(self, start: int, end: int) -> Dict[str, float]:
+        """
+        :param start: index of the first row of the range
+        :param end: index after the last row of the range, greater than start
+        :return: minimum, maximum, mean and population standard deviation of the range
+        """
+        count = end - start
+        mean = (self.prefix[end] - self.prefix[start]) / count
+        variance = (self.prefix_sq[end] - self.prefix_sq[start]) / count - mean * mean
+        first_block = -(-start // self.BLOCK)
+        last_block = end // self.BLOCK
+        if first_block < last_block:
+            ends = self.values[start:first_block * self.BLOCK] + self.values[last_block * self.BLOCK:end]
+            minimum = min((self.minimums.query(first_block, last_block), *ends))
+            maximum = max((self.maximums.query(first_block, last_block), *ends))
+        else:
+            # Less than two blocks long
+            minimum = min(self.values[start:end])
+            maximum = max(self.values[start:end])
+        return {"min": minimum,
+                "max": maximum,
+                "mean": mean,
+                "stddev": math.sqrt(max(0.0, variance))}
+
+
+class SourceStats:
+    """Statistics of the rows of a single source"""
+    def __init__(self, source: str, rows: int, summaries: Dict[str, Dict[str, float]]) -> None:
+        """
+
+        :param source: value of the source column
+        :param rows: number of rows of the source
+        :param summaries: summary of every metric column over the whole source, percentiles being None when
+            rows were appended since they were computed
+        """
+        self.source = source
+        self.rows = rows
+        self.summaries = summaries
+        self.indexes: Optional[Dict[str, ColumnIndex]] = None
+
+    def index(self) -> Dict[str, ColumnIndex]:
+        """Returns the range indexes of the source, reading its rows if they were not built when it was loaded"""
+        if self.indexes is None:
+            with closing(sqlite3.connect(wl_db.DB)) as con:
+                # Rows committed but not yet recorded by append are left for append to add
+                columns = read_columns(con, self.source, self.rows)
+            self.indexes = {column: ColumnIndex(values) for (column, values) in columns.items()}
+        return self.indexes
+
+    def describe(self, batch_unit: int = 0, row_offset: int = 0, row_count: int = 0) -> Dict:
+        """
+        :param batch_unit: batch_unit to count the batches of, 0 to leave them out
+        :param row_offset: index of the first row to summarize
+        :param row_count: number of rows to summarize, 0 for every row from row_offset
+        :return: statistics of the source, percentiles only being given for the whole source
+        """
+        start = min(row_offset, self.rows)
+        end = self.rows if row_count == 0 else min(self.rows, start + row_count)
+        if start == 0 and end == self.rows:
+            if any(summary[name] is None for summary in self.summaries.values() for (name, _) in PERCENTILES):
+                self.summaries = {column: summarize(index.values) for (column, index) in self.index().items()}
+            columns = self.summaries
+        elif start < end:
+            columns = {column: index.summary(start, end) for (column, index) in self.index().items()}
+        else:
+            columns = {}
+        return {"source": self.source,
+                "rows": self.rows,
+                "batches": -(-self.rows // batch_unit) if batch_unit > 0 else None,
+                "row_offset": start,
+                "row_count": end - start,
+                "columns": columns}
+
+    def append(self, rows: Sequence[Tuple]) -> None:
+        """
+        Updates the summaries and the range indexes, if built, with appended rows. Minimums, maximums, means and
+        standard deviations are updated in place, percentiles are recomputed on the next request needing them
+
+        :param rows: values of the metric columns of the rows, in METRICS order
+        """
+        count = self.rows + len(rows)
+        for (i, column) in enumerate(METRICS):
+            values = [row[i] for row in rows]
+            summary = self.summaries[column]
+            total = summary["mean"] * self.rows + math.fsum(values)
+            total_sq = (summary["stddev"] ** 2 + summary["mean"] ** 2) * self.rows + math.fsum(v * v for v in values)
+            mean = total / count
+            self.summaries[column] = {"min": min(summary["min"], *values),
+                                      "max": max(summary["max"], *values),
+                                      "mean": mean,
+                                      "stddev": math.sqrt(max(0.0, total_sq / count - mean * mean)),
+                                      **{name: None for (name, _) in PERCENTILES}}
+            if self.indexes is not None:
+                self.indexes[column].extend(values)
+        self.rows = count
+
+
+def read_columns(con: sqlite3.Connection, source: str, limit: int = -1) -> Dict[str, array]:
+    # Query can use f-string evaluation safely for TABLE and COLUMNS because they are local constant
+    # string literals but NOT for VALUES, so we use placeholders to make sure input is sanitized
+    columns = {column: array("d") for column in METRICS}
+    for row in con.execute(f"SELECT {', '.join(METRICS)} FROM {wl_db.TABLE} "
+                           f"WHERE {wl_db.COLUMNS[-1]} = ? ORDER BY id LIMIT ?", (source, limit)):
+        for column, value in zip(METRICS, row):
+            columns[column].append(value)
+    return columns
+
+
+def summarize(values: array) -> Dict[str, float]:
+    """Returns the summary of a whole column, percentiles being taken by nearest rank"""
+    ordered = sorted(values)
+    count = len(ordered)
+    mean = math.fsum(ordered) / count
+    result = {"min": ordered[0],
+              "max": ordered[-1],
+              "mean": mean,
+              "stddev": math.sqrt(max(0.0, math.fsum(v * v for v in ordered) / count - mean * mean))}
+    for (name, rank) in PERCENTILES:
+        result[name] = ordered[max(0, math.ceil(rank * count) - 1)]
+    return result
+
+
+def load() -> Dict[str, SourceStats]:
+    """
+    Loads the statistics stored with the dataset, computing and storing them first if they are missing or
+    were computed for another version of the dataset
+
+    :return: statistics by source
+    """
+    global _sources
+    version = wl_db.get_dataset_version()
+    with closing(sqlite3.connect(wl_db.DB)) as con, con:
+        # Query can be built safely from f-string evaluation because STATS_TABLE and SUMMARY_FIELDS are local
+        # constant string literals
+        con.execute(f"CREATE TABLE IF NOT EXISTS {STATS_TABLE} (source TEXT, metric TEXT, version TEXT, "
+                    f"rows INTEGER, {', '.join(f'{field} REAL' for field in SUMMARY_FIELDS)}, "
+                    f"PRIMARY KEY (source, metric))")
+        stored = con.execute(f"SELECT source, metric, rows, {', '.join(SUMMARY_FIELDS)} FROM {STATS_TABLE} "
+                             f"WHERE version = ?", (version,)).fetchall()
+        sources = {}
+        for (source, metric, rows, *fields) in stored:
+            stats = sources.setdefault(source, SourceStats(source, rows, {}))
+            stats.summaries[metric] = dict(zip(SUMMARY_FIELDS, fields))
+        # Range queries and percentiles are then answered from memory, without reading rows on the event loop
+        for stats in sources.values():
+            stats.indexes = {column: ColumnIndex(values)
+                             for (column, values) in read_columns(con, stats.source, stats.rows).items()}
+
+        if not sources:
+            logging.info("Computing the statistics of the dataset")
+            con.execute(f"DELETE FROM {STATS_TABLE}")
+            for (source,) in con.execute(f"SELECT DISTINCT {wl_db.COLUMNS[-1]} FROM {wl_db.TABLE}").fetchall():
+                columns = read_columns(con, source)
+                rows = len(columns[METRICS[0]])
+                if rows == 0:
+                    continue
+                stats = sources[source] = SourceStats(source, rows, {column: summarize(values)
+                                                                     for (column, values) in columns.items()})
+                # The rows were just read, so the range indexes are built while they are at hand
+                stats.indexes = {column: ColumnIndex(values) for (column, values) in columns.items()}
+                con.executemany(f"INSERT OR REPLACE INTO {STATS_TABLE} VALUES "
+                                f"(?, ?, ?, ?, {', '.join('?' for _ in SUMMARY_FIELDS)})",
+                                [(source, column, version, rows, *(summary[field] for field in SUMMARY_FIELDS))
+                                 for (column, summary) in stats.summaries.items()])
+    _sources = sources
+    return sources
+
+
+def record_append(source: str, rows: Sequence[Tuple]) -> None:
+    """
+    Updates the statistics of a source after rows were committed to it, if the statistics were loaded
+
+    :param source: source the rows were appended to
+    :param rows: appended values of the metric columns, in METRICS order
+    """
+    if _sources is None or not rows:
+        return
+    stats = _sources.get(source)
+    if stats is None:
+        columns = {column: array("d", (row[i] for row in rows)) for (i, column) in enumerate(METRICS)}
+        stats = _sources[source] = SourceStats(source, len(rows), {column: summarize(values)
+                                                                  for (column, values) in columns.items()})
+        stats.indexes = {column: ColumnIndex(values) for (column, values) in columns.items()}
+    else:
+        stats.append(rows)
+
+
+async def persist(con: aiosqlite.Connection, sources: Sequence[str]) -> None:
+    """
+    Stores the statistics of the given sources under the current dataset version and moves the others to it,
+    since appending to a source leaves the statistics of the others unchanged
+
+    :param con: connection of the writer, committed by the caller
+    :param sources: sources whose statistics changed
+    """
+    if _sources is None:
+        return
+    version = wl_db.get_dataset_version()
+    # Query can be built safely from f-string evaluation because STATS_TABLE and SUMMARY_FIELDS are local
+    # constant string literals
+    await con.execute(f"UPDATE {STATS_TABLE} SET version = ?", (version,))
+    await con.executemany(f"INSERT OR REPLACE INTO {STATS_TABLE} VALUES "
+                          f"(?, ?, ?, ?, {', '.join('?' for _ in SUMMARY_FIELDS)})",
+                          [(source, column, version, _sources[source].rows,
+                            *(summary[field] for field in SUMMARY_FIELDS))
+                           for source in sources if source in _sources
+                           for (column, summary) in _sources[source].summaries.items()])
+
+
+def get_stats(bench_type: str, batch_unit: int = 0, row_offset: int = 0, row_count: int = 0) -> List[Dict]:
+    """
+    Returns the statistics of every source whose name starts with bench_type, as RFWs select them
+
+    :param bench_type: prefix of the sources
+    :param batch_unit: batch_unit to count the batches of, 0 to leave them out
+    :param row_offset: index of the first row of each source to summarize
+    :param row_count: number of rows to summarize, 0 for every row from row_offset
+    :return: statistics of each matching source
+    """
+    sources = _sources if _sources is not None else load()
+    return [stats.describe(batch_unit, row_offset, row_count)
+            # Compared without case, like the LIKE prefix selecting the rows of an RFW
+            for (source, stats) in sorted(sources.items()) if source.lower().startswith(bench_type.lower())]